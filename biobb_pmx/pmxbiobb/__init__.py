@@ -1,18 +1,24 @@
 from . import (
     pmxanalyse,
+    pmxanalyse_batch,
+    pmxcycle_closure,
     pmxatom_mapping,
     pmxcreate_top,
     pmxgentop,
     pmxligand_hybrid,
     pmxmerge_ff,
     pmxmutate,
+    pmxmutate_scan,
 )
 
 name = "pmxbiobb"
 __all__ = [
     "pmxanalyse",
+    "pmxanalyse_batch",
+    "pmxcycle_closure",
     "pmxgentop",
     "pmxmutate",
+    "pmxmutate_scan",
     "pmxatom_mapping",
     "pmxligand_hybrid",
     "pmxmerge_ff",
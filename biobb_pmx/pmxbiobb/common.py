@@ -1,7 +1,12 @@
 """Common functions for package biobb_pmx.pmx"""
 
+import hashlib
+import json
+import os
 import re
-from typing import Iterable, Mapping, Optional, Union
+import shutil
+from pathlib import Path
+from typing import Any, Iterable, Mapping, Optional, Union
 
 MUTATION_DICT = {
     "ALA": "A",
@@ -56,21 +61,32 @@ MUTATION_DICT = {
     "U": "U",
 }
 
+MUTATION_PATTERN = re.compile(r"(?P<chain>[a-zA-Z])*:?(?P<resnum>\d+)(?P<mt>[a-zA-Z0-9]+)")
+
+
+def mutation_entries(mutation_list: Union[str, Iterable[str]]) -> list[str]:
+    """Split a comma separated mutation list string into its entries; lists are returned as they are."""
+    try:
+        # Check if mutation_list is a string
+        return mutation_list.replace(" ", "").split(",")  # type: ignore
+    except AttributeError:
+        return list(mutation_list)
+
+
+def has_chains(mutation_list: Union[str, Iterable[str]]) -> bool:
+    """Whether the entries of a mutation list have a chain, which pmx mutate reads with the residue numbers of the structure file (--keep_resid)."""
+    matches = [MUTATION_PATTERN.match(mut.strip()) for mut in mutation_entries(mutation_list)]
+    return any(match and match.group("chain") for match in matches)
+
 
 def create_mutations_file(
     input_mutations_path: str,
     mutation_list: Union[str, Iterable[str]],
     mutation_dict: Mapping,
 ) -> str:
-    try:
-        # Check if self.mutation_list is a string
-        mutation_list = mutation_list.replace(" ", "").split(",")  # type: ignore
-    except AttributeError:
-        pass
-    pattern = re.compile(r"(?P<chain>[a-zA-Z])*:?(?P<resnum>\d+)(?P<mt>[a-zA-Z0-9]+)")
     with open(input_mutations_path, "w") as mut_file:
-        for mut in mutation_list:
-            match = pattern.match(mut.strip())
+        for mut in mutation_entries(mutation_list):
+            match = MUTATION_PATTERN.match(mut.strip())
             if match:
                 mut_groups_dict = match.groupdict()
                 if mut_groups_dict.get("chain"):
@@ -86,6 +102,187 @@ def create_mutations_file(
     return input_mutations_path
 
 
+def residue_code(resname: str) -> str:
+    """Return the MUTATION_DICT code of a residue name (DA, RU... for nucleotides), or the name itself if it is unknown."""
+    resname = resname.upper()
+    if resname in MUTATION_DICT:
+        return MUTATION_DICT[resname]
+    if len(resname) > 1 and resname[0] in "DR" and resname[1] in "ACGTU":
+        return resname[1]
+    return resname
+
+
+def residue_index(structure_path: Union[str, Path]) -> list[tuple[str, str, str]]:
+    """Read the residues of a PDB or GRO structure file in a single streaming pass.
+
+    Returns:
+        list: The chain, residue number (with its insertion code) and residue name of each residue, in file order.
+    """
+    residues: list[tuple[str, str, str]] = []
+    with open(structure_path) as structure_file:
+        if Path(structure_path).suffix.lower() == ".gro":
+            next(structure_file, None)
+            n_atoms = int(next(structure_file, "0").split()[0])
+            lines = (line for _, line in zip(range(n_atoms), structure_file))
+            residue_fields = (("", line[0:5].strip(), line[5:10].strip()) for line in lines)
+        else:
+            lines = (line for line in structure_file if line.startswith(("ATOM", "HETATM")))
+            residue_fields = ((line[21].strip(), line[22:27].strip(), line[17:21].strip()) for line in lines)
+        for residue in residue_fields:
+            if not residues or residues[-1] != residue:
+                residues.append(residue)
+    return residues
+
+
+def residue_numbers(residues: list[tuple[str, str, str]]) -> dict[tuple[str, str], int]:
+    """Map the chain and residue number of the residues of :func:`residue_index` to their position, from 1; the first residue with a number is kept."""
+    numbers: dict[tuple[str, str], int] = {}
+    for position, (chain, resnum, _) in enumerate(residues, 1):
+        numbers.setdefault((chain, resnum), position)
+    return numbers
+
+
+def residue_position(residues: list[tuple[str, str, str]], numbers: Mapping[tuple[str, str], int], chain: Optional[str], resnum: int) -> Optional[int]:
+    """Find a residue of :func:`residue_index` as pmx mutate does.
+
+    Without a chain, resnum is the position of the residue in the structure
+    (residues renumbered from 1); with a chain, resnum is the residue number
+    of the structure file (see :func:`residue_numbers`) and residues without
+    a chain identifier in the file match any chain.
+
+    Returns:
+        int: The position of the residue in the structure, from 1, or None if it is not found.
+    """
+    if chain:
+        return numbers.get((chain, str(resnum)), numbers.get(("", str(resnum))))
+    return resnum if 0 < resnum <= len(residues) else None
+
+
+def check_mutations(
+    mutation_list: Union[str, Iterable[str]], structure_path: Union[str, Path], mutation_dict: Mapping = MUTATION_DICT
+) -> list[tuple[Optional[str], int, str]]:
+    """Validate a mutation list against the residues of a structure before running pmx.
+
+    As in pmx mutate, residue numbers without a chain are positions in the
+    structure (residues renumbered from 1) and residue numbers with a chain
+    are the numbers of the structure file; residues without a chain
+    identifier in the file match any chain. All the invalid entries, unknown
+    target codes, missing residues, residues that are not amino acids or
+    nucleotides (water, ions, ligands), residues mutated more than once and
+    mutations to the residue type already in place are reported at once.
+
+    Returns:
+        list: The chain, residue number and upper case target code of each mutation.
+
+    Raises:
+        ValueError: If any mutation is invalid.
+    """
+    residues = residue_index(structure_path)
+    numbers = residue_numbers(residues)
+    mutable_codes = set(mutation_dict.values())
+    mutations, errors = [], []
+    # First mutation of each residue position
+    mutated: dict[int, str] = {}
+    for mut in mutation_entries(mutation_list):
+        if not mut.strip():
+            continue
+        match = MUTATION_PATTERN.fullmatch(mut.strip())
+        if not match:
+            errors.append(f"{mut}: not in the Chain:Resnum MUT_Code format")
+            continue
+        chain, resnum, target = match.group("chain"), int(match.group("resnum")), match.group("mt").upper()
+        if target not in mutation_dict:
+            errors.append(f"{mut}: {target} is not a valid AA code or NA code")
+            continue
+        position = residue_position(residues, numbers, chain, resnum)
+        resname = residues[position - 1][2] if position else None
+        residue = f"residue {chain + ':' if chain else ''}{resnum}"
+        if resname is None:
+            errors.append(f"{mut}: {residue} not found in {Path(structure_path).name}")
+        elif residue_code(resname) not in mutable_codes:
+            errors.append(f"{mut}: {residue} is {resname}, not an amino acid or a nucleotide")
+        elif position in mutated:
+            errors.append(f"{mut}: {residue} is already mutated by {mutated[position]}")
+        elif residue_code(resname) == mutation_dict[target]:
+            errors.append(f"{mut}: {residue} is already {resname}")
+        else:
+            mutated[position] = mut
+            mutations.append((chain, resnum, target))
+    if len({bool(chain) for chain, _, _ in mutations}) > 1:
+        errors.append("mutations with and without chain can not be mixed")
+    if errors:
+        raise ValueError("Invalid mutation list: " + "; ".join(errors))
+    return mutations
+
+
+def file_digest(file_path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of the content of a file."""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_key(*parts: Any) -> str:
+    """Return a stable SHA-256 key of JSON serializable parts (file digests, parameters...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_lookup(cache_dir: Union[str, Path], key: str, suffix: str = "") -> Optional[Path]:
+    """Return the path of a cache entry if it exists, marking it as the most recently used."""
+    entry = Path(cache_dir).joinpath(key + suffix)
+    if not entry.exists():
+        return None
+    # The modification time is the LRU clock of the cache
+    os.utime(entry)
+    return entry
+
+
+def cache_store(cache_dir: Union[str, Path], key: str, suffix: str, content: bytes, max_size_mb: Optional[float] = None) -> Path:
+    """Atomically write a cache entry and evict the least recently used entries above max_size_mb."""
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    entry = Path(cache_dir).joinpath(key + suffix)
+    tmp_entry = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+    tmp_entry.write_bytes(content)
+    os.replace(tmp_entry, entry)
+    if max_size_mb is not None:
+        prune_cache(cache_dir, max_size_mb, keep=entry)
+    return entry
+
+
+def cache_materialize(entry: Union[str, Path], output_path: Union[str, Path]) -> Path:
+    """Place a cache entry at output_path as a hard link, or as a copy across file systems."""
+    output_path = Path(output_path)
+    output_path.unlink(missing_ok=True)
+    try:
+        os.link(entry, output_path)
+    except OSError:
+        shutil.copyfile(entry, output_path)
+    return output_path
+
+
+def prune_cache(cache_dir: Union[str, Path], max_size_mb: float, keep: Optional[Path] = None) -> list[Path]:
+    """Remove the least recently used entries of a cache directory until it fits in max_size_mb.
+
+    Returns:
+        list: The removed entries.
+    """
+    entries = [entry for entry in Path(cache_dir).iterdir() if entry.is_file() and not entry.name.startswith(".")]
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    removed = []
+    for entry in entries:
+        if total <= max_size_mb * 1024 * 1024:
+            break
+        if keep is not None and entry == keep:
+            continue
+        total -= entry.stat().st_size
+        entry.unlink(missing_ok=True)
+        removed.append(entry)
+    return removed
+
+
 # TODO: Move this function to biobb_common.tools.file_utils
 def _from_string_to_list(input_data: Optional[Union[str, list[str]]]) -> list[str]:
     """
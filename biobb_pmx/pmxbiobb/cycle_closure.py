@@ -0,0 +1,182 @@
+"""Cycle closure of the free energy differences of a perturbation graph.
+
+The relative free energies of the nodes (ligands or mutants) are the
+weighted least squares solution of the edge differences
+dg(edge) = G(node_b) - G(node_a) over the whole graph, solved in one sparse
+factorization. The free energy of a reference node of each connected
+component is fixed to zero. The cycle closure error of an edge is the
+difference between its fitted and measured values, which is zero for the
+edges that are not part of any cycle.
+"""
+
+import csv
+from collections.abc import Sequence
+from typing import Any, Optional
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
+
+NODE_COLUMNS = ["node", "component", "dg", "err", "cc_err", "n_edges"]
+EDGE_COLUMNS = ["edge", "node_a", "node_b", "measured", "measured_err", "fitted", "fitted_err", "residual"]
+
+# Columns of the inverse normal matrix computed per sparse solve
+INVERSE_CHUNK = 256
+
+
+def edge_values(records: Sequence[dict[str, Any]], legs: Optional[Sequence[str]] = None) -> list[dict[str, Any]]:
+    """Collect the edge differences of result store records.
+
+    Args:
+        records (list): Result store records of a single estimator.
+        legs (list): The two legs of the thermodynamic cycle (e.g. complex and water). The value of an edge is then the difference between its first and second legs, and its error the quadrature sum of theirs. Without legs, every record is an edge value.
+
+    Returns:
+        list: The edge, node_a, node_b, dg and err of each edge with both nodes, in the order of the records.
+    """
+    records = [record for record in records if record.get("node_a") and record.get("node_b")]
+    if not legs:
+        return [{key: record[key] for key in ("edge", "node_a", "node_b", "dg", "err")} for record in records]
+    first, second = legs
+    by_leg = {(record["edge"], record["leg"]): record for record in records}
+    values = []
+    for record in records:
+        other = by_leg.get((record["edge"], second))
+        if record["leg"] != first or other is None:
+            continue
+        err = None if record["err"] is None or other["err"] is None else float(np.hypot(record["err"], other["err"]))
+        values.append({"edge": record["edge"], "node_a": record["node_a"], "node_b": record["node_b"], "dg": record["dg"] - other["dg"], "err": err})
+    return values
+
+
+def solve_cycle_closure(
+    nodes_a: Sequence[str],
+    nodes_b: Sequence[str],
+    values: Sequence[float],
+    errors: Optional[Sequence[Optional[float]]] = None,
+    reference: Optional[str] = None,
+) -> dict[str, Any]:
+    """Fit the node free energies of a perturbation graph to its edge differences.
+
+    The edges are weighted by their inverse variance when all of them have a
+    positive error; otherwise they have unit weights and the node errors are
+    scaled by the variance of the residuals.
+
+    Args:
+        nodes_a (list): Start node of each edge.
+        nodes_b (list): End node of each edge.
+        values (list): Measured free energy difference G(node_b) - G(node_a) of each edge.
+        errors (list): Standard error of each edge value.
+        reference (str): Node whose free energy is fixed to zero in its component. The first node of each component is used for the others.
+
+    Returns:
+        dict: The nodes in order of appearance with their component, free energy, standard error, cycle closure error (root mean square residual of their edges) and number of edges, and the fitted value, standard error and residual of each edge.
+    """
+    nodes = list(dict.fromkeys([node for edge in zip(nodes_a, nodes_b) for node in edge]))
+    index = {node: position for position, node in enumerate(nodes)}
+    a = np.array([index[node] for node in nodes_a], dtype=np.int64)
+    b = np.array([index[node] for node in nodes_b], dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    n_edges, n_nodes = len(values), len(nodes)
+    if not n_edges:
+        raise ValueError("The perturbation graph has no edges")
+
+    err = np.array([np.nan if value is None else value for value in errors], dtype=np.float64) if errors is not None else np.full(n_edges, np.nan)
+    weighted = bool(np.all(np.isfinite(err) & (err > 0)))
+    weights = 1.0 / err**2 if weighted else np.ones(n_edges)
+
+    # Incidence matrix: each edge row has -1 on its start node and +1 on its end node
+    rows = np.repeat(np.arange(n_edges), 2)
+    incidence = sparse.csr_matrix((np.tile([-1.0, 1.0], n_edges), (rows, np.column_stack((a, b)).ravel())), shape=(n_edges, n_nodes))
+    n_components, component = connected_components(incidence.T @ incidence, directed=False)
+
+    # One fixed node per component removes the free constant of each component
+    fixed = np.zeros(n_nodes, dtype=bool)
+    for label in range(n_components):
+        members = np.flatnonzero(component == label)
+        fixed[index[reference] if reference in index and component[index[reference]] == label else members[0]] = True
+    free = np.flatnonzero(~fixed)
+    reduced = incidence[:, free].tocsc()
+
+    dg = np.zeros(n_nodes)
+    variance = np.zeros(n_nodes)
+    covariance_ab = np.zeros(n_edges)
+    scale = 1.0
+    if len(free):
+        normal = (reduced.T @ sparse.diags(weights) @ reduced).tocsc()
+        factor = splu(normal)
+        dg[free] = factor.solve(reduced.T @ (weights * values))
+    residual = dg[b] - dg[a] - values
+    dof = n_edges - len(free)
+    if not weighted and dof > 0:
+        scale = float(np.sum(residual**2) / dof)
+
+    if len(free):
+        # Diagonal of the inverse normal matrix and covariance of the nodes of each edge, a chunk of columns at a time
+        position = np.full(n_nodes, -1, dtype=np.int64)
+        position[free] = np.arange(len(free))
+        edge_a, edge_b = position[a], position[b]
+        for start in range(0, len(free), INVERSE_CHUNK):
+            stop = min(start + INVERSE_CHUNK, len(free))
+            unit = np.zeros((len(free), stop - start))
+            unit[np.arange(start, stop), np.arange(stop - start)] = 1.0
+            inverse = factor.solve(unit)
+            variance[free[start:stop]] = inverse[np.arange(start, stop), np.arange(stop - start)]
+            in_chunk = (edge_b >= start) & (edge_b < stop) & (edge_a >= 0)
+            covariance_ab[in_chunk] = inverse[edge_a[in_chunk], edge_b[in_chunk] - start]
+    variance *= scale
+    covariance_ab *= scale
+    fitted_err = np.sqrt(np.maximum(variance[a] + variance[b] - 2.0 * covariance_ab, 0.0))
+
+    n_node_edges = np.bincount(a, minlength=n_nodes) + np.bincount(b, minlength=n_nodes)
+    squares = np.bincount(a, weights=residual**2, minlength=n_nodes) + np.bincount(b, weights=residual**2, minlength=n_nodes)
+    return {
+        "nodes": nodes,
+        "component": component,
+        "dg": dg,
+        "err": np.sqrt(variance),
+        "cc_err": np.sqrt(squares / np.maximum(n_node_edges, 1)),
+        "n_edges": n_node_edges,
+        "fitted": dg[b] - dg[a],
+        "fitted_err": fitted_err,
+        "residual": residual,
+    }
+
+
+def write_cycle_closure(
+    nodes_path: str, solution: dict[str, Any], edges: Sequence[dict[str, Any]], fact: float = 1.0, edges_path: Optional[str] = None
+) -> str:
+    """Write the node free energies and, optionally, the fitted edges of a cycle closure solution to CSV files, multiplied by fact."""
+    with open(nodes_path, "w", newline="") as nodes_file:
+        writer = csv.DictWriter(nodes_file, fieldnames=NODE_COLUMNS)
+        writer.writeheader()
+        for position, node in enumerate(solution["nodes"]):
+            writer.writerow(
+                {
+                    "node": node,
+                    "component": int(solution["component"][position]),
+                    "dg": solution["dg"][position] * fact,
+                    "err": solution["err"][position] * fact,
+                    "cc_err": solution["cc_err"][position] * fact,
+                    "n_edges": int(solution["n_edges"][position]),
+                }
+            )
+    if edges_path:
+        with open(edges_path, "w", newline="") as edges_file:
+            writer = csv.DictWriter(edges_file, fieldnames=EDGE_COLUMNS)
+            writer.writeheader()
+            for position, edge in enumerate(edges):
+                writer.writerow(
+                    {
+                        "edge": edge["edge"],
+                        "node_a": edge["node_a"],
+                        "node_b": edge["node_b"],
+                        "measured": edge["dg"] * fact,
+                        "measured_err": None if edge["err"] is None else edge["err"] * fact,
+                        "fitted": solution["fitted"][position] * fact,
+                        "fitted_err": solution["fitted_err"][position] * fact,
+                        "residual": solution["residual"][position] * fact,
+                    }
+                )
+    return nodes_path
@@ -0,0 +1,280 @@
+"""Scan mutagenesis of a structure with the pmx library, in process.
+
+A scan list such as "A:15*, 20-25ALA" is expanded into single mutants: every
+residue of each position range is mutated to the target, or to all the other
+amino acids (nucleotides for DNA and RNA) with the * wildcard. The structure
+is parsed once per process; each mutation is applied to the shared model,
+written out and undone, so no mutant pays for a pmx launch or a structure
+parse. The hybrid residues come from the parsed mutation library of the
+force field (see :mod:`mutff_cache`) instead of a scan of its mtp files.
+Residue numbers follow the pmx mutate numbering, as in Pmxmutate: without
+a chain they are positions in the structure (residues renumbered from 1),
+with a chain they are the residue numbers of the structure file. The mutant
+structures are written with the residues renumbered from 1.
+"""
+
+import contextlib
+import copy
+import csv
+import io
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, Optional
+
+from biobb_pmx.pmxbiobb.common import MUTATION_DICT, residue_code, residue_numbers, residue_position
+from biobb_pmx.pmxbiobb.mutff_cache import cached_hybrid_residues, pmx_private
+
+SCAN_PATTERN = re.compile(r"(?P<chain>[a-zA-Z])?:?(?P<first>\d+)(?:-(?P<last>\d+))?(?P<target>\*|[a-zA-Z0-9]+)")
+# Labels name the structure files of the mutants
+LABEL_PATTERN = re.compile(r"[\w.+-]+")
+
+# Targets of the * wildcard
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+NUCLEOTIDES = {"dna": "ACGT", "rna": "ACGU"}
+
+# Columns of a mutations table: a mutation in the scan list format, or its chain, resnum and target
+TABLE_COLUMNS = ("mutation", "chain", "resnum", "target", "label")
+
+MANIFEST_COLUMNS = ["label", "chain", "resnum", "wild_type", "target", "structure", "error"]
+MANIFEST_NAME = "manifest.csv"
+
+# Model, force field and output settings of the mutants of this process
+_scan_state: dict[str, Any] = {}
+
+
+def parse_scan(scan_list: str) -> list[dict[str, Any]]:
+    """Parse a comma separated scan list in the format "Chain:First[-Last]Target", where Target is a code of MUTATION_DICT or the * wildcard.
+
+    Returns:
+        list: The chain (None if not given), first and last residue numbers and upper case target of each entry.
+    """
+    specs = []
+    for entry in scan_list.replace(" ", "").split(","):
+        if not entry:
+            continue
+        match = SCAN_PATTERN.fullmatch(entry)
+        if not match:
+            raise ValueError(f"{entry} is not a valid scan entry. The format is Chain:First[-Last]Target, e.g. A:15*, 20-25ALA")
+        target = match.group("target").upper()
+        if target != "*" and target not in MUTATION_DICT:
+            raise TypeError(f"{target} is not a valid AA code or NA code. Possible values are {MUTATION_DICT.keys()}")
+        first = int(match.group("first"))
+        last = int(match.group("last") or first)
+        if last < first:
+            raise ValueError(f"{entry} has an empty residue range")
+        specs.append({"chain": match.group("chain"), "first": first, "last": last, "target": target})
+    return specs
+
+
+def read_scan_file(mutations_path: str) -> Iterator[dict[str, Any]]:
+    """Read the entries of a mutations file lazily, one row at a time and without repeated rows.
+
+    The file is a CSV (TSV for the .tsv extension) table. With a header, its
+    columns are a mutation column in the scan list format or the chain
+    (optional), resnum and target columns, and an optional label column,
+    used as the label of single mutants. Without a header, the first field
+    of each row is the mutation and the second one its label, so a file with
+    one mutation per line is valid too. Empty lines and lines starting with
+    # are skipped.
+
+    Yields:
+        dict: The chain, first and last residue numbers, target and label of each entry, as in :func:`parse_scan`.
+    """
+    seen = set()
+    with open(mutations_path, newline="") as mutations_file:
+        lines = (line for line in mutations_file if line.strip() and not line.lstrip().startswith("#"))
+        reader = csv.reader(lines, delimiter="\t" if Path(mutations_path).suffix.lower() == ".tsv" else ",")
+        columns = None
+        for row in reader:
+            fields = [field.strip() for field in row]
+            if columns is None and reader.line_num == 1 and {field.lower() for field in fields} & {"mutation", "resnum"}:
+                columns = [field.lower() for field in fields]
+                unknown = set(columns) - set(TABLE_COLUMNS)
+                if unknown:
+                    raise ValueError(f"Unknown columns {sorted(unknown)} in {mutations_path}. Possible columns are {TABLE_COLUMNS}")
+                continue
+            values = dict(zip(columns, fields)) if columns else dict(zip(("mutation", "label"), fields))
+            entry = values.get("mutation") or f"{values.get('chain', '')}:{values.get('resnum', '')}{values.get('target', '')}"
+            try:
+                specs = parse_scan(entry)
+                if values.get("label") and not LABEL_PATTERN.fullmatch(values["label"]):
+                    raise ValueError(f"{values['label']} is not a valid label: use letters, digits and the . + - _ characters")
+            except (ValueError, TypeError) as error:
+                raise ValueError(f"Line {reader.line_num} of {mutations_path}: {error}") from error
+            for spec in specs:
+                mutation = {**spec, "label": values.get("label") or None}
+                # Rows with different labels are kept: expand_scan reports the conflict
+                key = tuple(mutation.values())
+                if key not in seen:
+                    seen.add(key)
+                    yield mutation
+
+
+def load_model(structure_path: str):
+    """Parse a structure file as pmx mutate does, renumbering the residues from 1."""
+    from pmx.model import Model  # type: ignore
+
+    return Model(structure_path, renumber_residues=True, bPDBTER=True, rename_atoms=True, scale_coords="A")
+
+
+def expand_scan(model, residues: list[tuple[str, str, str]], specs: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Expand parsed scan entries into single mutants, in order and without duplicates.
+
+    The residues of the entries are found as in Pmxmutate (see
+    :func:`residue_position`). The * wildcard skips the residues that are
+    not protein or nucleic acid residues. Targets equal to the wild type of
+    a residue are skipped. The label of an entry, if any, names its mutant
+    when it is a single one, replacing the generated label of the same
+    mutant listed before; two different labels for a mutant are an error.
+
+    Args:
+        model (pmx.model.Model): The parsed structure (see :func:`load_model`).
+        residues (list): The residues of the structure file (see :func:`residue_index`).
+        specs (Iterable): The parsed scan entries (see :func:`parse_scan`).
+
+    Returns:
+        list: The label, chain and resnum of the entry, wild_type, target and position in the model of each mutant.
+    """
+    numbers = residue_numbers(residues)
+    mutants: dict[tuple, dict[str, Any]] = {}
+    labels: set[str] = set()
+    # Mutants named by the label of an entry
+    labelled: set[tuple] = set()
+    errors = []
+    for spec in specs:
+        for resnum in range(spec["first"], spec["last"] + 1):
+            position = residue_position(residues, numbers, spec["chain"], resnum)
+            if position is None:
+                errors.append(f"residue {spec['chain'] or ''}:{resnum} not found")
+                continue
+            residue = model.residues[position - 1]
+            wild_type = residue_code(residue.resname)
+            if spec["target"] == "*":
+                alphabet = NUCLEOTIDES.get(residue.moltype, AMINO_ACIDS if residue.moltype == "protein" else "")
+            else:
+                alphabet = [MUTATION_DICT[spec["target"]]]
+            chain = spec["chain"] or residue.chain_id.strip() or None
+            single = spec.get("label") and spec["first"] == spec["last"] and spec["target"] != "*"
+            for target in (code for code in alphabet if code != wild_type):
+                label = spec["label"] if single else f"{chain + '_' if chain else ''}{wild_type}{resnum}{target}"
+                key = (position, target)
+                if key in mutants:
+                    if not single or mutants[key]["label"] == label:
+                        continue
+                    if key in labelled:
+                        errors.append(f"mutant {mutants[key]['label']} is also labelled {label}")
+                        continue
+                    labels.discard(mutants[key]["label"])
+                if label in labels:
+                    errors.append(f"label {label} is used by more than one mutant")
+                labels.add(label)
+                if single:
+                    labelled.add(key)
+                if key in mutants:
+                    mutants[key]["label"] = label
+                    continue
+                mutants[key] = {
+                    "label": label,
+                    "chain": spec["chain"],
+                    "resnum": resnum,
+                    "wild_type": residue.resname,
+                    "target": target,
+                    "position": position,
+                }
+    if errors:
+        raise ValueError("Invalid scan list: " + "; ".join(errors))
+    return list(mutants.values())
+
+
+def force_field_path(force_field: str, gmx_lib: Optional[str] = None) -> str:
+    """Resolve a force field to its directory, which pmx uses without the GMXLIB environment variable.
+
+    The force field is looked up in gmx_lib, then where pmx looks for it (GMXLIB and GMXDATA).
+    """
+    from pmx.utils import get_ff_path  # type: ignore
+
+    force_field = force_field.lower()
+    if gmx_lib:
+        for name in (force_field, force_field + ".ff"):
+            if Path(gmx_lib).joinpath(name).is_dir():
+                return str(Path(gmx_lib).joinpath(name))
+    return get_ff_path(force_field)
+
+
+def init_scan(
+    model, ff_path: str, output_dir: str, suffix: str, structure_b_path: Optional[str] = None, library: Optional[dict[str, Any]] = None
+) -> None:
+    """Set the shared model and settings of the mutants run by this process (worker pool initializer).
+
+    Args:
+        model (str): The parsed structure, or the path to the structure file.
+        ff_path (str): Path to the force field directory.
+        output_dir (str): Directory of the mutant structure files.
+        suffix (str): Extension, and format, of the mutant structure files.
+        structure_b_path (str): Path to the mutated input structure file.
+        library (dict): Parsed mutation library of the force field (see :func:`load_library`), read instead of the mtp files.
+    """
+    _scan_state.update(
+        {
+            "model": load_model(model) if isinstance(model, str) else model,
+            "force_field": ff_path,
+            "output_dir": output_dir,
+            "suffix": suffix,
+            "structure_b_path": structure_b_path,
+            "library": library,
+        }
+    )
+
+
+def mutate_one(mutant: dict[str, Any]) -> dict[str, Any]:
+    """Apply a mutant to the shared model, write its structure and restore the wild type residue.
+
+    Returns:
+        dict: The manifest row of the mutant, with the structure file name or the error.
+    """
+    from pmx.alchemy import mutate  # type: ignore
+    from pmx.utils import UnknownResidueError, mtpError  # type: ignore
+
+    # Protonation state renaming of pmx mutate, skipped on pmx versions without it
+    check_residue_name = pmx_private("pmx.scripts.mutate", "_check_residue_name")
+
+    model = _scan_state["model"]
+    row = {**mutant, "structure": None, "error": None}
+    residue = model.fetch_residue(idx=mutant["position"])
+    # Copy of the residue alone: its chain and model are shared, not copied
+    wild_type = copy.deepcopy(residue, {id(residue.chain): residue.chain, id(model): model})
+    structure = mutant["label"] + _scan_state["suffix"]
+    # pmx reports on the standard streams, the manifest holds the outcome of each mutant
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+        if _scan_state["library"]:
+            stack.enter_context(cached_hybrid_residues(_scan_state["library"]))
+        try:
+            if check_residue_name:
+                check_residue_name(residue)
+            mutate(
+                m=model,
+                mut_resid=mutant["position"],
+                mut_resname=mutant["target"],
+                ff=_scan_state["force_field"],
+                refB=_scan_state["structure_b_path"],
+                inplace=True,
+            )
+            model.write(str(Path(_scan_state["output_dir"]).joinpath(structure)))
+            row["structure"] = structure
+        except (OSError, ValueError, TypeError, KeyError, IndexError, UnknownResidueError, mtpError) as error:
+            row["error"] = f"{type(error).__name__}: {error}"
+        finally:
+            model.replace_residue(residue=model.fetch_residue(idx=mutant["position"]), new=wild_type, bKeepResNum=True)
+    return row
+
+
+def write_manifest(manifest_path: str, rows: Iterable[dict[str, Any]]) -> str:
+    """Write the CSV manifest of a scan, one row per mutant."""
+    with open(manifest_path, "w", newline="") as manifest_file:
+        writer = csv.DictWriter(manifest_file, fieldnames=MANIFEST_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return manifest_path
@@ -0,0 +1,179 @@
+"""Persistent cache of the parsed hybrid residue library of a pmx mutation force field.
+
+pmx reads and scans the whole mutres.mtp file of the force field (several
+MB) for every hybrid residue it builds. The library is parsed here in a
+single pass into the hybrid residue templates (atoms, morphes and
+coordinates), impropers, dihedrals and rotation (rotamer) data of every
+entry, kept as plain Python data so the versioned pickle of the cache loads
+quickly. Cache entries are keyed on the force field directory and the size
+and modification time of its files: any change of the library is a new key.
+The pmx residue of an entry is only built when it is requested.
+
+The library is served to pmx through its private
+pmx.alchemy._get_hybrid_residue function, and the in-process scan also uses
+pmx.scripts.mutate._check_residue_name; both are tested with the pmx
+versions of PMX_TESTED_VERSIONS. On pmx versions without them, the scan
+falls back to the plain pmx path (see :func:`pmx_private`).
+"""
+
+import contextlib
+import copy
+import importlib
+import io
+import pickle
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from biobb_pmx.pmxbiobb.common import cache_key, cache_lookup, cache_store
+
+# Version of the cache entry layout, part of the cache key
+MUTFF_CACHE_VERSION = 1
+MTP_FILES = ("mutres.mtp", "mutres_dna.mtp", "mutres_rna.mtp")
+# Section headers inside a hybrid residue entry of a mtp file
+MTP_SECTIONS = ("[ morphes ]", "[ atoms ]", "[ impropers ]", "[ dihedrals ]", "[ rotations ]", "[ coords ]")
+# pmx versions whose private functions are used here
+PMX_TESTED_VERSIONS = ("5.2.2",)
+
+
+def pmx_version() -> Optional[str]:
+    """Version of the installed pmx."""
+    import pmx  # type: ignore
+
+    return getattr(pmx, "__version__", None)
+
+
+def pmx_private(module_name: str, attribute: str) -> Optional[Callable]:
+    """Return a private function of a pmx module, or None if this pmx version does not have it."""
+    try:
+        return getattr(importlib.import_module(module_name), attribute)
+    except (ImportError, AttributeError):
+        return None
+
+
+def library_supported() -> bool:
+    """Whether the installed pmx reads its hybrid residues through the function the parsed library replaces."""
+    return pmx_private("pmx.alchemy", "_get_hybrid_residue") is not None
+
+
+def library_key(ff_path: Union[str, Path]) -> str:
+    """Cache key of the mutation library of a force field directory: its path and the size and modification time of its files."""
+    ff_path = Path(ff_path).resolve()
+    stamps = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in ff_path.iterdir() if entry.is_file())
+    return cache_key("mutff", MUTFF_CACHE_VERSION, pmx_version(), str(ff_path), stamps)
+
+
+def entry_data(entry: tuple) -> dict[str, Any]:
+    """Plain data of a hybrid residue entry as parsed by pmx."""
+    residue, _, impropers, dihedrals, rotations = entry
+    return {
+        "atoms": [(atom.name, atom.atomtype, atom.q, atom.cgnr, atom.m, atom.atomtypeB, atom.qB, atom.mB, list(atom.x)) for atom in residue.atoms],
+        "morphes": residue.morphes,
+        "impropers": impropers,
+        "dihedrals": dihedrals,
+        "rotations": rotations,
+    }
+
+
+def build_entry(name: str, data: dict[str, Any]) -> tuple:
+    """Build the pmx (residue, bonds, impropers, dihedrals, rotations) tuple of a hybrid residue from its plain data."""
+    from pmx.atom import Atom  # type: ignore
+    from pmx.molecule import Molecule  # type: ignore
+
+    atoms = [
+        Atom(name=atom_name, id=position + 1, atomtype=atomtype, q=q, m=m, cgnr=cgnr, atomtypeB=atomtypeB, qB=qB, mB=mB)
+        for position, (atom_name, atomtype, q, cgnr, m, atomtypeB, qB, mB, _) in enumerate(data["atoms"])
+    ]
+    residue = Molecule(atoms=atoms, unity="nm")
+    residue.set_resname(name)
+    for atom, atom_data in zip(residue.atoms, data["atoms"]):
+        atom.x = list(atom_data[8])
+        atom.unity = "A"
+    residue.morphes = copy.deepcopy(data["morphes"])
+    return residue, [], copy.deepcopy(data["impropers"]), copy.deepcopy(data["dihedrals"]), copy.deepcopy(data["rotations"])
+
+
+def parse_mtp(mtp_path: Union[str, Path]) -> dict[str, dict[str, Any]]:
+    """Parse every hybrid residue of a mtp file in a single pass.
+
+    Returns:
+        dict: The plain data of each entry.
+    """
+    from pmx.mutdb import read_new_mtp_entry  # type: ignore
+    from pmx.parser import kickOutComments  # type: ignore
+
+    with open(mtp_path) as mtp_file:
+        lines = kickOutComments(mtp_file.readlines(), ";")
+    blocks: dict[str, list[str]] = {}
+    block: list[str] = []
+    for line in lines:
+        if line.startswith("[") and line not in MTP_SECTIONS:
+            block = blocks.setdefault(line[1:].split("]")[0].strip(), [])
+        block.append(line)
+    # Each entry is parsed by pmx itself, from its own lines only
+    return {name: entry_data(read_new_mtp_entry(name, filename=io.StringIO("\n".join(block_lines)))) for name, block_lines in blocks.items()}
+
+
+def parse_library(ff_path: Union[str, Path]) -> dict[str, dict[str, dict[str, Any]]]:
+    """Parse the mtp files of a force field directory, by file name."""
+    return {name: parse_mtp(Path(ff_path).joinpath(name)) for name in MTP_FILES if Path(ff_path).joinpath(name).is_file()}
+
+
+def load_library(ff_path: Union[str, Path], cache_dir: Optional[Union[str, Path]] = None, max_size_mb: Optional[float] = None) -> dict[str, Any]:
+    """Load the parsed mutation library of a force field directory from the cache, parsing and storing it on a miss.
+
+    Args:
+        ff_path (str): Path to the force field directory (e.g. .../pmx/data/mutff/amber99sb-star-ildn-mut.ff).
+        cache_dir (str): Cache directory. Without it, the library is parsed and not stored.
+        max_size_mb (float): Size cap of the cache directory, above which the least recently used entries are evicted.
+
+    Returns:
+        dict: The force field path, the cache key, whether it was a cache hit and the parsed entries of each mtp file.
+    """
+    key = library_key(ff_path)
+    entry = cache_lookup(cache_dir, key, ".pkl") if cache_dir else None
+    if entry is not None:
+        with contextlib.suppress(pickle.UnpicklingError, EOFError, AttributeError):
+            library = pickle.loads(entry.read_bytes())
+            if library.get("version") == MUTFF_CACHE_VERSION:
+                return {**library, "hit": True}
+    library = {"version": MUTFF_CACHE_VERSION, "ff_path": str(Path(ff_path).resolve()), "key": key, "entries": parse_library(ff_path)}
+    if cache_dir:
+        cache_store(cache_dir, key, ".pkl", pickle.dumps(library, protocol=pickle.HIGHEST_PROTOCOL), max_size_mb)
+    return {**library, "hit": False}
+
+
+def hybrid_residue(library: dict[str, Any], residue_name: str, mtp_file: str) -> tuple:
+    """Build a hybrid residue of the library, raising the pmx mtpError if it is missing."""
+    from pmx.utils import mtpError  # type: ignore
+
+    data = library["entries"].get(Path(mtp_file).name, {}).get(residue_name)
+    if data is None or not data["atoms"]:
+        raise mtpError(f"Hybrid residue {residue_name} not found in {mtp_file}")
+    return build_entry(residue_name, data)
+
+
+@contextlib.contextmanager
+def cached_hybrid_residues(library: dict[str, Any]) -> Iterator[None]:
+    """Serve the hybrid residues pmx reads from the mtp files of the library force field from the parsed library.
+
+    On pmx versions without the private reader of the hybrid residues, pmx
+    keeps reading them from the mtp files.
+    """
+    from pmx import alchemy  # type: ignore
+
+    read_hybrid_residue = getattr(alchemy, "_get_hybrid_residue", None)
+    if read_hybrid_residue is None:
+        yield
+        return
+
+    def _get_hybrid_residue(residue_name, mtp_file="ffamber99sb.mtp", version="new", verbose=False):
+        if version != "new" or Path(mtp_file).resolve().parent != Path(library["ff_path"]):
+            return read_hybrid_residue(residue_name, mtp_file, version, verbose)
+        return hybrid_residue(library, residue_name, mtp_file)
+
+    alchemy._get_hybrid_residue = _get_hybrid_residue
+    try:
+        yield
+    finally:
+        alchemy._get_hybrid_residue = read_hybrid_residue
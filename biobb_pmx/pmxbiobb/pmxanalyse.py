@@ -2,14 +2,34 @@
 
 """Module containing the PMX analyse class and the command line interface."""
 
+import csv
+import io
+import json
+import os
 import shutil
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path, PurePath
-from typing import Optional
+from typing import Any, Optional
 
+import numpy as np
 from biobb_common.generic.biobb_object import BiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 
+from biobb_pmx.pmxbiobb.common import cache_key, cache_lookup, cache_store
+from biobb_pmx.pmxbiobb.result_store import append_results, result_records
+from biobb_pmx.pmxbiobb.work_analysis import analyse_works, best_estimate, plot_result_file, plot_results, summary_row, unit_factor, write_results, write_works
+from biobb_pmx.pmxbiobb.work_bootstrap import read_checkpoint
+from biobb_pmx.pmxbiobb.work_errors import block_errors, jackknife_errors, write_errors
+from biobb_pmx.pmxbiobb.work_integration import integrate_curves, log_decimation_error, read_zip_curves, reference_mask, table_works, zip_work_table, zip_works
+from biobb_pmx.pmxbiobb.work_store import write_work_store
+from biobb_pmx.pmxbiobb.xvg_io import list_xvg_members, parse_subsets, select_members, source_digest, xvg_member_infos
+from biobb_pmx.pmxbiobb.xvg_triage import triage_zip, write_triage
+
+SUBSET_COLUMNS = ["subset", "method", "dg", "err", "n_forward", "n_reverse", "cgi_dg", "cgi_err", "bar_dg", "bar_err", "jarz_dg"]
+SWEEP_COLUMNS = ["temperature", "units", "method", "dg", "err", "n_forward", "n_reverse", "cgi_dg", "cgi_err", "bar_dg", "bar_err", "jarz_dg"]
+
 
 class Pmxanalyse(BiobbObject):
     """
@@ -18,26 +38,51 @@ class Pmxanalyse(BiobbObject):
     | Analyze the work values from the dgdl.xvg files of the A and B states to calculate the free energy difference between two states.
 
     Args:
-        input_a_xvg_zip_path (str): Path the zip file containing the dgdl.xvg files of the A state. File type: input. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/data/pmx/xvg_A.zip>`_. Accepted formats: zip (edam:format_3987).
-        input_b_xvg_zip_path (str): Path the zip file containing the dgdl.xvg files of the B state. File type: input. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/data/pmx/xvg_B.zip>`_. Accepted formats: zip (edam:format_3987).
+        input_a_xvg_zip_path (str): Path the zip file containing the dgdl.xvg files of the A state. It can also be a tar archive, a directory or a glob pattern of the dgdl.xvg files, which may be gzip, xz or bzip2 compressed (e.g. dgdl.xvg.gz); compressed files are decompressed on the fly. File type: input. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/data/pmx/xvg_A.zip>`_. Accepted formats: zip (edam:format_3987), tar (edam:format_3981), gz (edam:format_3989).
+        input_b_xvg_zip_path (str): Path the zip file containing the dgdl.xvg files of the B state. It can also be a tar archive, a directory or a glob pattern of the dgdl.xvg files, which may be gzip, xz or bzip2 compressed (e.g. dgdl.xvg.gz); compressed files are decompressed on the fly. File type: input. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/data/pmx/xvg_B.zip>`_. Accepted formats: zip (edam:format_3987), tar (edam:format_3981), gz (edam:format_3989).
         output_result_path (str): Path to the TXT results file. File type: output. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/reference/pmx/ref_result.txt>`_. Accepted formats: txt (edam:format_2330).
-        output_work_plot_path (str): Path to the PNG plot results file. File type: output. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/reference/pmx/ref_plot.png>`_. Accepted formats: png (edam:format_3603).
+        output_work_plot_path (str) (Optional): Path to the PNG plot results file. If it is not given the plot is not rendered; otherwise it is rendered in a worker process once the results file is written. File type: output. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/reference/pmx/ref_plot.png>`_. Accepted formats: png (edam:format_3603).
+        output_work_store_path (str) (Optional): Path to the binary store of the integrated work values, with the state, name, work value, number of frames and CRC-32 of the source file of each trajectory. It can be memory mapped with numpy.load(path, mmap_mode="r"). File type: output. Accepted formats: npy (edam:format_4003).
+        output_errors_path (str) (Optional): Path to the CSV table of the block averaging standard errors of each estimator for each of the block_counts, followed by their jackknife standard errors, in the output units. File type: output. Accepted formats: csv (edam:format_3752).
+        output_subsets_path (str) (Optional): Path to the CSV table with the free energy estimates of each trajectory subset of the subsets property, one row per subset, in the output units. File type: output. Accepted formats: csv (edam:format_3752).
+        output_sweep_path (str) (Optional): Path to the CSV table with the free energy estimates for each of the sweep_temperatures in each of the sweep_units, one row per temperature and units. File type: output. Accepted formats: csv (edam:format_3752).
+        output_triage_path (str) (Optional): Path to the CSV triage report of the dgdl.xvg files, with the status (ok, warning or bad), the issues, the lambda value of the header and the first time, last time and time step of each file. File type: output. Accepted formats: csv (edam:format_3752).
         properties (dic):
             * **method** (*str*) - ("CGI BAR JARZ") Choose one or more estimators to use. Values: CGI (Crooks Gaussian Intersection), BAR (Bennet Acceptance Ratio), JARZ (Jarzynski's estimator).
             * **temperature** (*float*) - (298.15) [0~1000|0.05] Temperature in Kelvin.
+            * **sweep_temperatures** (*str*) - (None) Temperatures in Kelvin of the estimates written to output_sweep_path (e.g. "280 298.15 310"), all computed from the same integrated work values. Defaults to the temperature property.
+            * **sweep_units** (*str*) - (None) Units of the estimates written to output_sweep_path (e.g. "kJ kcal kT"). Defaults to the units property.
             * **nboots** (*int*) - (0) [0~1000|1] Number of bootstrap samples to use for the bootstrap estimate of the standard errors.
             * **nblocks** (*int*) - (1) [0~1000|1] Number of blocks to divide the data into for an estimate of the standard error.
+            * **block_counts** (*str*) - ("2 4 5 10 20") Numbers of blocks of the block averaging standard errors written to output_errors_path, all computed at once from the same work values (e.g. "2 5 10 20 50").
+            * **nworkers** (*int*) - (1) [1~1000|1] Number of worker processes to compute the bootstrap samples of the in-process analyses: the stream_xvg results, the subsets and the sweep.
+            * **bootstrap_checkpoint_path** (*str*) - (None) Path to a JSON checkpoint file of the bootstrap. The completed samples are saved as they are computed, and a run relaunched with the same inputs only computes the missing samples, with the same results as an uninterrupted run. Without a seed, the relaunched run reuses the random streams of the checkpointed run. Requires stream_xvg.
+            * **seed** (*int*) - (None) [0~100000|1] Seed of the random trajectory subset and of the bootstrap samples computed in-process. Results are reproducible for a given seed, whatever the number of workers.
             * **integ_only** (*bool*) - (False) Whether to do integration only.
             * **reverseB** (*bool*) - (False) Whether to reverse the work values for the backward (B->A) transformation.
             * **skip** (*int*) - (1) [0~1000|1] Skip files.
             * **slice** (*str*) - (None) Subset of trajectories to analyze. Provide list slice, e.g. "10 50" will result in selecting dhdl_files[10:50].
             * **rand** (*int*) - (None) [0~1000|1] Take a random subset of trajectories. Default is None (do not take random subset).
             * **index** (*str*) - (None) Zero-based index of files to analyze (e.g. "0 10 20 50 60"). It keeps the dhdl.xvg files according to their position in the list, sorted according to the filenames.
+            * **subsets** (*str*) - (None) Trajectory subsets analysed from the same work values, written to output_subsets_path. Subsets are separated by semicolons and each one holds comma separated skip, slice, rand and index selections (e.g. "slice: 0 20; rand: 30; skip: 2, slice: 0 40"). The dgdl.xvg files are read and integrated only once.
             * **prec** (*int*) - (2) [0~100|1] The decimal precision of the screen/file output.
             * **units** (*str*) - ("kJ") The units of the output. Values: kJ (Kilojoules), kcal (Kilocalories), kT (the product of the Boltzmann constant k and the temperature).
             * **no_ks** (*bool*) - (False) Whether to do a Kolmogorov-Smirnov test to check whether the Gaussian assumption for CGI holds.
             * **nbins** (*int*) - (20) [0~1000|1] Number of histograms bins for the plot.
             * **dpi** (*int*) - (300) [72~2048|1] Resolution of the plot.
+            * **stream_xvg** (*bool*) - (False) Read the dgdl.xvg files directly from the zip files and integrate them in-process, without extracting them to disk. The free energy analysis is also run in-process and the PMX analyse results format is kept.
+            * **decimate** (*int*) - (1) [1~10000|1] Keep one frame every decimate frames of the dgdl.xvg files. The other lines are dropped while the text is read, before being parsed, and the integration error added is estimated and logged. Requires stream_xvg.
+            * **dgdl_dtype** (*str*) - ("float64") Precision of the parsed dgdl values. Values: float64 (double precision), float32 (single precision, halving the memory used by the curves). Requires stream_xvg.
+            * **cache_dir** (*str*) - (None) Directory of the cache of integrated work values, keyed on the zip file contents and the trajectory selection. Re-analyses of the same zip files start from the cached work values. Requires stream_xvg.
+            * **cache_max_size** (*int*) - (1024) [0~1000000|1] Maximum size of the cache directory in MB. The least recently used entries are evicted above this size.
+            * **state_path** (*str*) - (None) Path to a JSON state file with the work values of the trajectories analysed so far. When it is set, the analysis is incremental: only the new or modified dgdl.xvg files of the zip files are read and the estimates are updated with all the work values of the state. Requires stream_xvg.
+            * **target_error** (*float*) - (None) [0~1000|0.01] Sequential convergence mode: read the trajectories in random order and in growing chunks, and stop as soon as the standard error of the BAR (or CGI) estimate is below this value, in the output units. The number of trajectories used is reported. Requires stream_xvg.
+            * **chunk_size** (*int*) - (10) [2~10000|1] Number of trajectories of each state read in the first chunk of the sequential convergence mode. The number of trajectories read doubles at every chunk.
+            * **triage** (*str*) - (None) Check the header, the first rows and the end of every dgdl.xvg file in parallel threads before the analysis, finding empty, unreadable and truncated files, NaN values at the ends of the trajectories, transitions starting at the wrong lambda, short trajectories and odd time steps. Trajectories with NaN values or malformed rows elsewhere are skipped when they are parsed. Values: flag (only report the bad files), exclude (leave the bad files out of the analysis). The triage also runs in flag mode when output_triage_path is given.
+            * **result_store_path** (*str*) - (None) Path to a campaign-wide SQLite result store. The estimates of the run are appended to it, one row per estimator, with the edge, its nodes and leg, the free energy and standard error in kJ/mol, the numbers of trajectories and a hash of the inputs. Requires stream_xvg.
+            * **edge** (*str*) - (None) Identifier of the edge in the result store. Defaults to the name of output_result_path without its extension.
+            * **edge_nodes** (*str*) - (None) Start and end nodes (ligands or mutants) of the edge in the result store, separated by a space (e.g. "lig1 lig2"), used by the cycle closure of the perturbation graph.
+            * **leg** (*str*) - (None) Leg of the thermodynamic cycle of the run in the result store (e.g. complex or water).
             * **binary_path** (*str*) - ("pmx") Path to the PMX command line interface.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
@@ -80,7 +125,12 @@ class Pmxanalyse(BiobbObject):
         input_a_xvg_zip_path: str,
         input_b_xvg_zip_path: str,
         output_result_path: str,
-        output_work_plot_path: str,
+        output_work_plot_path: Optional[str] = None,
+        output_work_store_path: Optional[str] = None,
+        output_errors_path: Optional[str] = None,
+        output_subsets_path: Optional[str] = None,
+        output_sweep_path: Optional[str] = None,
+        output_triage_path: Optional[str] = None,
         properties: Optional[dict] = None,
         **kwargs,
     ) -> None:
@@ -96,6 +146,11 @@ class Pmxanalyse(BiobbObject):
             "out": {
                 "output_result_path": output_result_path,
                 "output_work_plot_path": output_work_plot_path,
+                "output_work_store_path": output_work_store_path,
+                "output_errors_path": output_errors_path,
+                "output_subsets_path": output_subsets_path,
+                "output_sweep_path": output_sweep_path,
+                "output_triage_path": output_triage_path,
             },
         }
         # Should not be copied inside container
@@ -105,19 +160,41 @@ class Pmxanalyse(BiobbObject):
         # Properties specific for BB
         self.method = properties.get("method", "CGI BAR JARZ")
         self.temperature = properties.get("temperature", 298.15)
+        self.sweep_temperatures = properties.get("sweep_temperatures", None)
+        self.sweep_units = properties.get("sweep_units", None)
         self.nboots = properties.get("nboots", 0)
         self.nblocks = properties.get("nblocks", 1)
+        self.block_counts = properties.get("block_counts", "2 4 5 10 20")
+        self.nworkers = properties.get("nworkers", 1)
+        self.seed = properties.get("seed", None)
+        self.bootstrap_checkpoint_path = properties.get("bootstrap_checkpoint_path", None)
         self.integ_only = properties.get("integ_only", False)
         self.reverseB = properties.get("reverseB", False)
         self.skip = properties.get("skip", 1)
         self.slice = properties.get("slice", None)
         self.rand = properties.get("rand", None)
         self.index = properties.get("index", None)
+        self.subsets = properties.get("subsets", None)
         self.prec = properties.get("prec", 2)
         self.units = properties.get("units", "kJ")
         self.no_ks = properties.get("no_ks", False)
         self.nbins = properties.get("nbins", 20)
         self.dpi = properties.get("dpi", 300)
+        self.stream_xvg = properties.get("stream_xvg", False)
+        self.decimate = properties.get("decimate", 1)
+        self.dgdl_dtype = properties.get("dgdl_dtype", "float64")
+        self.cache_dir = properties.get("cache_dir", None)
+        self.cache_max_size = properties.get("cache_max_size", 1024)
+        self.state_path = properties.get("state_path", None)
+        self.target_error = properties.get("target_error", None)
+        self.chunk_size = properties.get("chunk_size", 10)
+        self.triage = properties.get("triage", None)
+        self.result_store_path = properties.get("result_store_path", None)
+        self.edge = properties.get("edge", None)
+        self.edge_nodes = properties.get("edge_nodes", None)
+        self.leg = properties.get("leg", None)
+        self._work_tables: dict[str, dict[str, np.ndarray]] = {}
+        self._triage_reports: dict[str, list[dict[str, Any]]] = {}
 
         # Properties common in all PMX BB
         self.binary_path = properties.get("binary_path", "pmx")
@@ -125,6 +202,23 @@ class Pmxanalyse(BiobbObject):
         # Check the properties
         self.check_properties(properties)
         self.check_arguments()
+        if not self.stream_xvg:
+            self._check_stream_properties()
+
+    def _check_stream_properties(self) -> None:
+        """Reject the properties of the in-process analysis when the work values are analysed by PMX."""
+        stream_only = {
+            "decimate": self.decimate != 1,
+            "dgdl_dtype": np.dtype(self.dgdl_dtype) != np.float64,
+            "bootstrap_checkpoint_path": self.bootstrap_checkpoint_path,
+            "cache_dir": self.cache_dir,
+            "state_path": self.state_path,
+            "target_error": self.target_error,
+            "result_store_path": self.result_store_path,
+        }
+        unused = [name for name, is_set in stream_only.items() if is_set]
+        if unused:
+            raise ValueError(f"The {', '.join(unused)} properties require stream_xvg")
 
     @launchlogger
     def launch(self) -> int:
@@ -135,6 +229,20 @@ class Pmxanalyse(BiobbObject):
             return 0
         self.stage_files()
 
+        if self.triage or self.io_dict["out"].get("output_triage_path"):
+            self._run_triage()
+
+        if self.stream_xvg:
+            # Read, integrate and analyse the work values in-process, without PMX
+            plot_args = self._analyse_in_process()
+            if plot_args:
+                self._copy_to_host_while_plotting(plot_results, plot_args)
+            else:
+                self.copy_to_host()
+            self.remove_tmp_files()
+            self.check_arguments(output_files_created=True, raise_exception=False)
+            return 0
+
         if self.container_path:
             working_dir = self.container_volume_path if self.container_volume_path else "/data"
         else:
@@ -149,34 +257,13 @@ class Pmxanalyse(BiobbObject):
                         % self.binary_path
                     )
 
-        list_a_dir = fu.create_unique_dir()
-        list_b_dir = fu.create_unique_dir()
-        list_a = list(
-            filter(
-                lambda f: Path(f).exists() and Path(f).stat().st_size > 10,
-                fu.unzip_list(self.input_a_xvg_zip_path, list_a_dir, self.out_log),
-            )
-        )
-        list_b = list(
-            filter(
-                lambda f: Path(f).exists() and Path(f).stat().st_size > 10,
-                fu.unzip_list(self.input_b_xvg_zip_path, list_b_dir, self.out_log),
-            )
-        )
-
-        # Copy extra files to sandbox: two directories containing the xvg files
-        list_a_dir_in_sandbox = Path(self.stage_io_dict.get("unique_dir", "")).joinpath(
-            Path(list_a_dir).name
-        )
-        list_b_dir_in_sandbox = Path(self.stage_io_dict.get("unique_dir", "")).joinpath(
-            Path(list_b_dir).name
-        )
-        shutil.copytree(list_a_dir, list_a_dir_in_sandbox)
-        shutil.copytree(list_b_dir, list_b_dir_in_sandbox)
-
-        # Keep the full relative paths returned by unzip_list (including frame*/ subfolders).
-        string_a = " ".join(list_a)
-        string_b = " ".join(list_b)
+        # The work values are integrated here and handed to PMX in two integrated work
+        # files, so the command line has the same size whatever the number of trajectories
+        seed_a, seed_b, _ = np.random.SeedSequence(self.seed).spawn(3)
+        names_a, wf, frames_a = self._stream_works(self.input_a_xvg_zip_path, 0, False, np.random.default_rng(seed_a))
+        names_b, wr, frames_b = self._stream_works(self.input_b_xvg_zip_path, 1, self.reverseB, np.random.default_rng(seed_b))
+        works_a = self._write_works_file("worksA.dat", names_a, wf)
+        works_b = self._write_works_file("worksB.dat", names_b, wr)
 
         self.cmd = [
             "cd",
@@ -184,14 +271,15 @@ class Pmxanalyse(BiobbObject):
             ";",
             self.binary_path,
             "analyse",
-            "-fA",
-            string_a,
-            "-fB",
-            string_b,
+            "-iA",
+            works_a,
+            "-iB",
+            works_b,
             "-o",
             PurePath(self.stage_io_dict["out"]["output_result_path"]).name,
+            # The plot is rendered after PMX, in a worker process
             "-w",
-            PurePath(self.stage_io_dict["out"]["output_work_plot_path"]).name,
+            "none",
         ]
 
         if self.method:
@@ -208,19 +296,6 @@ class Pmxanalyse(BiobbObject):
             self.cmd.append(str(self.nblocks))
         if self.integ_only:
             self.cmd.append("--integ_only")
-        if self.reverseB:
-            self.cmd.append("--reverseB")
-        if self.skip:
-            self.cmd.append("--skip")
-            self.cmd.append(str(self.skip))
-        if self.slice:
-            self.cmd.append("--slice")
-            self.cmd.append(self.slice)
-        if self.rand:
-            self.cmd.append("--rand")
-        if self.index:
-            self.cmd.append("--index")
-            self.cmd.append(self.index)
         if self.prec:
             self.cmd.append("--prec")
             self.cmd.append(str(self.prec))
@@ -239,21 +314,444 @@ class Pmxanalyse(BiobbObject):
         # Run Biobb block
         self.run_biobb()
 
+        # The other outputs are computed from the same work values handed to PMX
+        self._write_work_outputs((names_a, names_b), (wf, wr), (frames_a, frames_b), self.method.split() if self.method else [])
+
         # Copy files to host
-        self.copy_to_host()
+        unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+        result_path = unique_dir.joinpath(PurePath(self.io_dict["out"]["output_result_path"]).name)
+        if self.io_dict["out"].get("output_work_plot_path") and not self.integ_only and result_path.exists():
+            plot_path = str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_work_plot_path"]).name))
+            plot_args = (plot_path, str(unique_dir.joinpath(works_a)), str(unique_dir.joinpath(works_b)), str(result_path), self.nbins, self.dpi)
+            self._copy_to_host_while_plotting(plot_result_file, plot_args)
+        else:
+            self.copy_to_host()
 
-        self.tmp_files.extend([list_a_dir, list_b_dir])
         self.remove_tmp_files()
 
         self.check_arguments(output_files_created=True, raise_exception=False)
         return self.return_code
 
+    def _copy_to_host_while_plotting(self, plot_function: Callable[..., Optional[str]], plot_args: tuple) -> None:
+        """Copy the numeric outputs to the host while the plot is rendered in a worker process, then copy the plot.
+
+        matplotlib is only imported in the worker, and the plot is copied
+        once it is complete.
+        """
+        plot_file = self.stage_io_dict["out"].pop("output_work_plot_path")
+        try:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                plot_job = pool.submit(plot_function, *plot_args)
+                self.copy_to_host()
+                plot_job.result()
+        finally:
+            self.stage_io_dict["out"]["output_work_plot_path"] = plot_file
+        sandbox_plot_path = Path(self.stage_io_dict.get("unique_dir", "")).joinpath(PurePath(plot_file).name)
+        if sandbox_plot_path.exists():
+            shutil.copy2(sandbox_plot_path, self.io_dict["out"]["output_work_plot_path"])
+
+    def _write_works_file(self, works_name: str, names: list[str], works: list[float]) -> str:
+        """Write the integrated work values of a state to a PMX integrated work file in the sandbox.
+
+        The skip, slice, rand and index selections are already applied, PMX
+        analyse reads the work values as they are.
+        """
+        # PMX splits the lines on whitespace: the file name column can not hold any
+        columns = ["_".join(name.split()) for name in names]
+        renamed = [(name, column) for name, column in zip(names, columns) if column != name]
+        if renamed:
+            fu.log(
+                f"The whitespace of {len(renamed)} trajectory names is replaced with _ in {works_name}, e.g. {renamed[0][0]} as {renamed[0][1]}",
+                self.out_log,
+                self.global_log,
+            )
+        with open(Path(self.stage_io_dict.get("unique_dir", "")).joinpath(works_name), "w") as works_file:
+            works_file.writelines(f"{column} {work!r}\n" for column, work in zip(columns, works))
+        return works_name
+
+    def _analyse_in_process(self) -> Optional[tuple]:
+        """Integrate the streamed dgdl.xvg files and compute the free energy estimates without PMX.
+
+        Returns:
+            tuple: The arguments of :func:`plot_results` if a plot was requested, None otherwise.
+        """
+        unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+        result_path = str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_result_path"]).name))
+
+        # Independent random streams for the trajectory subsets and the bootstrap
+        seed_a, seed_b, boot_seed = np.random.SeedSequence(self._run_seed()).spawn(3)
+        methods = self.method.split() if self.method else []
+        sequential = self.target_error and not self.integ_only
+        if sequential:
+            (names_a, wf, frames_a), (names_b, wr, frames_b), results = self._sequential_analysis(
+                methods, np.random.default_rng(seed_a), np.random.default_rng(seed_b), boot_seed
+            )
+        else:
+            if self.state_path:
+                state = self._load_state()
+                names_a, wf, frames_a = self._incremental_works(state, "A", self.input_a_xvg_zip_path, 0, False, np.random.default_rng(seed_a))
+                names_b, wr, frames_b = self._incremental_works(state, "B", self.input_b_xvg_zip_path, 1, self.reverseB, np.random.default_rng(seed_b))
+                self._save_state(state)
+            else:
+                names_a, wf, frames_a = self._cached_works(self.input_a_xvg_zip_path, 0, False, np.random.default_rng(seed_a))
+                names_b, wr, frames_b = self._cached_works(self.input_b_xvg_zip_path, 1, self.reverseB, np.random.default_rng(seed_b))
+
+        if self.integ_only:
+            write_works(result_path, names_a, wf, names_b, wr)
+            self._write_work_outputs((names_a, names_b), (wf, wr), (frames_a, frames_b), methods)
+            return None
+
+        if not sequential:
+            fu.log(f"Analysing {len(wf)} forward and {len(wr)} reverse work values", self.out_log, self.global_log)
+            results = analyse_works(
+                wf,
+                wr,
+                self.temperature,
+                methods,
+                self.nboots,
+                self.nblocks,
+                not self.no_ks,
+                self.nworkers,
+                boot_seed,
+                self.bootstrap_checkpoint_path,
+            )
+        write_results(result_path, results, self.units, self.prec)
+        if self.result_store_path:
+            self._store_results(results)
+        self._write_work_outputs((names_a, names_b), (wf, wr), (frames_a, frames_b), methods, results)
+        if not self.io_dict["out"].get("output_work_plot_path"):
+            return None
+        plot_path = str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_work_plot_path"]).name))
+        return plot_path, wf, wr, results, self.units, self.nbins, self.dpi
+
+    def _write_work_outputs(
+        self, names: tuple[list[str], list[str]], works: tuple, frames: tuple[list[int], list[int]], methods: list[str], results: Optional[dict[str, Any]] = None
+    ) -> None:
+        """Write the requested work store, block errors, subsets and sweep outputs from the integrated work values of both states.
+
+        Without the in-process results of the run, the sweep also estimates
+        the free energy at the temperature property.
+        """
+        unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+        if self.io_dict["out"].get("output_work_store_path"):
+            write_work_store(
+                str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_work_store_path"]).name)),
+                (self.input_a_xvg_zip_path, self.input_b_xvg_zip_path),
+                names,
+                works,
+                frames,
+            )
+        if self.integ_only:
+            return
+        wf, wr = works
+        if self.io_dict["out"].get("output_errors_path"):
+            self._write_errors(str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_errors_path"]).name)), wf, wr, methods)
+        if self.io_dict["out"].get("output_subsets_path"):
+            self._analyse_subsets(str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_subsets_path"]).name)), methods)
+        if self.io_dict["out"].get("output_sweep_path"):
+            self._analyse_sweep(str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_sweep_path"]).name)), wf, wr, methods, results)
+
+    def _run_seed(self) -> Optional[int]:
+        """Seed of the random streams of the run.
+
+        Without a seed, a checkpointed bootstrap draws its random streams
+        from the entropy recorded in the checkpoint file, so a relaunched run
+        resumes the same samples.
+        """
+        if self.seed is not None or not self.bootstrap_checkpoint_path or self.nboots <= 0:
+            return self.seed
+        checkpoint = read_checkpoint(self.bootstrap_checkpoint_path)
+        if checkpoint:
+            fu.log(f"Resuming the bootstrap from {len(checkpoint['index'])} checkpointed samples of {self.bootstrap_checkpoint_path}", self.out_log, self.global_log)
+            return int(checkpoint["entropy"])
+        return np.random.SeedSequence().entropy
+
+    def _store_results(self, results: dict[str, Any]) -> int:
+        """Append the estimates of the run to the result store."""
+        edge = self.edge or PurePath(self.io_dict["out"]["output_result_path"]).stem
+        node_a, node_b = (self.edge_nodes.split() + [None, None])[:2] if self.edge_nodes else (None, None)
+        input_hash = cache_key("edge", source_digest(self.input_a_xvg_zip_path), source_digest(self.input_b_xvg_zip_path))
+        records = result_records(edge, results, input_hash, node_a, node_b, self.leg)
+        fu.log(f"Appending {len(records)} estimates of edge {edge} to the result store {self.result_store_path}", self.out_log, self.global_log)
+        return append_results(self.result_store_path, records)
+
+    def _write_errors(self, errors_path: str, wf: np.ndarray, wr: np.ndarray, methods: list[str]) -> str:
+        """Write the block averaging errors for all the block counts and the jackknife errors."""
+        wf, wr = np.asarray(wf, dtype=np.float64), np.asarray(wr, dtype=np.float64)
+        block_counts = [int(count) for count in str(self.block_counts).split() if 1 < int(count) <= min(len(wf), len(wr)) // 2]
+        fu.log(f"Computing the block errors for {len(block_counts)} block counts and the jackknife errors", self.out_log, self.global_log)
+        blocks = block_errors(wf, wr, self.temperature, block_counts, methods)
+        jackknife = jackknife_errors(wf, wr, self.temperature, methods)
+        fact, _ = unit_factor(self.units, self.temperature)
+        return write_errors(errors_path, blocks, jackknife, len(wf), len(wr), fact)
+
+    def _analyse_subsets(self, subsets_path: str, methods: list[str]) -> str:
+        """Estimate the free energy of every trajectory subset from work values read and integrated once.
+
+        Every subset gets the random streams of a separate run with the same
+        seed, so each row matches the results of that run.
+        """
+        subsets = parse_subsets(self.subsets or "")
+        if not subsets:
+            raise ValueError("output_subsets_path requires the subsets property")
+        members_a, members_b = self._members(self.input_a_xvg_zip_path), self._members(self.input_b_xvg_zip_path)
+        table_a = self._work_table(self.input_a_xvg_zip_path, 0, False)
+        table_b = self._work_table(self.input_b_xvg_zip_path, 1, self.reverseB)
+
+        rows: list[dict[str, Any]] = []
+        for subset in subsets:
+            seed_a, seed_b, boot_seed = np.random.SeedSequence(self.seed).spawn(3)
+            selection = (subset["skip"], subset["slice"], subset["rand"], subset["index"])
+            _, wf, _ = table_works(table_a, select_members(members_a, *selection, np.random.default_rng(seed_a)))
+            _, wr, _ = table_works(table_b, select_members(members_b, *selection, np.random.default_rng(seed_b)))
+            fu.log(f"Analysing subset '{subset['subset']}': {len(wf)} forward and {len(wr)} reverse work values", self.out_log, self.global_log)
+            results = analyse_works(wf, wr, self.temperature, methods, self.nboots, self.nblocks, False, self.nworkers, boot_seed)
+            rows.append({"subset": subset["subset"], **summary_row(results, self.units)})
+
+        with open(subsets_path, "w", newline="") as subsets_file:
+            writer = csv.DictWriter(subsets_file, fieldnames=SUBSET_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        return subsets_path
+
+    def _analyse_sweep(self, sweep_path: str, wf: np.ndarray, wr: np.ndarray, methods: list[str], results: Optional[dict[str, Any]]) -> str:
+        """Estimate the free energy at every temperature of the sweep from the same work values and report it in every units.
+
+        The estimators run once per temperature, the units only convert the
+        estimates. Every temperature gets the bootstrap stream of a separate
+        run with the same seed.
+        """
+        temperatures = [float(value) for value in str(self.sweep_temperatures).split()] if self.sweep_temperatures else [self.temperature]
+        units_list = self.sweep_units.split() if self.sweep_units else [self.units]
+        for units in units_list:
+            # Fail before running any estimator on unknown units
+            unit_factor(units, self.temperature)
+
+        rows: list[dict[str, Any]] = []
+        for temperature in temperatures:
+            if temperature == self.temperature and results is not None:
+                temperature_results = results
+            else:
+                fu.log(f"Analysing the work values at {temperature} K", self.out_log, self.global_log)
+                _, _, boot_seed = np.random.SeedSequence(self.seed).spawn(3)
+                temperature_results = analyse_works(wf, wr, temperature, methods, self.nboots, self.nblocks, False, self.nworkers, boot_seed)
+            rows.extend({"temperature": temperature, "units": units, **summary_row(temperature_results, units)} for units in units_list)
+
+        with open(sweep_path, "w", newline="") as sweep_file:
+            writer = csv.DictWriter(sweep_file, fieldnames=SWEEP_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        return sweep_path
+
+    def _sequential_analysis(
+        self, methods: list[str], rng_a: np.random.Generator, rng_b: np.random.Generator, boot_seed: np.random.SeedSequence
+    ) -> tuple[tuple, tuple, dict]:
+        """Read the trajectories in random order and in growing chunks until the target error is reached.
+
+        Returns:
+            tuple: The names, work values and frames of the forward and reverse trajectories used, and the analysis results.
+        """
+        fact, label = unit_factor(self.units, self.temperature)
+        orders = []
+        for zip_path, rng in ((self.input_a_xvg_zip_path, rng_a), (self.input_b_xvg_zip_path, rng_b)):
+            names = select_members(self._members(zip_path), self.skip, self.slice, self.rand, self.index, rng)
+            orders.append([str(name) for name in rng.permutation(names)])
+
+        # Name, frames, last time and work value of the trajectories read so far, for each state
+        read: list[list[tuple[str, int, float, float]]] = [[], []]
+        n_read = max(self.chunk_size, 2)
+        while True:
+            used = []
+            for read_state, order, zip_path, lambda0, invert_values in zip(
+                read, orders, (self.input_a_xvg_zip_path, self.input_b_xvg_zip_path), (0, 1), (False, self.reverseB)
+            ):
+                curves = read_zip_curves(zip_path, order[len(read_state): n_read], self._log, self.decimate, np.dtype(self.dgdl_dtype))
+                if curves:
+                    log_decimation_error([data for _, data in curves], lambda0, invert_values, self.decimate, self._log)
+                    chunk_works, _ = integrate_curves([data for _, data in curves], lambda0, invert_values, ragged=True)
+                    read_state.extend((name, len(data), float(data[-1, 0]), work) for (name, data), work in zip(curves, chunk_works))
+                if not read_state:
+                    raise ValueError(f"No valid dgdl.xvg files found in {zip_path}")
+                # Only the trajectories with the frames of the longest one are kept, as in PMX analyse
+                ref_frames = max(read_state, key=lambda trajectory: trajectory[2])[1]
+                kept = [trajectory for trajectory in read_state if trajectory[1] == ref_frames]
+                used.append(([t[0] for t in kept], [t[3] for t in kept], [t[1] for t in kept]))
+
+            wf, wr = used[0][1], used[1][1]
+            results = analyse_works(wf, wr, self.temperature, methods, self.nboots, self.nblocks, not self.no_ks, self.nworkers, boot_seed)
+            best = best_estimate(results)
+            if best is None or best[2] is None:
+                raise ValueError("target_error requires the BAR estimator, or the CGI estimator with nboots or nblocks")
+            method, dg, err = best
+            fu.log(
+                f"{len(wf)} forward and {len(wr)} reverse trajectories: {method} dG = {dg * fact:.{self.prec}f} +- {err * fact:.{self.prec}f} {label}",
+                self.out_log,
+                self.global_log,
+            )
+            exhausted = n_read >= max(len(order) for order in orders)
+            if err * fact < self.target_error or exhausted:
+                break
+            n_read *= 2
+
+        results["convergence"] = {
+            "target_error": self.target_error / fact,
+            "error": err,
+            "converged": bool(err * fact < self.target_error),
+            "n_available": [len(order) for order in orders],
+        }
+        fu.log(
+            f"Target error {'reached' if results['convergence']['converged'] else 'not reached'} with {len(wf)} of {len(orders[0])} forward and {len(wr)} of {len(orders[1])} reverse trajectories",
+            self.out_log,
+            self.global_log,
+        )
+        return used[0], used[1], results
+
+    def _load_state(self) -> dict:
+        """Read the incremental state file, or return an empty state if it does not exist yet."""
+        if not Path(self.state_path).exists():
+            return {"version": 1, "states": {}}
+        with open(self.state_path) as state_file:
+            return json.load(state_file)
+
+    def _save_state(self, state: dict) -> None:
+        """Atomically write the incremental state file."""
+        tmp_path = Path(self.state_path).with_name(f".{Path(self.state_path).name}.tmp")
+        with open(tmp_path, "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    def _incremental_works(
+        self, state: dict, label: str, zip_path: str, lambda0: int, invert_values: bool, rng: Optional[np.random.Generator] = None
+    ) -> tuple[list[str], list[float], list[int]]:
+        """Update the state of a zip file with its new dgdl.xvg files and return the selected work values."""
+        signature = {"lambda0": lambda0, "invert_values": invert_values}
+        if self.decimate > 1 or np.dtype(self.dgdl_dtype) != np.float64:
+            signature.update({"decimate": self.decimate, "dgdl_dtype": np.dtype(self.dgdl_dtype).name})
+        zip_state = state["states"].get(label)
+        if not zip_state or zip_state["signature"] != signature:
+            zip_state = {"signature": signature, "trajectories": {}}
+            state["states"][label] = zip_state
+        trajectories = zip_state["trajectories"]
+
+        infos = xvg_member_infos(zip_path)
+        names = select_members(self._members(zip_path), self.skip, self.slice, self.rand, self.index, rng)
+        # Files are identified by their CRC, so trajectories rewritten after the last run are read again
+        new_names = [name for name in names if name not in trajectories or trajectories[name]["crc"] != infos[name].CRC]
+        fu.log(f"Streaming {len(new_names)} new of {len(names)} dgdl.xvg files from {zip_path}", self.out_log, self.global_log)
+
+        curves = read_zip_curves(zip_path, new_names, self._log, self.decimate, np.dtype(self.dgdl_dtype))
+        if curves:
+            log_decimation_error([data for _, data in curves], lambda0, invert_values, self.decimate, self._log)
+            # Every curve is integrated over its own length, the reference length is applied below
+            works, _ = integrate_curves([data for _, data in curves], lambda0, invert_values, ragged=True)
+            for (name, data), work in zip(curves, works):
+                trajectories[name] = {"crc": infos[name].CRC, "frames": len(data), "last_time": float(data[-1, 0]), "work": float(work)}
+
+        names = [name for name in names if name in trajectories]
+        if not names:
+            raise ValueError(f"No valid dgdl.xvg files found in {zip_path}")
+        mask = reference_mask(
+            np.array([trajectories[name]["last_time"] for name in names]),
+            np.array([trajectories[name]["frames"] for name in names]),
+        )
+        for name, kept in zip(names, mask):
+            if not kept:
+                fu.log(f"Skipping {name}: {trajectories[name]['frames']} data points do not match the reference trajectory", self.out_log, self.global_log)
+        names = [name for name, kept in zip(names, mask) if kept]
+        return names, [trajectories[name]["work"] for name in names], [trajectories[name]["frames"] for name in names]
+
+    def _cached_works(
+        self, zip_path: str, lambda0: int, invert_values: bool, rng: Optional[np.random.Generator] = None
+    ) -> tuple[list[str], list[float], list[int]]:
+        """Return the work values of a zip file from the cache, integrating and caching them on a miss."""
+        # A random subset without seed can not be reproduced, so it is never cached
+        if not self.cache_dir or (self.rand and self.seed is None):
+            return self._stream_works(zip_path, lambda0, invert_values, rng)
+
+        selection = {"skip": self.skip, "slice": self.slice, "rand": self.rand, "index": self.index}
+        if self.decimate > 1 or np.dtype(self.dgdl_dtype) != np.float64:
+            selection.update({"decimate": self.decimate, "dgdl_dtype": np.dtype(self.dgdl_dtype).name})
+        if self.triage == "exclude":
+            selection["excluded"] = sorted(set(list_xvg_members(zip_path)) - set(self._members(zip_path)))
+        if self.rand:
+            selection["seed"] = self.seed
+        key = cache_key("works", source_digest(zip_path), lambda0, invert_values, selection)
+        entry = cache_lookup(self.cache_dir, key, ".npz")
+        if entry:
+            fu.log(f"Reading the cached work values of {zip_path}", self.out_log, self.global_log)
+            with np.load(entry) as cached:
+                return cached["names"].tolist(), cached["works"].tolist(), cached["frames"].tolist()
+
+        names, works, frames = self._stream_works(zip_path, lambda0, invert_values, rng)
+        buffer = io.BytesIO()
+        np.savez(buffer, names=np.array(names, dtype=str), works=np.array(works), frames=np.array(frames, dtype=np.int64))
+        cache_store(self.cache_dir, key, ".npz", buffer.getvalue(), self.cache_max_size)
+        return names, works, frames
+
+    def _stream_works(
+        self, zip_path: str, lambda0: int, invert_values: bool, rng: Optional[np.random.Generator] = None
+    ) -> tuple[list[str], list[float], list[int]]:
+        """Read the selected dgdl.xvg files of a zip file and integrate them as PMX analyse does."""
+        names = select_members(self._members(zip_path), self.skip, self.slice, self.rand, self.index, rng)
+        if self.io_dict["out"].get("output_subsets_path"):
+            # The subsets are analysed from a table of all the trajectories: take the selection from it
+            names, works, frames = table_works(self._work_table(zip_path, lambda0, invert_values), names)
+            return names, works.tolist(), frames
+        fu.log(f"Streaming {len(names)} dgdl.xvg files from {zip_path}", self.out_log, self.global_log)
+        return zip_works(zip_path, names, lambda0, invert_values, self._log, self.decimate, np.dtype(self.dgdl_dtype))
+
+    def _members(self, zip_path: str) -> list[str]:
+        """List the dgdl.xvg files of a zip file, without the ones excluded by the triage."""
+        members = list_xvg_members(zip_path)
+        if self.triage != "exclude":
+            return members
+        bad = {report["name"] for report in self._triage(zip_path) if report["status"] == "bad"}
+        return [name for name in members if name not in bad]
+
+    def _triage(self, zip_path: str) -> list[dict[str, Any]]:
+        """Check the head and tail of every dgdl.xvg file of a zip file once per launch."""
+        if zip_path not in self._triage_reports:
+            lambda0 = 0 if zip_path == self.input_a_xvg_zip_path else 1
+            reports = triage_zip(zip_path, list_xvg_members(zip_path), lambda0)
+            for report in reports:
+                if report["status"] != "ok":
+                    fu.log(f"Triage of {report['name']} in {zip_path}: {report['status']} ({' '.join(report['issues'])})", self.out_log, self.global_log)
+            self._triage_reports[zip_path] = reports
+        return self._triage_reports[zip_path]
+
+    def _run_triage(self) -> None:
+        """Triage the dgdl.xvg files of both states and write the triage report."""
+        reports = {"A": self._triage(self.input_a_xvg_zip_path), "B": self._triage(self.input_b_xvg_zip_path)}
+        for label, state_reports in reports.items():
+            n_bad = sum(report["status"] == "bad" for report in state_reports)
+            action = "excluded" if self.triage == "exclude" else "flagged"
+            fu.log(f"Triage of the {label} state: {len(state_reports)} dgdl.xvg files, {n_bad} {action} as bad", self.out_log, self.global_log)
+        if self.io_dict["out"].get("output_triage_path"):
+            unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+            write_triage(str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_triage_path"]).name)), reports)
+
+    def _work_table(self, zip_path: str, lambda0: int, invert_values: bool) -> dict[str, np.ndarray]:
+        """Read and integrate all the dgdl.xvg files of a zip file once per launch."""
+        if zip_path not in self._work_tables:
+            members = self._members(zip_path)
+            fu.log(f"Streaming {len(members)} dgdl.xvg files from {zip_path}", self.out_log, self.global_log)
+            self._work_tables[zip_path] = zip_work_table(zip_path, members, lambda0, invert_values, self._log, self.decimate, np.dtype(self.dgdl_dtype))
+        return self._work_tables[zip_path]
+
+    def _log(self, message: str) -> None:
+        fu.log(message, self.out_log, self.global_log)
+
 
 def pmxanalyse(
     input_a_xvg_zip_path: str,
     input_b_xvg_zip_path: str,
     output_result_path: str,
-    output_work_plot_path: str,
+    output_work_plot_path: Optional[str] = None,
+    output_work_store_path: Optional[str] = None,
+    output_errors_path: Optional[str] = None,
+    output_subsets_path: Optional[str] = None,
+    output_sweep_path: Optional[str] = None,
+    output_triage_path: Optional[str] = None,
     properties: Optional[dict] = None,
     **kwargs,
 ) -> int:
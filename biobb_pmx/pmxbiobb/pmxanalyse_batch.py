@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""Module containing the PMX analyse batch class and the command line interface."""
+
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePath
+from typing import Any, Optional
+
+import numpy as np
+from biobb_common.generic.biobb_object import BiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_common.tools.file_utils import launchlogger
+
+from biobb_pmx.pmxbiobb.common import cache_key
+from biobb_pmx.pmxbiobb.result_store import append_results, result_records
+from biobb_pmx.pmxbiobb.work_analysis import analyse_stacked, analyse_works, summary_row, write_results
+from biobb_pmx.pmxbiobb.work_integration import zip_works
+from biobb_pmx.pmxbiobb.xvg_io import list_xvg_members, select_members, source_digest
+
+SUMMARY_COLUMNS = ["edge", "method", "dg", "err", "n_forward", "n_reverse", "cgi_dg", "cgi_err", "bar_dg", "bar_err", "jarz_dg", "error"]
+
+
+class Pmxanalyse_batch(BiobbObject):
+    """
+    | biobb_pmx Pmxanalyse_batch
+    | Wrapper class for the `PMX analyse <https://github.com/deGrootLab/pmx>`_ module to analyse many edges at once.
+    | Analyze the work values of the A and B states of a list of edges to calculate their free energy differences in a single process.
+
+    Args:
+        input_edges_path (str): Path to the CSV table of edges, with the edge, input_a_xvg_zip_path and input_b_xvg_zip_path columns, an optional output_result_path column with the file name (without directories) of the results file of the edge and optional node_a, node_b and leg columns recorded in the result store. Edges and results file names must be unique. Relative zip paths are relative to the table. File type: input. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/data/pmx/edges.csv>`_. Accepted formats: csv (edam:format_3752).
+        output_results_zip_path (str): Path to the zip file with the TXT results file of each edge. File type: output. Accepted formats: zip (edam:format_3987).
+        output_summary_path (str): Path to the CSV summary with the free energy estimates of all the edges. File type: output. Accepted formats: csv (edam:format_3752).
+        properties (dic):
+            * **method** (*str*) - ("CGI BAR JARZ") Choose one or more estimators to use. Values: CGI (Crooks Gaussian Intersection), BAR (Bennet Acceptance Ratio), JARZ (Jarzynski's estimator).
+            * **temperature** (*float*) - (298.15) [0~1000|0.05] Temperature in Kelvin.
+            * **nboots** (*int*) - (0) [0~1000|1] Number of bootstrap samples to use for the bootstrap estimate of the standard errors.
+            * **nblocks** (*int*) - (1) [0~1000|1] Number of blocks to divide the data into for an estimate of the standard error.
+            * **nworkers** (*int*) - (1) [1~1000|1] Number of worker processes analysing the edges in parallel. Without bootstrap or block errors, the workers only integrate the work values and the estimates of all the edges are computed in a single stacked call.
+            * **seed** (*int*) - (None) [0~100000|1] Seed of the random trajectory subset and the bootstrap samples. Every edge gets the same results as a Pmxanalyse stream_xvg run with this seed.
+            * **reverseB** (*bool*) - (False) Whether to reverse the work values for the backward (B->A) transformation.
+            * **skip** (*int*) - (1) [0~1000|1] Skip files.
+            * **slice** (*str*) - (None) Subset of trajectories to analyze. Provide list slice, e.g. "10 50" will result in selecting dhdl_files[10:50].
+            * **rand** (*int*) - (None) [0~1000|1] Take a random subset of trajectories. Default is None (do not take random subset).
+            * **index** (*str*) - (None) Zero-based index of files to analyze (e.g. "0 10 20 50 60"). It keeps the dhdl.xvg files according to their position in the list, sorted according to the filenames.
+            * **prec** (*int*) - (2) [0~100|1] The decimal precision of the screen/file output.
+            * **units** (*str*) - ("kJ") The units of the output. Values: kJ (Kilojoules), kcal (Kilocalories), kT (the product of the Boltzmann constant k and the temperature).
+            * **no_ks** (*bool*) - (False) Whether to do a Kolmogorov-Smirnov test to check whether the Gaussian assumption for CGI holds.
+            * **result_store_path** (*str*) - (None) Path to a campaign-wide SQLite result store. The estimates of every edge are appended to it in a single transaction, one row per estimator, in kJ/mol.
+            * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
+            * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **sandbox_path** (*str*) - ("./") [WF property] Parent path to the sandbox directory.
+
+    Examples:
+        This is a use example of how to use the building block from Python::
+
+            from biobb_pmx.pmxbiobb.pmxanalyse_batch import pmxanalyse_batch
+            prop = {
+                'method': 'CGI BAR JARZ',
+                'temperature': 298.15,
+                'nworkers': 8
+            }
+            pmxanalyse_batch(input_edges_path='/path/to/myEdges.csv',
+                             output_results_zip_path='/path/to/newResults.zip',
+                             output_summary_path='/path/to/newSummary.csv',
+                             properties=prop)
+
+    Info:
+        * wrapped_software:
+            * name: PMX analyse
+            * version: >=1.0.1
+            * license: GNU
+        * ontology:
+            * name: EDAM
+            * schema: http://edamontology.org/EDAM.owl
+
+    """
+
+    def __init__(
+        self,
+        input_edges_path: str,
+        output_results_zip_path: str,
+        output_summary_path: str,
+        properties: Optional[dict] = None,
+        **kwargs,
+    ) -> None:
+        properties = properties or {}
+
+        # Call parent class constructor
+        super().__init__(properties)
+        self.locals_var_dict = locals().copy()
+
+        # Input/Output files
+        self.io_dict = {
+            "in": {"input_edges_path": input_edges_path},
+            "out": {
+                "output_results_zip_path": output_results_zip_path,
+                "output_summary_path": output_summary_path,
+            },
+        }
+
+        # Properties specific for BB
+        self.method = properties.get("method", "CGI BAR JARZ")
+        self.temperature = properties.get("temperature", 298.15)
+        self.nboots = properties.get("nboots", 0)
+        self.nblocks = properties.get("nblocks", 1)
+        self.nworkers = properties.get("nworkers", 1)
+        self.seed = properties.get("seed", None)
+        self.reverseB = properties.get("reverseB", False)
+        self.skip = properties.get("skip", 1)
+        self.slice = properties.get("slice", None)
+        self.rand = properties.get("rand", None)
+        self.index = properties.get("index", None)
+        self.prec = properties.get("prec", 2)
+        self.units = properties.get("units", "kJ")
+        self.no_ks = properties.get("no_ks", False)
+        self.result_store_path = properties.get("result_store_path", None)
+
+        # Check the properties
+        self.check_properties(properties)
+        self.check_arguments()
+
+    @launchlogger
+    def launch(self) -> int:
+        """Execute the :class:`Pmxanalyse_batch <pmx.pmxanalyse_batch.Pmxanalyse_batch>` pmx.pmxanalyse_batch.Pmxanalyse_batch object."""
+
+        # Setup Biobb
+        if self.check_restart():
+            return 0
+        self.stage_files()
+
+        edges = read_edges(self.io_dict["in"]["input_edges_path"])
+        fu.log(f"Analysing {len(edges)} edges with {self.nworkers} workers", self.out_log, self.global_log)
+
+        results_dir = fu.create_unique_dir(path=self.stage_io_dict.get("unique_dir", ""))
+        options = {
+            "method": self.method.split() if self.method else [],
+            "temperature": self.temperature,
+            "nboots": self.nboots,
+            "nblocks": self.nblocks,
+            "seed": self.seed,
+            "reverseB": self.reverseB,
+            "skip": self.skip,
+            "slice": self.slice,
+            "rand": self.rand,
+            "index": self.index,
+            "prec": self.prec,
+            "units": self.units,
+            "ks_test": not self.no_ks,
+            "result_store": bool(self.result_store_path),
+        }
+        args = [(edge["edge"], edge["input_a_xvg_zip_path"], edge["input_b_xvg_zip_path"], str(Path(results_dir).joinpath(edge["output_result_path"])), options, edge) for edge in edges]
+        # Without bootstrap or block errors all the edges are estimated in one stacked call
+        stacked = self.nboots <= 0 and self.nblocks <= 1
+        if self.nworkers > 1:
+            with ProcessPoolExecutor(max_workers=self.nworkers) as pool:
+                rows = analyse_edges_stacked(args, pool) if stacked else list(pool.map(analyse_edge, *zip(*args)))
+        else:
+            rows = analyse_edges_stacked(args) if stacked else [analyse_edge(*arg) for arg in args]
+
+        for row in rows:
+            if row.get("error"):
+                fu.log(f"Edge {row['edge']} failed: {row['error']}", self.out_log, self.global_log)
+        if self.result_store_path:
+            stored = append_results(self.result_store_path, [record for row in rows for record in row.get("records", [])])
+            fu.log(f"Appended {stored} estimates to the result store {self.result_store_path}", self.out_log, self.global_log)
+
+        unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+        fu.zip_list(
+            unique_dir.joinpath(PurePath(self.io_dict["out"]["output_results_zip_path"]).name),
+            [str(Path(results_dir).joinpath(edge["output_result_path"])) for edge, row in zip(edges, rows) if not row.get("error")],
+            self.out_log,
+        )
+        write_summary(str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_summary_path"]).name)), rows)
+
+        # Copy files to host
+        self.copy_to_host()
+
+        self.remove_tmp_files()
+
+        self.check_arguments(output_files_created=True, raise_exception=False)
+        return 0
+
+
+def read_edges(edges_path: str) -> list[dict[str, str]]:
+    """Read the CSV table of edges, resolving the zip paths relative to the table.
+
+    Raises:
+        ValueError: If edges or results file names are repeated, or a results file name is a path.
+    """
+    table_dir = Path(edges_path).parent
+    edges, errors = [], []
+    seen_edges: set[str] = set()
+    seen_results: set[str] = set()
+    with open(edges_path, newline="") as edges_file:
+        for row in csv.DictReader(edges_file):
+            edge = row["edge"].strip()
+            result_name = (row.get("output_result_path") or "").strip() or f"{edge}.txt"
+            # The results files are written to the sandbox and zipped by name only
+            if PurePath(result_name).name != result_name or result_name in (".", ".."):
+                errors.append(f"edge {edge}: the results file {result_name} is not a file name")
+            if edge in seen_edges:
+                errors.append(f"edge {edge} is repeated")
+            if result_name in seen_results:
+                errors.append(f"edge {edge}: the results file {result_name} is used by another edge")
+            seen_edges.add(edge)
+            seen_results.add(result_name)
+            edges.append(
+                {
+                    "edge": edge,
+                    "input_a_xvg_zip_path": str(table_dir.joinpath(row["input_a_xvg_zip_path"].strip())),
+                    "input_b_xvg_zip_path": str(table_dir.joinpath(row["input_b_xvg_zip_path"].strip())),
+                    "output_result_path": result_name,
+                    **{column: (row.get(column) or "").strip() or None for column in ("node_a", "node_b", "leg")},
+                }
+            )
+    if errors:
+        raise ValueError(f"Invalid edges table {edges_path}: " + "; ".join(errors))
+    return edges
+
+
+def edge_works(edge: str, zip_a: str, zip_b: str, options: dict[str, Any]) -> dict[str, Any]:
+    """Integrate the forward and reverse work values of an edge."""
+    try:
+        seed_a, seed_b, _ = np.random.SeedSequence(options["seed"]).spawn(3)
+        selection = (options["skip"], options["slice"], options["rand"], options["index"])
+        _, wf, _ = zip_works(zip_a, select_members(list_xvg_members(zip_a), *selection, np.random.default_rng(seed_a)), 0, False)
+        _, wr, _ = zip_works(zip_b, select_members(list_xvg_members(zip_b), *selection, np.random.default_rng(seed_b)), 1, options["reverseB"])
+        return {"edge": edge, "wf": wf, "wr": wr}
+    except (OSError, ValueError) as error:
+        return {"edge": edge, "error": str(error)}
+
+
+def edge_row(
+    edge: str, zip_a: str, zip_b: str, result_path: str, options: dict[str, Any], results: dict[str, Any], nodes: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """Write the results file of an analysed edge and return its summary row.
+
+    With the result_store option, the row also holds the result store records of the edge.
+    """
+    write_results(result_path, results, options["units"], options["prec"])
+    row = {"edge": edge, **summary_row(results, options["units"])}
+    if options.get("result_store"):
+        nodes = nodes or {}
+        input_hash = cache_key("edge", source_digest(zip_a), source_digest(zip_b))
+        row["records"] = result_records(edge, results, input_hash, nodes.get("node_a"), nodes.get("node_b"), nodes.get("leg"))
+    return row
+
+
+def analyse_edge(edge: str, zip_a: str, zip_b: str, result_path: str, options: dict[str, Any], nodes: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+    """Integrate and analyse the work values of an edge, with its bootstrap and block errors, write its results file and return its summary row."""
+    works = edge_works(edge, zip_a, zip_b, options)
+    if works.get("error"):
+        return works
+    try:
+        _, _, boot_seed = np.random.SeedSequence(options["seed"]).spawn(3)
+        results = analyse_works(
+            works["wf"],
+            works["wr"],
+            options["temperature"],
+            options["method"],
+            options["nboots"],
+            options["nblocks"],
+            options["ks_test"],
+            1,
+            boot_seed,
+        )
+        return edge_row(edge, zip_a, zip_b, result_path, options, results, nodes)
+    except (OSError, ValueError) as error:
+        return {"edge": edge, "error": str(error)}
+
+
+def analyse_edges_stacked(args: list[tuple], pool: Optional[ProcessPoolExecutor] = None) -> list[dict[str, Any]]:
+    """Integrate the work values of every edge and estimate the free energies of all the edges in a single stacked call.
+
+    Only the integration runs in the worker pool; the estimates and KS tests
+    of all the edges come out of one call of :func:`analyse_stacked`.
+    """
+    work_args = [(edge, zip_a, zip_b, options) for edge, zip_a, zip_b, _, options, _ in args]
+    works = list(pool.map(edge_works, *zip(*work_args))) if pool else [edge_works(*arg) for arg in work_args]
+    analysed = [position for position, work in enumerate(works) if not work.get("error")]
+    if not analysed:
+        return works
+    options = args[0][4]
+    results = analyse_stacked(
+        [works[position]["wf"] for position in analysed], [works[position]["wr"] for position in analysed], options["temperature"], options["method"], options["ks_test"]
+    )
+    rows = list(works)
+    for position, edge_results in zip(analysed, results):
+        edge, zip_a, zip_b, result_path, options, nodes = args[position]
+        try:
+            rows[position] = edge_row(edge, zip_a, zip_b, result_path, options, edge_results, nodes)
+        except (OSError, ValueError) as error:
+            rows[position] = {"edge": edge, "error": str(error)}
+    return rows
+
+
+def write_summary(summary_path: str, rows: list[dict[str, Any]]) -> str:
+    """Write the CSV summary with one row per edge."""
+    with open(summary_path, "w", newline="") as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return summary_path
+
+
+def pmxanalyse_batch(
+    input_edges_path: str,
+    output_results_zip_path: str,
+    output_summary_path: str,
+    properties: Optional[dict] = None,
+    **kwargs,
+) -> int:
+    """Create the :class:`Pmxanalyse_batch <pmx.pmxanalyse_batch.Pmxanalyse_batch>` class and
+    execute the :meth:`launch() <pmx.pmxanalyse_batch.Pmxanalyse_batch.launch> method."""
+    return Pmxanalyse_batch(**dict(locals())).launch()
+
+
+pmxanalyse_batch.__doc__ = Pmxanalyse_batch.__doc__
+main = Pmxanalyse_batch.get_main(pmxanalyse_batch, "Wrapper class for the PMX analyse module to analyse many edges at once.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""Module containing the PMX cycle closure class and the command line interface."""
+
+from pathlib import Path, PurePath
+from typing import Optional
+
+from biobb_common.generic.biobb_object import BiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_common.tools.file_utils import launchlogger
+
+from biobb_pmx.pmxbiobb.cycle_closure import edge_values, solve_cycle_closure, write_cycle_closure
+from biobb_pmx.pmxbiobb.result_store import read_results
+from biobb_pmx.pmxbiobb.work_analysis import unit_factor
+
+
+class Pmxcycle_closure(BiobbObject):
+    """
+    | biobb_pmx Pmxcycle_closure
+    | Cycle closure of the free energy differences of a perturbation graph stored by Pmxanalyse.
+    | Compute the relative free energy of every node (ligand or mutant) of a perturbation graph, with its standard error and cycle closure error, from the edge estimates of a campaign-wide result store, solving the weighted least squares problem of the whole graph in one sparse factorization.
+
+    Args:
+        input_result_store_path (str): Path to the SQLite result store written by Pmxanalyse or Pmxanalyse_batch with their result_store_path property. Only the edges with both nodes are used. File type: input. Accepted formats: sqlite (edam:format_3621), db (edam:format_3621).
+        output_nodes_path (str): Path to the CSV table of the nodes, with their connected component, relative free energy, standard error, cycle closure error (root mean square residual of their edges) and number of edges, in the output units. File type: output. Accepted formats: csv (edam:format_3752).
+        output_edges_path (str) (Optional): Path to the CSV table of the edges, with their measured and fitted free energy differences, the standard errors of both and the residual, in the output units. File type: output. Accepted formats: csv (edam:format_3752).
+        properties (dic):
+            * **estimator** (*str*) - ("best") Estimator of the edge free energies. Values: best (the estimate preferred by PMX analyse, BAR > CGI > JARZ), BAR (Bennet Acceptance Ratio), CGI (Crooks Gaussian Intersection), JARZ (Jarzynski's estimator).
+            * **legs** (*str*) - (None) The two legs of the thermodynamic cycle separated by a space (e.g. "complex water"). The value of an edge is then the free energy of its first leg minus the one of its second leg. By default every stored edge estimate is a free energy difference of the graph.
+            * **reference** (*str*) - (None) Node whose free energy is fixed to zero. The first node of each connected component is used by default.
+            * **latest** (*bool*) - (True) Use only the most recent estimate of each edge and leg. Otherwise repeated estimates are all used as independent measures.
+            * **units** (*str*) - ("kJ") The units of the output. Values: kJ (Kilojoules), kcal (Kilocalories), kT (the product of the Boltzmann constant k and the temperature).
+            * **temperature** (*float*) - (298.15) [0~1000|0.05] Temperature in Kelvin of the kT units.
+            * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
+            * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **sandbox_path** (*str*) - ("./") [WF property] Parent path to the sandbox directory.
+
+    Examples:
+        This is a use example of how to use the building block from Python::
+
+            from biobb_pmx.pmxbiobb.pmxcycle_closure import pmxcycle_closure
+            prop = {
+                'estimator': 'BAR',
+                'legs': 'complex water',
+                'reference': 'lig1'
+            }
+            pmxcycle_closure(input_result_store_path='/path/to/myResults.sqlite',
+                             output_nodes_path='/path/to/newNodes.csv',
+                             output_edges_path='/path/to/newEdges.csv',
+                             properties=prop)
+
+    Info:
+        * wrapped_software:
+            * name: PMX analyse
+            * version: >=1.0.1
+            * license: GNU
+        * ontology:
+            * name: EDAM
+            * schema: http://edamontology.org/EDAM.owl
+
+    """
+
+    def __init__(
+        self,
+        input_result_store_path: str,
+        output_nodes_path: str,
+        output_edges_path: Optional[str] = None,
+        properties: Optional[dict] = None,
+        **kwargs,
+    ) -> None:
+        properties = properties or {}
+
+        # Call parent class constructor
+        super().__init__(properties)
+        self.locals_var_dict = locals().copy()
+
+        # Input/Output files
+        self.io_dict = {
+            "in": {"input_result_store_path": input_result_store_path},
+            "out": {
+                "output_nodes_path": output_nodes_path,
+                "output_edges_path": output_edges_path,
+            },
+        }
+
+        # Properties specific for BB
+        self.estimator = properties.get("estimator", "best")
+        self.legs = properties.get("legs", None)
+        self.reference = properties.get("reference", None)
+        self.latest = properties.get("latest", True)
+        self.units = properties.get("units", "kJ")
+        self.temperature = properties.get("temperature", 298.15)
+
+        # Check the properties
+        self.check_properties(properties)
+        self.check_arguments()
+
+    @launchlogger
+    def launch(self) -> int:
+        """Execute the :class:`Pmxcycle_closure <pmx.pmxcycle_closure.Pmxcycle_closure>` pmx.pmxcycle_closure.Pmxcycle_closure object."""
+
+        # Setup Biobb
+        if self.check_restart():
+            return 0
+        self.stage_files()
+
+        legs = self.legs.split() if self.legs else None
+        if legs and len(legs) != 2:
+            raise ValueError(f"legs must hold two legs separated by a space, got '{self.legs}'")
+        records = read_results(self.io_dict["in"]["input_result_store_path"], self.estimator, self.latest)
+        edges = edge_values(records, legs)
+        fu.log(f"Solving the cycle closure of {len(edges)} edges from {len(records)} {self.estimator} estimates", self.out_log, self.global_log)
+        solution = solve_cycle_closure(
+            [edge["node_a"] for edge in edges],
+            [edge["node_b"] for edge in edges],
+            [edge["dg"] for edge in edges],
+            [edge["err"] for edge in edges],
+            self.reference,
+        )
+        fu.log(f"{len(solution['nodes'])} nodes in {solution['component'].max() + 1} connected components", self.out_log, self.global_log)
+
+        unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+        edges_path = self.io_dict["out"].get("output_edges_path")
+        fact, _ = unit_factor(self.units, self.temperature)
+        write_cycle_closure(
+            str(unique_dir.joinpath(PurePath(self.io_dict["out"]["output_nodes_path"]).name)),
+            solution,
+            edges,
+            fact,
+            str(unique_dir.joinpath(PurePath(edges_path).name)) if edges_path else None,
+        )
+
+        # Copy files to host
+        self.copy_to_host()
+
+        self.remove_tmp_files()
+
+        self.check_arguments(output_files_created=True, raise_exception=False)
+        return 0
+
+
+def pmxcycle_closure(
+    input_result_store_path: str,
+    output_nodes_path: str,
+    output_edges_path: Optional[str] = None,
+    properties: Optional[dict] = None,
+    **kwargs,
+) -> int:
+    """Create the :class:`Pmxcycle_closure <pmx.pmxcycle_closure.Pmxcycle_closure>` class and
+    execute the :meth:`launch() <pmx.pmxcycle_closure.Pmxcycle_closure.launch> method."""
+    return Pmxcycle_closure(**dict(locals())).launch()
+
+
+pmxcycle_closure.__doc__ = Pmxcycle_closure.__doc__
+main = Pmxcycle_closure.get_main(pmxcycle_closure, "Cycle closure of the free energy differences of a perturbation graph stored by Pmxanalyse.")
+
+if __name__ == "__main__":
+    main()
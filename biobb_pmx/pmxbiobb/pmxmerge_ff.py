@@ -11,7 +11,6 @@ from typing import Optional
 from biobb_common.generic.biobb_object import BiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
-from pmx import ligand_alchemy  # type: ignore
 
 
 class Pmxmerge_ff(BiobbObject):
@@ -115,6 +114,9 @@ class Pmxmerge_ff(BiobbObject):
         for itp in files:
             ffsIn_list.append(itp)
 
+        # PMX imports matplotlib at import time: only import it when the block is launched
+        from pmx import ligand_alchemy  # type: ignore
+
         fu.log("Running merge_FF_files from pmx package...\n", self.out_log)
         ligand_alchemy._merge_FF_files(
             self.stage_io_dict["out"]["output_topology_path"], ffsIn=ffsIn_list
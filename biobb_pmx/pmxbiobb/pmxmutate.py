@@ -12,7 +12,17 @@ from biobb_common.generic.biobb_object import BiobbObject
 from biobb_common.tools import file_utils as fu
 from biobb_common.tools.file_utils import launchlogger
 
-from biobb_pmx.pmxbiobb.common import MUTATION_DICT, create_mutations_file
+from biobb_pmx.pmxbiobb.common import (
+    MUTATION_DICT,
+    cache_key,
+    cache_lookup,
+    cache_materialize,
+    cache_store,
+    check_mutations,
+    create_mutations_file,
+    file_digest,
+    has_chains,
+)
 
 
 class Pmxmutate(BiobbObject):
@@ -26,11 +36,14 @@ class Pmxmutate(BiobbObject):
         output_structure_path (str): Path to the output structure file. File type: output. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/reference/pmx/ref_output_structure.pdb>`_. Accepted formats: pdb (edam:format_1476), gro (edam:format_2033).
         input_b_structure_path (str) (Optional): Path to the mutated input structure file. File type: input. Accepted formats: pdb (edam:format_1476), gro (edam:format_2033).
         properties (dic):
-            * **mutation_list** (*str*) - ("2Ala") Mutation list in the format "Chain:Resnum MUT_AA_Code" or "Chain:Resnum MUT_NA_Code"  (no spaces between the elements) separated by commas. If no chain is provided as chain code all the chains in the pdb file will be mutated. ie: "A:15CYS". Possible MUT_AA_Code: 'ALA', 'ARG', 'ASN', 'ASP', 'ASPH', 'ASPP', 'ASH', 'CYS', 'CYS2', 'CYN', 'CYX', 'CYM', 'CYSH', 'GLU', 'GLUH', 'GLUP', 'GLH', 'GLN', 'GLY', 'HIS', 'HIE', 'HISE', 'HSE', 'HIP', 'HSP', 'HISH', 'HID', 'HSD', 'ILE', 'LEU', 'LYS', 'LYSH', 'LYP', 'LYN', 'LSN', 'MET', 'PHE', 'PRO', 'SER', 'SP1', 'SP2', 'THR', 'TRP', 'TYR', 'VAL'. Possible MUT_NA_Codes: 'A', 'T', 'C', 'G', 'U'.
+            * **mutation_list** (*str*) - ("2Ala") Mutation list in the format "Chain:Resnum MUT_AA_Code" or "Chain:Resnum MUT_NA_Code"  (no spaces between the elements) separated by commas. Without chain code, Resnum is the position of the residue in the structure (residues renumbered from 1); with chain code, Resnum is the residue number of the structure file. Chain and no chain entries can not be mixed. ie: "A:15CYS". Possible MUT_AA_Code: 'ALA', 'ARG', 'ASN', 'ASP', 'ASPH', 'ASPP', 'ASH', 'CYS', 'CYS2', 'CYN', 'CYX', 'CYM', 'CYSH', 'GLU', 'GLUH', 'GLUP', 'GLH', 'GLN', 'GLY', 'HIS', 'HIE', 'HISE', 'HSE', 'HIP', 'HSP', 'HISH', 'HID', 'HSD', 'ILE', 'LEU', 'LYS', 'LYSH', 'LYP', 'LYN', 'LSN', 'MET', 'PHE', 'PRO', 'SER', 'SP1', 'SP2', 'THR', 'TRP', 'TYR', 'VAL'. Possible MUT_NA_Codes: 'A', 'T', 'C', 'G', 'U'.
             * **force_field** (*str*) - ("amber99sb-star-ildn-mut") Forcefield to use.
             * **resinfo** (*bool*) - (False) Show the list of 3-letter -> 1-letter residues.
+            * **validate_mutations** (*bool*) - (True) Check the mutation list against the residues of the input structure before running PMX, reporting all the invalid entries, missing residues and mutations to the residue already in place at once.
             * **gmx_lib** (*str*) - ("$CONDA_PREFIX/lib/python3.7/site-packages/pmx/data/mutff/") Path to the GMXLIB folder in your computer.
             * **binary_path** (*str*) - ("pmx") Path to the PMX command line interface.
+            * **cache_dir** (*str*) - (None) Directory of the cache of mutated structures, keyed on the contents of the input structures, the mutation list, the force field (name and files) and the PMX that runs (resolved binary_path, or container_path and container_image). A cached mutant is hard linked (or copied) as the output instead of running PMX.
+            * **cache_max_size** (*int*) - (1024) [0~1000000|1] Maximum size of the cache directory in MB. The least recently used entries are evicted above this size.
             * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
             * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
             * **sandbox_path** (*str*) - ("./") [WF property] Parent path to the sandbox directory.
@@ -94,6 +107,9 @@ class Pmxmutate(BiobbObject):
         self.resinfo = properties.get("resinfo", False)
         self.mutation_list = properties.get("mutation_list", "2Ala")
         self.input_mutations_file = properties.get("mutations_file")
+        self.validate_mutations = properties.get("validate_mutations", True)
+        self.cache_dir = properties.get("cache_dir", None)
+        self.cache_max_size = properties.get("cache_max_size", 1024)
 
         # Properties common in all PMX BB
         self.gmx_lib = properties.get("gmx_lib", None)
@@ -123,6 +139,12 @@ class Pmxmutate(BiobbObject):
         # Setup Biobb
         if self.check_restart():
             return 0
+
+        # Fail before staging and launching PMX on a mutation list that does not fit the structure
+        if self.validate_mutations:
+            mutations = check_mutations(self.mutation_list, self.io_dict["in"]["input_structure_path"])
+            fu.log(f"Validated {len(mutations)} mutations against the input structure", self.out_log, self.global_log)
+
         self.stage_files()
 
         if self.container_path:
@@ -172,12 +194,24 @@ class Pmxmutate(BiobbObject):
             self.cmd.append(PurePath(self.stage_io_dict["in"]["input_b_structure_path"]).name)
         if self.resinfo:
             self.cmd.append("-resinfo")
+        # Mutations with a chain use the residue numbers of the structure file
+        if has_chains(self.mutation_list):
+            self.cmd.append("--keep_resid")
 
         if self.gmx_lib:
             self.env_vars_dict["GMXLIB"] = self.gmx_lib
 
-        # Run Biobb block
-        self.run_biobb()
+        output_path = Path(self.stage_io_dict.get("unique_dir", "")).joinpath(PurePath(self.io_dict["out"]["output_structure_path"]).name)
+        key = self._mutant_key() if self.cache_dir else None
+        entry = cache_lookup(self.cache_dir, key, output_path.suffix) if key else None
+        if entry:
+            fu.log(f"Reading the cached mutant {entry.name}", self.out_log, self.global_log)
+            cache_materialize(entry, output_path)
+        else:
+            # Run Biobb block
+            self.run_biobb()
+            if key and not self.return_code and output_path.is_file():
+                cache_store(self.cache_dir, key, output_path.suffix, output_path.read_bytes(), self.cache_max_size)
 
         # Copy files to host
         self.copy_to_host()
@@ -188,6 +222,38 @@ class Pmxmutate(BiobbObject):
         self.check_arguments(output_files_created=True, raise_exception=False)
         return self.return_code
 
+    def _mutant_key(self) -> str:
+        """Cache key of the mutant: digests of the input structures and of the normalized mutations file, the force field identity and the pmx that runs.
+
+        pmx runs from the resolved binary_path, with its size and
+        modification time, or from the container_path and container_image.
+        """
+        force_field = {"name": self.force_field.lower(), "gmx_lib": self.gmx_lib, "container_image": self.container_image}
+        if self.container_path:
+            runner = {"container_path": self.container_path, "container_image": self.container_image, "binary_path": self.binary_path}
+        else:
+            binary = Path(shutil.which(self.binary_path) or self.binary_path).resolve()
+            stat = binary.stat()
+            runner = {"binary_path": str(binary), "stamp": (stat.st_size, stat.st_mtime_ns)}
+        if not self.container_path:
+            from biobb_pmx.pmxbiobb.mutagenesis import force_field_path
+            from biobb_pmx.pmxbiobb.mutff_cache import library_key
+
+            try:
+                # The files of the force field directory and the pmx version, when the force field is found here
+                force_field = {"name": self.force_field.lower(), "library": library_key(force_field_path(self.force_field, self.gmx_lib))}
+            except (ValueError, OSError):
+                pass
+        structure_b_path = self.stage_io_dict["in"].get("input_b_structure_path")
+        return cache_key(
+            "mutant",
+            file_digest(self.stage_io_dict["in"]["input_structure_path"]),
+            file_digest(structure_b_path) if structure_b_path else None,
+            file_digest(str(self.input_mutations_file)),
+            force_field,
+            runner,
+        )
+
 
 def pmxmutate(
     input_structure_path: str,
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""Module containing the PMX mutate scan class and the command line interface."""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from pathlib import Path, PurePath
+from typing import Optional
+
+from biobb_common.generic.biobb_object import BiobbObject
+from biobb_common.tools import file_utils as fu
+from biobb_common.tools.file_utils import launchlogger
+
+from biobb_pmx.pmxbiobb.common import residue_index
+from biobb_pmx.pmxbiobb.mutagenesis import (
+    MANIFEST_NAME,
+    expand_scan,
+    force_field_path,
+    init_scan,
+    load_model,
+    mutate_one,
+    parse_scan,
+    read_scan_file,
+    write_manifest,
+)
+from biobb_pmx.pmxbiobb.mutff_cache import PMX_TESTED_VERSIONS, library_supported, load_library, pmx_version
+
+
+class Pmxmutate_scan(BiobbObject):
+    """
+    | biobb_pmx Pmxmutate_scan
+    | Wrapper class for the `PMX mutate <https://github.com/deGrootLab/pmx>`_ module to build many single mutants at once.
+    | Build every single mutant of a saturation or scan mutagenesis of a protein or nucleic acid structure in a single process, parsing the structure once.
+
+    Args:
+        input_structure_path (str): Path to the input structure file. File type: input. `Sample file <https://github.com/bioexcel/biobb_pmx/raw/master/biobb_pmx/test/data/pmx/frame99.pdb>`_. Accepted formats: pdb (edam:format_1476), gro (edam:format_2033).
+        output_mutants_zip_path (str): Path to the zip file with the structure file of each mutant, in the format of the input structure, and the manifest.csv table with the label, chain and residue number of the mutation, wild type, target, structure file name and error of each mutant. The mutant structures are written with the residues renumbered from 1. File type: output. Accepted formats: zip (edam:format_3987).
+        input_b_structure_path (str) (Optional): Path to the mutated input structure file. File type: input. Accepted formats: pdb (edam:format_1476), gro (edam:format_2033).
+        input_mutations_path (str) (Optional): Path to a table of mutations, read row by row and without duplicates, added to the scan_list entries. With a header, its columns are mutation (a scan list entry) or chain (optional), resnum and target, and an optional label naming single mutants, which replaces the generated label of a mutant also in scan_list. Two different labels for a mutant are an error. Without a header, the first field of each row is the mutation and the second one its label. Comma separated, tab separated for the tsv extension. All the mutants are expanded in memory before the first one is built, to resolve their labels, at about 1 KB per mutant: tables of millions of mutants need GBs of memory and are better split across runs. File type: input. Accepted formats: csv (edam:format_3752), tsv (edam:format_3475), txt (edam:format_2330).
+        properties (dic):
+            * **scan_list** (*str*) - (None) Scan list, required without input_mutations_path, in the format "Chain:First[-Last]MUT_Code" (no spaces between the elements) separated by commas. Every residue from First to Last is mutated to MUT_Code, one mutant per residue, or to every other amino acid (or nucleotide) with the * code. As in Pmxmutate, without chain code the residue numbers are positions in the structure (residues renumbered from 1) and with chain code they are the residue numbers of the structure file. ie: "A:15*, 20-25ALA". Possible MUT_Code: *, the MUT_AA_Code and MUT_NA_Code of Pmxmutate.
+            * **force_field** (*str*) - ("amber99sb-star-ildn-mut") Forcefield to use.
+            * **gmx_lib** (*str*) - ("$CONDA_PREFIX/lib/python3.7/site-packages/pmx/data/mutff/") Path to the GMXLIB folder in your computer.
+            * **nworkers** (*int*) - (1) [1~1000|1] Number of worker processes building the mutants in parallel. Each worker parses the input structure once.
+            * **mutff_cache_dir** (*str*) - (None) Directory of a persistent cache of the parsed mutation library of the force field (hybrid residue templates and rotamer data), shared by all runs. A library is parsed again when any of its files changes. By default the library is parsed once per run. The library is handed to pmx through private pmx functions, tested with pmx 5.2.2: with pmx versions without them, pmx reads the hybrid residues from the mtp files and the cache is not used.
+            * **remove_tmp** (*bool*) - (True) [WF property] Remove temporal files.
+            * **restart** (*bool*) - (False) [WF property] Do not execute if output files exist.
+            * **sandbox_path** (*str*) - ("./") [WF property] Parent path to the sandbox directory.
+
+    Examples:
+        This is a use example of how to use the building block from Python::
+
+            from biobb_pmx.pmxbiobb.pmxmutate_scan import pmxmutate_scan
+            prop = {
+                'scan_list': 'A:15*, 20-25Ala',
+                'gmx_lib': '/path/to/myGMXLIB/',
+                'force_field': 'amber99sb-star-ildn-mut',
+                'nworkers': 8
+            }
+            pmxmutate_scan(input_structure_path='/path/to/myStructure.pdb',
+                           output_mutants_zip_path='/path/to/newMutants.zip',
+                           input_mutations_path='/path/to/myMutations.csv',
+                           properties=prop)
+
+    Info:
+        * wrapped_software:
+            * name: PMX mutate
+            * version: >=1.0.1
+            * license: GNU
+        * ontology:
+            * name: EDAM
+            * schema: http://edamontology.org/EDAM.owl
+
+    """
+
+    def __init__(
+        self,
+        input_structure_path: str,
+        output_mutants_zip_path: str,
+        input_b_structure_path: Optional[str] = None,
+        input_mutations_path: Optional[str] = None,
+        properties: Optional[dict] = None,
+        **kwargs,
+    ) -> None:
+        properties = properties or {}
+
+        # Call parent class constructor
+        super().__init__(properties)
+        self.locals_var_dict = locals().copy()
+
+        # Input/Output files
+        self.io_dict = {
+            "in": {
+                "input_structure_path": input_structure_path,
+                "input_b_structure_path": input_b_structure_path,
+                "input_mutations_path": input_mutations_path,
+            },
+            "out": {"output_mutants_zip_path": output_mutants_zip_path},
+        }
+
+        # Properties specific for BB
+        self.scan_list = properties.get("scan_list", None)
+        self.force_field = properties.get("force_field", "amber99sb-star-ildn-mut")
+        self.nworkers = properties.get("nworkers", 1)
+        self.mutff_cache_dir = properties.get("mutff_cache_dir", None)
+
+        # Properties common in all PMX BB
+        self.gmx_lib = properties.get("gmx_lib", None)
+        if not self.gmx_lib and os.environ.get("CONDA_PREFIX"):
+            python_version = f"{sys.version_info.major}.{sys.version_info.minor}"
+            self.gmx_lib = str(
+                Path(os.environ.get("CONDA_PREFIX", "")).joinpath(
+                    f"lib/python{python_version}/site-packages/pmx/data/mutff/"
+                )
+            )
+
+        # Check the properties
+        self.check_properties(properties)
+        self.check_arguments()
+
+    @launchlogger
+    def launch(self) -> int:
+        """Execute the :class:`Pmxmutate_scan <pmx.pmxmutate_scan.Pmxmutate_scan>` pmx.pmxmutate_scan.Pmxmutate_scan object."""
+
+        # Setup Biobb
+        if self.check_restart():
+            return 0
+        self.stage_files()
+
+        specs = parse_scan(self.scan_list or "")
+        mutations_path = self.stage_io_dict["in"].get("input_mutations_path")
+        if not specs and not mutations_path:
+            raise ValueError("The scan_list property is empty and there is no input mutations file")
+        structure_path = self.stage_io_dict["in"]["input_structure_path"]
+        model = load_model(structure_path)
+        # The mutations file is read row by row, the expanded mutants are all kept to resolve their labels
+        mutants = expand_scan(model, residue_index(structure_path), chain(specs, read_scan_file(mutations_path)) if mutations_path else specs)
+        fu.log(f"Building {len(mutants)} mutants with {self.nworkers} workers", self.out_log, self.global_log)
+
+        version = pmx_version()
+        if version not in PMX_TESTED_VERSIONS:
+            fu.log(f"pmx {version} is not one of the tested versions {', '.join(PMX_TESTED_VERSIONS)}", self.out_log, self.global_log)
+        ff_path = force_field_path(self.force_field, self.gmx_lib)
+        library = None
+        if library_supported():
+            library = load_library(ff_path, self.mutff_cache_dir)
+            fu.log(f"{'Loaded' if library['hit'] else 'Parsed'} the mutation library of {ff_path}", self.out_log, self.global_log)
+        else:
+            fu.log(f"pmx {version} has no pmx.alchemy._get_hybrid_residue: the hybrid residues are read from the mtp files, without the mutation library cache", self.out_log, self.global_log)
+
+        mutants_dir = fu.create_unique_dir(path=self.stage_io_dict.get("unique_dir", ""))
+        scan_args = (model, ff_path, mutants_dir, PurePath(structure_path).suffix, self.stage_io_dict["in"].get("input_b_structure_path"), library)
+        if self.nworkers > 1:
+            chunksize = max(1, len(mutants) // (4 * self.nworkers))
+            with ProcessPoolExecutor(max_workers=self.nworkers, initializer=init_scan, initargs=scan_args) as pool:
+                rows = list(pool.map(mutate_one, mutants, chunksize=chunksize))
+        else:
+            init_scan(*scan_args)
+            rows = [mutate_one(mutant) for mutant in mutants]
+
+        for row in rows:
+            if row.get("error"):
+                fu.log(f"Mutant {row['label']} failed: {row['error']}", self.out_log, self.global_log)
+        manifest_path = write_manifest(str(Path(mutants_dir).joinpath(MANIFEST_NAME)), rows)
+
+        unique_dir = Path(self.stage_io_dict.get("unique_dir", ""))
+        fu.zip_list(
+            unique_dir.joinpath(PurePath(self.io_dict["out"]["output_mutants_zip_path"]).name),
+            [str(Path(mutants_dir).joinpath(row["structure"])) for row in rows if row.get("structure")] + [manifest_path],
+            self.out_log,
+        )
+
+        # Copy files to host
+        self.copy_to_host()
+
+        self.remove_tmp_files()
+
+        self.check_arguments(output_files_created=True, raise_exception=False)
+        return 0
+
+
+def pmxmutate_scan(
+    input_structure_path: str,
+    output_mutants_zip_path: str,
+    input_b_structure_path: Optional[str] = None,
+    input_mutations_path: Optional[str] = None,
+    properties: Optional[dict] = None,
+    **kwargs,
+) -> int:
+    """Create the :class:`Pmxmutate_scan <pmx.pmxmutate_scan.Pmxmutate_scan>` class and
+    execute the :meth:`launch() <pmx.pmxmutate_scan.Pmxmutate_scan.launch> method."""
+    return Pmxmutate_scan(**dict(locals())).launch()
+
+
+pmxmutate_scan.__doc__ = Pmxmutate_scan.__doc__
+main = Pmxmutate_scan.get_main(pmxmutate_scan, "Wrapper class for the PMX mutate module to build many single mutants at once.")
+
+if __name__ == "__main__":
+    main()
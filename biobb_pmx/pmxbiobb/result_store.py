@@ -0,0 +1,127 @@
+"""Campaign-wide SQLite store of the free energy estimates of the analysed edges.
+
+Every analysis appends one row per estimator, with the edge identifier, the
+nodes (ligands or mutants) it links, the leg of the thermodynamic cycle, the
+free energy and its standard error in kJ/mol, the number of trajectories and
+a hash of the inputs, so thousands of runs can be queried without parsing
+their results files.
+"""
+
+import sqlite3
+import time
+from collections.abc import Iterable
+from typing import Any, Optional
+
+from biobb_pmx.pmxbiobb.work_analysis import best_estimate, estimates
+
+RESULT_COLUMNS = ["edge", "node_a", "node_b", "leg", "estimator", "best", "dg", "err", "n_forward", "n_reverse", "temperature", "input_hash", "created"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    edge TEXT NOT NULL,
+    node_a TEXT,
+    node_b TEXT,
+    leg TEXT,
+    estimator TEXT NOT NULL,
+    best INTEGER NOT NULL DEFAULT 0,
+    dg REAL,
+    err REAL,
+    n_forward INTEGER,
+    n_reverse INTEGER,
+    temperature REAL,
+    input_hash TEXT,
+    created TEXT
+);
+CREATE INDEX IF NOT EXISTS results_edge ON results (edge, leg, estimator);
+"""
+
+# Seconds a writer waits for the lock held by a concurrent run
+BUSY_TIMEOUT = 60.0
+
+
+def connect(store_path: str) -> sqlite3.Connection:
+    """Open a result store, creating its table if needed."""
+    connection = sqlite3.connect(store_path, timeout=BUSY_TIMEOUT)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def result_records(
+    edge: str,
+    results: dict[str, Any],
+    input_hash: Optional[str] = None,
+    node_a: Optional[str] = None,
+    node_b: Optional[str] = None,
+    leg: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    """Build the store records of an analysis, one per estimator, in kJ/mol.
+
+    The estimate preferred by PMX analyse (BAR > CGI > JARZ) is flagged with best.
+    """
+    best = best_estimate(results)
+    created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    return [
+        {
+            "edge": edge,
+            "node_a": node_a,
+            "node_b": node_b,
+            "leg": leg,
+            "estimator": estimator,
+            "best": int(best is not None and best[0] == estimator),
+            "dg": float(dg),
+            "err": None if err is None else float(err),
+            "n_forward": results["n_forward"],
+            "n_reverse": results["n_reverse"],
+            "temperature": results["temperature"],
+            "input_hash": input_hash,
+            "created": created,
+        }
+        for estimator, (dg, err) in estimates(results).items()
+    ]
+
+
+def append_results(store_path: str, records: Iterable[dict[str, Any]]) -> int:
+    """Append records to a result store in a single transaction.
+
+    Returns:
+        int: The number of appended records.
+    """
+    records = list(records)
+    columns = ", ".join(RESULT_COLUMNS)
+    placeholders = ", ".join(f":{column}" for column in RESULT_COLUMNS)
+    connection = connect(store_path)
+    try:
+        with connection:
+            connection.executemany(f"INSERT INTO results ({columns}) VALUES ({placeholders})", [{column: record.get(column) for column in RESULT_COLUMNS} for record in records])
+    finally:
+        connection.close()
+    return len(records)
+
+
+def read_results(store_path: str, estimator: Optional[str] = None, latest: bool = True) -> list[dict[str, Any]]:
+    """Read the records of a result store.
+
+    Args:
+        store_path (str): Path to the SQLite result store.
+        estimator (str): Keep the records of this estimator only (CGI, BAR or JARZ), or the preferred estimate of each analysis with "best".
+        latest (bool): Keep only the most recent record of each edge, leg and estimator.
+
+    Returns:
+        list: The records, in insertion order.
+    """
+    condition, parameters = "1", []
+    if estimator and estimator.lower() == "best":
+        condition = "best = 1"
+    elif estimator:
+        condition, parameters = "estimator = ?", [estimator.upper()]
+    query = f"SELECT * FROM results WHERE {condition}"
+    if latest:
+        query += f" AND id IN (SELECT MAX(id) FROM results WHERE {condition} GROUP BY edge, leg, {'best' if condition == 'best = 1' else 'estimator'})"
+        parameters = parameters * 2
+    connection = connect(store_path)
+    try:
+        return [dict(row) for row in connection.execute(query + " ORDER BY id", parameters)]
+    finally:
+        connection.close()
@@ -0,0 +1,439 @@
+"""In-process free energy analysis of work values, reported in the PMX analyse format."""
+
+import os
+import re
+import time
+from collections.abc import Iterable, Sequence
+from typing import Any, Optional
+
+import numpy as np
+from scipy.stats import sem
+
+from biobb_pmx.pmxbiobb.work_bootstrap import SeedType, bootstrap_samples
+from biobb_pmx.pmxbiobb.work_estimators import (
+    KB,
+    bar_conv,
+    bar_conv_stacked,
+    bar_dg,
+    bar_dg_stacked,
+    bar_err_stacked,
+    cgi_dg,
+    cgi_dg_stacked,
+    jarz_dg,
+    jarz_dg_stacked,
+    jarz_gauss_dg,
+    jarz_gauss_dg_stacked,
+    jarz_gauss_err_stacked,
+    ks_norm_test_stacked,
+    stack_works,
+)
+
+# Estimates and standard errors of a PMX analyse results file, e.g. "  BAR: Std Err (blocks) =     0.27 kJ/mol"
+RESULT_LINE = re.compile(r"\s*(?P<estimator>CGI|BAR|JARZ): (?:dG(?: Mean)?|Std Err \((?P<error>[\w:]+)\))\s*=\s*(?P<value>\S+) (?P<units>\S+)")
+# Standard errors shown in the PMX analyse plot with each estimator, in order of preference
+PLOT_ERRORS = {"BAR": ("blocks", "bootstrap", "analytical"), "CGI": ("blocks", "bootstrap"), "JARZ": ()}
+
+
+def unit_factor(units: str, temperature: float) -> tuple[float, str]:
+    """Return the conversion factor from kJ/mol and the label of the output units."""
+    units = units.lower()
+    if units == "kj":
+        return 1.0, "kJ/mol"
+    if units == "kcal":
+        return 1.0 / 4.184, "kcal/mol"
+    if units == "kt":
+        return 1.0 / (KB * temperature), "kT"
+    raise ValueError(f"No unit type '{units}' available. Possible values are kJ, kcal and kT")
+
+
+def _block_err(func, nblocks: int, *works: np.ndarray) -> float:
+    """Standard error of an estimator computed over consecutive blocks of the work values."""
+    splits = [np.array_split(w, nblocks) for w in works]
+    return float(sem([func(*blocks) for blocks in zip(*splits)], ddof=1))
+
+
+def analyse_stacked(
+    wfs: Sequence[Iterable[float]],
+    wrs: Sequence[Iterable[float]],
+    temperature: float = 298.15,
+    methods: Iterable[str] = ("cgi", "bar", "jarz"),
+    ks_test: bool = True,
+) -> list[dict[str, Any]]:
+    """Compute the CGI, BAR and Jarzynski estimates and the KS tests of many edges at once.
+
+    The work values of all the edges are stacked in NaN padded arrays and
+    every estimator is evaluated for all the edges in a single call.
+
+    Args:
+        wfs (list): Forward (0->1) work values of each edge in kJ/mol.
+        wrs (list): Reverse (1->0) work values of each edge in kJ/mol.
+        temperature (float): Temperature in Kelvin.
+        methods (list): Estimators to use: cgi, bar and/or jarz.
+        ks_test (bool): Whether to do a Kolmogorov-Smirnov normality test of the work distributions.
+
+    Returns:
+        list: The estimates and analytical errors of each edge, in kJ/mol, without bootstrap or block errors.
+    """
+    wf = stack_works([np.asarray(list(w), dtype=np.float64) for w in wfs])
+    wr = stack_works([np.asarray(list(w), dtype=np.float64) for w in wrs])
+    methods = [method.lower() for method in methods]
+    n_forward, n_reverse = np.sum(~np.isnan(wf), axis=1), np.sum(~np.isnan(wr), axis=1)
+    columns: dict[str, Any] = {}
+    if "cgi" in methods:
+        columns["cgi_dg"], columns["cgi_inters"] = cgi_dg_stacked(wf, wr)
+        columns["mf"], columns["devf"] = np.nanmean(wf, axis=1), np.nanstd(wf, axis=1)
+        columns["mr"], columns["devr"] = np.nanmean(wr, axis=1), np.nanstd(wr, axis=1)
+    if ks_test:
+        columns["ks_forward"], columns["ks_reverse"] = ks_norm_test_stacked(wf), ks_norm_test_stacked(wr)
+    if "bar" in methods:
+        columns["bar_dg"] = bar_dg_stacked(wf, wr, temperature)
+        columns["bar_err"] = bar_err_stacked(columns["bar_dg"], wf, wr, temperature)
+        columns["bar_conv"] = bar_conv_stacked(columns["bar_dg"], wf, wr, temperature)
+    if "jarz" in methods:
+        columns["jarz_for"], columns["jarz_rev"] = jarz_dg_stacked(wf, temperature), jarz_dg_stacked(wr, temperature, reverse=True)
+        columns["gauss_for"], columns["gauss_rev"] = jarz_gauss_dg_stacked(wf, temperature), jarz_gauss_dg_stacked(wr, temperature, reverse=True)
+        columns["gauss_err_for"], columns["gauss_err_rev"] = jarz_gauss_err_stacked(wf, temperature), jarz_gauss_err_stacked(wr, temperature)
+
+    def ks(test: tuple, row: int) -> tuple[float, float, float, bool]:
+        q, lam0, check, passed = test
+        return float(q[row]), lam0, float(check[row]), bool(passed[row])
+
+    edges = []
+    for row in range(len(wf)):
+        results: dict[str, Any] = {"n_forward": int(n_forward[row]), "n_reverse": int(n_reverse[row]), "temperature": temperature}
+        if "cgi" in methods:
+            results["cgi"] = {
+                "mf": float(columns["mf"][row]),
+                "devf": float(columns["devf"][row]),
+                "mr": float(columns["mr"][row]),
+                "devr": float(columns["devr"][row]),
+                "dg": float(columns["cgi_dg"][row]),
+                "inters_bool": bool(columns["cgi_inters"][row]),
+            }
+        if ks_test:
+            results["ks"] = {"forward": ks(columns["ks_forward"], row), "reverse": ks(columns["ks_reverse"], row)}
+        if "bar" in methods:
+            results["bar"] = {"dg": float(columns["bar_dg"][row]), "err": float(columns["bar_err"][row]), "conv": float(columns["bar_conv"][row])}
+        if "jarz" in methods:
+            jarz = {"dg_for": float(columns["jarz_for"][row]), "dg_rev": float(columns["jarz_rev"][row])}
+            jarz["dg_mean"] = (jarz["dg_for"] + jarz["dg_rev"]) * 0.5
+            results["jarz"] = jarz
+            results["jarz_gauss"] = {
+                "dg_for": float(columns["gauss_for"][row]),
+                "dg_rev": float(columns["gauss_rev"][row]),
+                "err_for": float(columns["gauss_err_for"][row]),
+                "err_rev": float(columns["gauss_err_rev"][row]),
+            }
+        edges.append(results)
+    return edges
+
+
+def analyse_works(
+    wf: Iterable[float],
+    wr: Iterable[float],
+    temperature: float = 298.15,
+    methods: Iterable[str] = ("cgi", "bar", "jarz"),
+    nboots: int = 0,
+    nblocks: int = 1,
+    ks_test: bool = True,
+    nworkers: int = 1,
+    seed: SeedType = None,
+    checkpoint_path: Optional[str] = None,
+) -> dict[str, Any]:
+    """Compute the CGI, BAR and Jarzynski estimates of the forward and reverse work values.
+
+    Args:
+        wf (list): Forward (0->1) work values in kJ/mol.
+        wr (list): Reverse (1->0) work values in kJ/mol.
+        temperature (float): Temperature in Kelvin.
+        methods (list): Estimators to use: cgi, bar and/or jarz.
+        nboots (int): Number of bootstrap samples for the bootstrap standard errors.
+        nblocks (int): Number of blocks for the block standard errors.
+        ks_test (bool): Whether to do a Kolmogorov-Smirnov normality test of the work distributions.
+        nworkers (int): Number of worker processes used for the bootstrap.
+        seed (int): Seed of the bootstrap random streams.
+        checkpoint_path (str): Path to the checkpoint file of the completed bootstrap samples, to resume an interrupted bootstrap.
+
+    Returns:
+        dict: The estimates and errors of each estimator, in kJ/mol.
+    """
+    wf, wr = np.asarray(list(wf), dtype=np.float64), np.asarray(list(wr), dtype=np.float64)
+    methods = [method.lower() for method in methods]
+    results = analyse_stacked([wf], [wr], temperature, methods, ks_test)[0]
+    boots = {}
+    if nboots > 0:
+        dg = results["bar"]["dg"] if "bar" in methods else None
+        boots = bootstrap_samples(wf, wr, temperature, nboots, methods, dg, nworkers, seed, checkpoint_path)
+
+    if "cgi" in methods:
+        cgi = results["cgi"]
+        if boots:
+            cgi["err_boot1"] = np.std(boots["cgi_parametric"])
+            cgi["err_boot2"] = np.std(boots["cgi"])
+        if nblocks > 1:
+            cgi["err_blocks"] = _block_err(lambda f, r: cgi_dg(f, r)[0], nblocks, wf, wr)
+
+    if "bar" in methods:
+        bar = results["bar"]
+        dg = bar["dg"]
+        if boots:
+            bar["err_boot"] = np.std(boots["bar"])
+            bar["conv_err_boot"] = np.std(boots["bar_conv"])
+        if nblocks > 1:
+            bar["err_blocks"] = _block_err(lambda f, r: bar_dg(f, r, temperature), nblocks, wf, wr)
+            bar["conv_err_blocks"] = _block_err(lambda f, r: bar_conv(dg, f, r, temperature), nblocks, wf, wr)
+
+    if "jarz" in methods:
+        jarz, gauss = results["jarz"], results["jarz_gauss"]
+        if boots:
+            jarz["err_boot_for"] = np.std(boots["jarz_for"])
+            jarz["err_boot_rev"] = np.std(boots["jarz_rev"])
+            gauss["err_boot_for"] = np.std(boots["jarz_gauss_for"])
+            gauss["err_boot_rev"] = np.std(boots["jarz_gauss_rev"])
+        if nblocks > 1:
+            jarz["err_blocks_for"] = _block_err(lambda w: jarz_dg(w, temperature), nblocks, wf)
+            jarz["err_blocks_rev"] = _block_err(lambda w: jarz_dg(w, temperature, reverse=True), nblocks, wr)
+            gauss["err_blocks_for"] = _block_err(lambda w: jarz_gauss_dg(w, temperature), nblocks, wf)
+            gauss["err_blocks_rev"] = _block_err(lambda w: jarz_gauss_dg(w, temperature, reverse=True), nblocks, wr)
+
+    return results
+
+
+def format_results(results: dict[str, Any], units: str = "kJ", prec: int = 2) -> list[str]:
+    """Format the analysis results with the same layout as the PMX analyse results file."""
+    fact, label = unit_factor(units, results["temperature"])
+
+    def line(name: str, value: float, width: int = 8) -> str:
+        return f"  {name} = {value * fact:{width}.{prec}f} {label}"
+
+    lines = [
+        " ========================================================",
+        "                       ANALYSIS",
+        " ========================================================",
+        "  Number of forward (0->1) trajectories: %d" % results["n_forward"],
+        "  Number of reverse (1->0) trajectories: %d" % results["n_reverse"],
+        "  Temperature : %.2f K" % results["temperature"],
+    ]
+    if "convergence" in results:
+        convergence = results["convergence"]
+        lines.append(f"  Target standard error = {convergence['target_error'] * fact:.{prec}f} {label}")
+        lines.append("  Trajectories available: %d forward, %d reverse" % tuple(convergence["n_available"]))
+        lines.append("  Target error %s" % ("reached" if convergence["converged"] else "not reached"))
+
+    def header(title: str) -> None:
+        lines.extend(["", " --------------------------------------------------------", f"             {title}     ", " --------------------------------------------------------"])
+
+    if "cgi" in results:
+        cgi = results["cgi"]
+        header("Crooks Gaussian Intersection")
+        lines.append(f"  CGI: Forward Gauss mean = {cgi['mf'] * fact:8.{prec}f} {label} std = {cgi['devf'] * fact:8.{prec}f} {label}")
+        lines.append(f"  CGI: Reverse Gauss mean = {cgi['mr'] * fact:8.{prec}f} {label} std = {cgi['devr'] * fact:8.{prec}f} {label}")
+        if not cgi["inters_bool"]:
+            lines.extend(["", "  Gaussians too close for intersection calculation", "   --> Taking difference of mean values"])
+        lines.append(line("CGI: dG", cgi["dg"]))
+        if "err_boot1" in cgi:
+            lines.append(line("CGI: Std Err (bootstrap:parametric)", cgi["err_boot1"]))
+            lines.append(line("CGI: Std Err (bootstrap)", cgi["err_boot2"]))
+        if "err_blocks" in cgi:
+            lines.append(line("CGI: Std Err (blocks)", cgi["err_blocks"]))
+
+    if "ks" in results:
+        for direction, (q, lam0, check, ok) in (("Forward", results["ks"]["forward"]), ("Reverse", results["ks"]["reverse"])):
+            lines.append("    %s: gaussian quality = %3.2f" % (direction, q))
+            if ok:
+                lines.append("             ---> KS-Test Ok")
+            else:
+                lines.append("             ---> KS-Test Failed. sqrt(N)*Dmax = %4.2f, lambda0 = %4.2f" % (q, check))
+
+    if "bar" in results:
+        bar = results["bar"]
+        header("Bennett Acceptance Ratio")
+        lines.append(line("BAR: dG", bar["dg"]))
+        lines.append(line("BAR: Std Err (analytical)", bar["err"]))
+        if "err_boot" in bar:
+            lines.append(line("BAR: Std Err (bootstrap) ", bar["err_boot"]))
+        if "err_blocks" in bar:
+            lines.append(line("BAR: Std Err (blocks) ", bar["err_blocks"]))
+        lines.append("  BAR: Conv = %8.2f" % bar["conv"])
+        if "conv_err_boot" in bar:
+            lines.append("  BAR: Conv Std Err (bootstrap) = %8.2f" % bar["conv_err_boot"])
+        if "conv_err_blocks" in bar:
+            lines.append("  BAR: Conv Std Err (blocks) = %8.2f" % bar["conv_err_blocks"])
+
+    if "jarz" in results:
+        jarz, gauss = results["jarz"], results["jarz_gauss"]
+        header("Jarzynski estimator")
+        lines.append(line("JARZ: dG Forward", jarz["dg_for"]))
+        lines.append(line("JARZ: dG Reverse", jarz["dg_rev"]))
+        lines.append(line("JARZ: dG Mean   ", jarz["dg_mean"]))
+        if "err_boot_for" in jarz:
+            lines.append(line("JARZ: Std Err Forward (bootstrap)", jarz["err_boot_for"]))
+            lines.append(line("JARZ: Std Err Reverse (bootstrap)", jarz["err_boot_rev"]))
+        if "err_blocks_for" in jarz:
+            lines.append(line("JARZ: Std Err Forward (blocks)", jarz["err_blocks_for"]))
+            lines.append(line("JARZ: Std Err Reverse (blocks)", jarz["err_blocks_rev"]))
+        lines.append(line("JARZ_Gauss: dG Forward", gauss["dg_for"]))
+        lines.append(line("JARZ_Gauss: dG Reverse", gauss["dg_rev"]))
+        lines.append(line("JARZ_Gauss: dG Mean   ", (gauss["dg_for"] + gauss["dg_rev"]) / 2.0))
+        lines.append(line("JARZ_Gauss: Std Err (analytical) Forward", gauss["err_for"]))
+        lines.append(line("JARZ_Gauss: Std Err (analytical) Reverse", gauss["err_rev"]))
+        if "err_boot_for" in gauss:
+            lines.append(line("JARZ_Gauss: Std Err Forward (bootstrap)", gauss["err_boot_for"]))
+            lines.append(line("JARZ_Gauss: Std Err Reverse (bootstrap)", gauss["err_boot_rev"]))
+        if "err_blocks_for" in gauss:
+            lines.append(line("JARZ_Gauss: Std Err Forward (blocks)", gauss["err_blocks_for"]))
+            lines.append(line("JARZ_Gauss: Std Err Reverse (blocks)", gauss["err_blocks_rev"]))
+
+    lines.append(" ========================================================")
+    return lines
+
+
+def write_results(result_path: str, results: dict[str, Any], units: str = "kJ", prec: int = 2) -> str:
+    """Write the analysis results file."""
+    with open(result_path, "w") as result_file:
+        result_file.write("# biobb_pmx Pmxanalyse in-process analysis\n")
+        result_file.write("# pwd = %s\n" % os.getcwd())
+        result_file.write("# %s (%s)\n\n\n" % (time.asctime(), os.environ.get("USER")))
+        result_file.write("\n".join(format_results(results, units, prec)) + "\n")
+    return result_path
+
+
+def write_works(result_path: str, names_a: list[str], works_a: Iterable[float], names_b: list[str], works_b: Iterable[float]) -> str:
+    """Write the integrated work values of both states, as done by PMX analyse with integ_only."""
+    with open(result_path, "w") as result_file:
+        result_file.write("# Forward (0->1) integrated work values\n")
+        result_file.writelines(f"{name} {work}\n" for name, work in zip(names_a, works_a))
+        result_file.write("# Reverse (1->0) integrated work values\n")
+        result_file.writelines(f"{name} {work}\n" for name, work in zip(names_b, works_b))
+    return result_path
+
+
+def best_estimate(results: dict[str, Any]) -> Optional[tuple[str, float, Optional[float]]]:
+    """Return the preferred estimate of the analysis, in kJ/mol.
+
+    The estimators follow the PMX analyse hierarchy BAR > CGI > JARZ and the
+    errors blocks > bootstrap > analytical.
+
+    Returns:
+        tuple: The estimator name, the free energy and its standard error (None if not available).
+    """
+    if "bar" in results:
+        bar = results["bar"]
+        return "BAR", bar["dg"], bar.get("err_blocks", bar.get("err_boot", bar["err"]))
+    if "cgi" in results:
+        cgi = results["cgi"]
+        return "CGI", cgi["dg"], cgi.get("err_blocks", cgi.get("err_boot2"))
+    if "jarz" in results:
+        return "JARZ", results["jarz"]["dg_mean"], None
+    return None
+
+
+def estimates(results: dict[str, Any]) -> dict[str, tuple[float, Optional[float]]]:
+    """Return the free energy and the preferred standard error of each estimator of an analysis, in kJ/mol.
+
+    The errors follow the PMX analyse hierarchy blocks > bootstrap > analytical.
+    """
+    values: dict[str, tuple[float, Optional[float]]] = {}
+    if "cgi" in results:
+        cgi = results["cgi"]
+        values["CGI"] = cgi["dg"], cgi.get("err_blocks", cgi.get("err_boot2"))
+    if "bar" in results:
+        bar = results["bar"]
+        values["BAR"] = bar["dg"], bar.get("err_blocks", bar.get("err_boot", bar["err"]))
+    if "jarz" in results:
+        values["JARZ"] = results["jarz"]["dg_mean"], None
+    return values
+
+
+def summary_row(results: dict[str, Any], units: str = "kJ") -> dict[str, Any]:
+    """Flatten the main estimates and errors of an analysis into a table row, in the output units."""
+    fact, _ = unit_factor(units, results["temperature"])
+
+    def convert(value: Optional[float]) -> Optional[float]:
+        return None if value is None else float(value * fact)
+
+    row: dict[str, Any] = {"n_forward": results["n_forward"], "n_reverse": results["n_reverse"]}
+    values = estimates(results)
+    if "CGI" in values:
+        row["cgi_dg"], row["cgi_err"] = (convert(value) for value in values["CGI"])
+    if "BAR" in values:
+        row["bar_dg"], row["bar_err"] = (convert(value) for value in values["BAR"])
+    if "JARZ" in values:
+        row["jarz_dg"] = convert(values["JARZ"][0])
+    best = best_estimate(results)
+    if best is not None:
+        row["method"], row["dg"], row["err"] = best[0], convert(best[1]), convert(best[2])
+    return row
+
+
+def plot_results(
+    plot_path: str,
+    wf: Iterable[float],
+    wr: Iterable[float],
+    results: dict[str, Any],
+    units: str = "kJ",
+    nbins: int = 20,
+    dpi: int = 300,
+) -> Optional[str]:
+    """Plot the work distributions with the PMX analyse plot, showing the BAR, CGI or JARZ estimate."""
+    # PMX imports matplotlib at import time: only import it when a plot is requested
+    from pmx.analysis import plot_work_dist
+
+    fact, label = unit_factor(units, results["temperature"])
+    best = best_estimate(results)
+    if best is None:
+        return None
+    _, dg, err = best
+    plot_work_dist(
+        fname=plot_path,
+        wf=list(wf),
+        wr=list(wr),
+        dG=dg * fact,
+        dGerr=err * fact if err is not None else None,
+        nbins=nbins,
+        dpi=dpi,
+        units=label,
+    )
+    return plot_path
+
+
+def read_works_file(works_path: str) -> list[float]:
+    """Read the work values of a PMX integrated work file, with a "name work" line per trajectory."""
+    with open(works_path) as works_file:
+        return [float(line.split()[1]) for line in works_file if line.strip()]
+
+
+def result_estimate(result_path: str) -> Optional[tuple[float, Optional[float], str]]:
+    """Read the estimate shown in the plot from a PMX analyse results file.
+
+    The estimators follow the PMX analyse hierarchy BAR > CGI > JARZ and the
+    errors blocks > bootstrap > analytical.
+
+    Returns:
+        tuple: The free energy and its standard error (None if not available) in the output units, and the units label; None without estimate.
+    """
+    values: dict[str, dict[str, float]] = {}
+    units = ""
+    with open(result_path) as result_file:
+        for line in result_file:
+            match = RESULT_LINE.match(line)
+            if match:
+                values.setdefault(match.group("estimator"), {})[match.group("error") or "dg"] = float(match.group("value"))
+                units = match.group("units")
+    for estimator, errors in PLOT_ERRORS.items():
+        if "dg" in values.get(estimator, {}):
+            err = next((values[estimator][error] for error in errors if error in values[estimator]), None)
+            return values[estimator]["dg"], err, units
+    return None
+
+
+def plot_result_file(plot_path: str, works_a_path: str, works_b_path: str, result_path: str, nbins: int = 20, dpi: int = 300) -> Optional[str]:
+    """Plot the work distributions of two PMX integrated work files with the estimate of the PMX analyse results file."""
+    from pmx.analysis import plot_work_dist
+
+    estimate = result_estimate(result_path)
+    if estimate is None:
+        return None
+    dg, err, units = estimate
+    plot_work_dist(fname=plot_path, wf=read_works_file(works_a_path), wr=read_works_file(works_b_path), dG=dg, dGerr=err, nbins=nbins, dpi=dpi, units=units)
+    return plot_path
@@ -0,0 +1,165 @@
+"""Parallel, reproducible and resumable bootstrap of the free energy estimators."""
+
+import hashlib
+import json
+import math
+import os
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+
+from biobb_pmx.pmxbiobb.common import cache_key
+from biobb_pmx.pmxbiobb.work_estimators import bar_conv_stacked, bar_dg_stacked, cgi_dg_stacked, jarz_dg_stacked, jarz_gauss_dg_stacked
+
+SeedType = Union[None, int, np.random.SeedSequence]
+
+# Maximum number of samples computed between two checkpoints
+CHECKPOINT_CHUNK = 50
+
+
+def _bootstrap_chunk(
+    wf: np.ndarray,
+    wr: np.ndarray,
+    temperature: float,
+    methods: Iterable[str],
+    dg_bar: Optional[float],
+    seeds: list[np.random.SeedSequence],
+) -> dict[str, np.ndarray]:
+    """Compute the estimators of a chunk of bootstrap samples, one seed stream per sample.
+
+    The samples of the chunk are drawn first and then stacked, so every
+    estimator is evaluated for the whole chunk in a single call.
+    """
+    m_f, s_f, m_r, s_r = np.mean(wf), np.std(wf), np.mean(wr), np.std(wr)
+    boot_f, boot_r, normal_f, normal_r = [], [], [], []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        boot_f.append(rng.choice(wf, size=len(wf), replace=True))
+        boot_r.append(rng.choice(wr, size=len(wr), replace=True))
+        if "cgi" in methods:
+            # Parametric bootstrap draws from the Gaussians fitted to the original work values
+            normal_f.append(rng.normal(m_f, s_f, len(wf)))
+            normal_r.append(rng.normal(m_r, s_r, len(wr)))
+    stacked_f, stacked_r = np.array(boot_f), np.array(boot_r)
+
+    samples: dict[str, np.ndarray] = {}
+    if "cgi" in methods:
+        samples["cgi_parametric"] = cgi_dg_stacked(np.array(normal_f), np.array(normal_r))[0]
+        samples["cgi"] = cgi_dg_stacked(stacked_f, stacked_r)[0]
+    if "bar" in methods:
+        samples["bar"] = bar_dg_stacked(stacked_f, stacked_r, temperature)
+        samples["bar_conv"] = bar_conv_stacked(np.full(len(seeds), dg_bar, dtype=np.float64), stacked_f, stacked_r, temperature)
+    if "jarz" in methods:
+        samples["jarz_for"] = jarz_dg_stacked(stacked_f, temperature)
+        samples["jarz_rev"] = jarz_dg_stacked(stacked_r, temperature, reverse=True)
+        samples["jarz_gauss_for"] = jarz_gauss_dg_stacked(stacked_f, temperature)
+        samples["jarz_gauss_rev"] = jarz_gauss_dg_stacked(stacked_r, temperature, reverse=True)
+    return samples
+
+
+def checkpoint_key(wf: np.ndarray, wr: np.ndarray, temperature: float, methods: Iterable[str], dg_bar: Optional[float], root: np.random.SeedSequence) -> str:
+    """Key of the bootstrap checkpoints: the work values, the estimators and the random streams of the samples."""
+    works = [hashlib.sha256(np.ascontiguousarray(w, dtype=np.float64).tobytes()).hexdigest() for w in (wf, wr)]
+    return cache_key("bootstrap", works, temperature, sorted(methods), dg_bar, str(root.entropy), list(root.spawn_key))
+
+
+def read_checkpoint(checkpoint_path: str) -> Optional[dict[str, Any]]:
+    """Read a bootstrap checkpoint file, None if it does not exist."""
+    if not Path(checkpoint_path).exists():
+        return None
+    with open(checkpoint_path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def write_checkpoint(checkpoint_path: str, key: str, root: np.random.SeedSequence, done: dict[int, dict[str, float]]) -> str:
+    """Atomically write the completed samples to a bootstrap checkpoint file."""
+    indices = sorted(done)
+    names = list(done[indices[0]]) if indices else []
+    checkpoint = {
+        "version": 1,
+        "key": key,
+        "entropy": str(root.entropy),
+        "spawn_key": list(root.spawn_key),
+        "index": indices,
+        "samples": {name: [done[index][name] for index in indices] for name in names},
+    }
+    tmp_path = Path(checkpoint_path).with_name(f".{Path(checkpoint_path).name}.tmp")
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(tmp_path, checkpoint_path)
+    return checkpoint_path
+
+
+def bootstrap_samples(
+    wf: np.ndarray,
+    wr: np.ndarray,
+    temperature: float,
+    nboots: int,
+    methods: Iterable[str] = ("cgi", "bar", "jarz"),
+    dg_bar: Optional[float] = None,
+    nworkers: int = 1,
+    seed: SeedType = None,
+    checkpoint_path: Optional[str] = None,
+) -> dict[str, np.ndarray]:
+    """Draw the bootstrap samples of the free energy estimators.
+
+    Every sample gets its own random stream spawned from ``seed``, so the
+    samples are bit-identical whatever the number of workers they are
+    distributed on. With a checkpoint file, the completed samples are saved
+    every CHECKPOINT_CHUNK samples at most, and a run with the same work
+    values, estimators and seed only computes the missing samples.
+
+    Args:
+        wf (numpy.ndarray): Forward work values.
+        wr (numpy.ndarray): Reverse work values.
+        temperature (float): Temperature in Kelvin.
+        nboots (int): Number of bootstrap samples.
+        methods (list): Estimators to bootstrap: cgi, bar and/or jarz.
+        dg_bar (float): BAR estimate of the original work values, used for the convergence measure.
+        nworkers (int): Number of worker processes.
+        seed (int): Seed (or numpy SeedSequence) of the random streams.
+        checkpoint_path (str): Path to the JSON checkpoint file of the completed samples.
+
+    Returns:
+        dict: Array of bootstrapped values for each estimator, in sample order.
+    """
+    methods = tuple(methods)
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    key = checkpoint_key(wf, wr, temperature, methods, dg_bar, root) if checkpoint_path else ""
+    seeds = root.spawn(nboots)
+
+    # Samples of a checkpoint with the same key are reused, whatever its number of samples
+    done: dict[int, dict[str, float]] = {}
+    checkpoint = read_checkpoint(checkpoint_path) if checkpoint_path else None
+    if checkpoint and checkpoint.get("key") == key:
+        for position, index in enumerate(checkpoint["index"]):
+            if index < nboots:
+                done[index] = {name: values[position] for name, values in checkpoint["samples"].items()}
+    missing = np.array([index for index in range(nboots) if index not in done], dtype=np.int64)
+
+    n_chunks = max(1, min(len(missing), nworkers * 4))
+    if checkpoint_path:
+        n_chunks = max(n_chunks, math.ceil(len(missing) / CHECKPOINT_CHUNK))
+    chunks = [indices for indices in np.array_split(missing, n_chunks) if len(indices)]
+    args = [(wf, wr, temperature, methods, dg_bar, [seeds[i] for i in indices]) for indices in chunks]
+
+    def merge(indices: np.ndarray, part: dict[str, np.ndarray]) -> None:
+        for position, index in enumerate(indices):
+            done[int(index)] = {name: float(values[position]) for name, values in part.items()}
+        if checkpoint_path:
+            write_checkpoint(checkpoint_path, key, root, done)
+
+    if nworkers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=nworkers) as pool:
+            futures = {pool.submit(_bootstrap_chunk, *arg): indices for arg, indices in zip(args, chunks)}
+            for future in as_completed(futures):
+                merge(futures[future], future.result())
+    else:
+        for arg, indices in zip(args, chunks):
+            merge(indices, _bootstrap_chunk(*arg))
+
+    names = list(done[0])
+    return {name: np.array([done[index][name] for index in range(nboots)]) for name in names}
@@ -0,0 +1,221 @@
+"""Vectorized block averaging and jackknife standard errors of the free energy estimators.
+
+All the block counts (and all the jackknife replicates) are evaluated at
+once from prefix sums of the work values, without Python loops over the
+blocks. Blocks follow the numpy.array_split layout used by PMX analyse,
+so the block errors match the ``nblocks`` errors of the analysis.
+"""
+
+from collections.abc import Iterable, Sequence
+
+import numpy as np
+from scipy.special import expit
+
+from biobb_pmx.pmxbiobb.work_estimators import KB, bar_dg, bar_dg_stacked, cgi_dg_moments
+
+ERROR_KEYS = ("cgi", "bar", "jarz_for", "jarz_rev", "jarz_gauss_for", "jarz_gauss_rev")
+
+
+def block_bounds(n: int, block_counts: Sequence[int]) -> tuple[np.ndarray, np.ndarray]:
+    """Start and end indices of the numpy.array_split blocks of n values, for every block count.
+
+    Returns:
+        tuple: The concatenated start and end indices of all the blocks, block count after block count.
+    """
+    starts, ends = [], []
+    for count in block_counts:
+        sizes = np.full(count, n // count)
+        sizes[: n % count] += 1
+        bounds = np.concatenate(([0], np.cumsum(sizes)))
+        starts.append(bounds[:-1])
+        ends.append(bounds[1:])
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def _block_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Sums of the values of every block, from a single prefix sum."""
+    prefix = np.concatenate(([0.0], np.cumsum(values)))
+    return prefix[ends] - prefix[starts]
+
+
+def _jarz_from_sums(exp_sums: np.ndarray, counts: np.ndarray, ref: float, temperature: float, c: float) -> np.ndarray:
+    return c * (ref - KB * temperature * np.log(exp_sums / counts))
+
+
+def _gauss_from_sums(s1: np.ndarray, s2: np.ndarray, counts: np.ndarray, shift: float, temperature: float, c: float) -> np.ndarray:
+    beta = 1.0 / (KB * temperature)
+    mean = s1 / counts
+    var = (s2 - s1**2 / counts) / (counts - 1)
+    return c * (mean + shift - beta * var * 0.5)
+
+
+def _moments(s1: np.ndarray, s2: np.ndarray, counts: np.ndarray, shift: float) -> tuple[np.ndarray, np.ndarray]:
+    """Mean and population standard deviation from the sums of the shifted values and their squares."""
+    mean = s1 / counts
+    return mean + shift, np.sqrt(np.maximum(s2 / counts - mean**2, 0.0))
+
+
+def _padded_blocks(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Stack the blocks of the values in a NaN padded (n_blocks, max_block_size) array."""
+    width = int(np.max(ends - starts))
+    index = starts[:, None] + np.arange(width)
+    blocks = values[np.minimum(index, len(values) - 1)]
+    return np.where(index < ends[:, None], blocks, np.nan)
+
+
+def block_estimates(
+    wf: np.ndarray, wr: np.ndarray, temperature: float, block_counts: Sequence[int], methods: Iterable[str] = ("cgi", "bar", "jarz")
+) -> dict[str, np.ndarray]:
+    """Estimate the free energy of every block, for all the block counts at once.
+
+    Returns:
+        dict: The estimates of all the blocks, block count after block count, for each estimator.
+    """
+    wf, wr = np.asarray(wf, dtype=np.float64), np.asarray(wr, dtype=np.float64)
+    methods = [method.lower() for method in methods]
+    beta = 1.0 / (KB * temperature)
+    start_f, end_f = block_bounds(len(wf), block_counts)
+    start_r, end_r = block_bounds(len(wr), block_counts)
+    count_f, count_r = (end_f - start_f).astype(np.float64), (end_r - start_r).astype(np.float64)
+
+    # Shifted values keep the sums of squares and exponentials well conditioned
+    shift_f, shift_r = np.mean(wf), np.mean(wr)
+    df, dr = wf - shift_f, wr - shift_r
+    sums = {
+        "f1": _block_sums(df, start_f, end_f),
+        "f2": _block_sums(df**2, start_f, end_f),
+        "r1": _block_sums(dr, start_r, end_r),
+        "r2": _block_sums(dr**2, start_r, end_r),
+    }
+
+    estimates: dict[str, np.ndarray] = {}
+    if "cgi" in methods:
+        m1, s1 = _moments(sums["f1"], sums["f2"], count_f, shift_f)
+        m2, s2 = _moments(sums["r1"], sums["r2"], count_r, shift_r)
+        estimates["cgi"] = cgi_dg_moments(m1, s1, m2, s2)[0]
+    if "bar" in methods:
+        estimates["bar"] = bar_dg_stacked(_padded_blocks(wf, start_f, end_f), _padded_blocks(wr, start_r, end_r), temperature)
+    if "jarz" in methods:
+        ref_f, ref_r = np.min(wf), np.min(-wr)
+        exp_f = _block_sums(np.exp(-beta * (wf - ref_f)), start_f, end_f)
+        exp_r = _block_sums(np.exp(-beta * (-wr - ref_r)), start_r, end_r)
+        estimates["jarz_for"] = _jarz_from_sums(exp_f, count_f, ref_f, temperature, 1.0)
+        estimates["jarz_rev"] = _jarz_from_sums(exp_r, count_r, ref_r, temperature, -1.0)
+        estimates["jarz_gauss_for"] = _gauss_from_sums(sums["f1"], sums["f2"], count_f, shift_f, temperature, 1.0)
+        estimates["jarz_gauss_rev"] = _gauss_from_sums(-sums["r1"], sums["r2"], count_r, -shift_r, temperature, -1.0)
+    return estimates
+
+
+def block_errors(
+    wf: np.ndarray, wr: np.ndarray, temperature: float, block_counts: Sequence[int], methods: Iterable[str] = ("cgi", "bar", "jarz")
+) -> dict[str, np.ndarray]:
+    """Standard error of the block estimates of each estimator, for each block count.
+
+    Returns:
+        dict: The block counts and, for each estimator, the standard error of the mean of its block estimates.
+    """
+    block_counts = [int(count) for count in block_counts if int(count) > 1]
+    if not block_counts:
+        return {"nblocks": np.array([], dtype=int)}
+    estimates = block_estimates(wf, wr, temperature, block_counts, methods)
+    counts = np.array(block_counts)
+    # The blocks are laid out block count after block count: one group per block count
+    groups = np.repeat(np.arange(len(counts)), counts)
+    errors: dict[str, np.ndarray] = {"nblocks": counts}
+    for key, values in estimates.items():
+        means = np.bincount(groups, weights=values, minlength=len(counts)) / counts
+        squares = np.bincount(groups, weights=(values - means[groups]) ** 2, minlength=len(counts))
+        errors[key] = np.sqrt(squares / (counts - 1) / counts)
+    return errors
+
+
+def _loo_sums(values: np.ndarray) -> np.ndarray:
+    return np.sum(values) - values
+
+
+def _jackknife_se(groups: Sequence[np.ndarray]) -> float:
+    """Jackknife standard error from the leave-one-out estimates of each independent sample."""
+    variance = 0.0
+    for replicates in groups:
+        n = len(replicates)
+        variance += (n - 1) / n * np.sum((replicates - np.mean(replicates)) ** 2)
+    return float(np.sqrt(variance))
+
+
+def _bar_loo(wf: np.ndarray, wr: np.ndarray, temperature: float, dg: float, iterations: int = 50, chunk: int = 1024) -> tuple[np.ndarray, np.ndarray]:
+    """Leave-one-out BAR estimates, solved with Newton iterations started from the full estimate."""
+    beta = 1.0 / (KB * temperature)
+    nf, nr = len(wf), len(wr)
+    results = []
+    for left_out, n_f, n_r in ((wf, nf - 1, nr), (wr, nf, nr - 1)):
+        m = KB * temperature * np.log(n_f / n_r)
+        is_forward = left_out is wf
+        replicates = np.empty(len(left_out))
+        for start in range(0, len(left_out), chunk):
+            omitted = left_out[start: start + chunk]
+            x = np.full(len(omitted), dg)
+            for _ in range(iterations):
+                ef = expit(-beta * (m + wf[None, :] - x[:, None]))
+                er = expit(beta * (m + wr[None, :] - x[:, None]))
+                g = ef.sum(axis=1) - er.sum(axis=1)
+                dg_dx = beta * ((ef * (1 - ef)).sum(axis=1) + (er * (1 - er)).sum(axis=1))
+                # Remove the contribution of the omitted work value
+                if is_forward:
+                    e = expit(-beta * (m + omitted - x))
+                    g -= e
+                    dg_dx -= beta * e * (1 - e)
+                else:
+                    e = expit(beta * (m + omitted - x))
+                    g += e
+                    dg_dx -= beta * e * (1 - e)
+                step = g / dg_dx
+                x -= step
+                if np.max(np.abs(step)) < 1e-10:
+                    break
+            replicates[start: start + chunk] = x
+        results.append(replicates)
+    return results[0], results[1]
+
+
+def jackknife_errors(wf: np.ndarray, wr: np.ndarray, temperature: float, methods: Iterable[str] = ("cgi", "bar", "jarz")) -> dict[str, float]:
+    """Jackknife standard errors of the estimators, from all the leave-one-out replicates at once."""
+    wf, wr = np.asarray(wf, dtype=np.float64), np.asarray(wr, dtype=np.float64)
+    methods = [method.lower() for method in methods]
+    beta = 1.0 / (KB * temperature)
+    nf, nr = float(len(wf)), float(len(wr))
+    shift_f, shift_r = np.mean(wf), np.mean(wr)
+    df, dr = wf - shift_f, wr - shift_r
+    f1, f2 = _loo_sums(df), _loo_sums(df**2)
+    r1, r2 = _loo_sums(dr), _loo_sums(dr**2)
+
+    errors: dict[str, float] = {}
+    if "cgi" in methods:
+        m1, s1 = _moments(np.sum(df), np.sum(df**2), nf, shift_f)
+        m2, s2 = _moments(np.sum(dr), np.sum(dr**2), nr, shift_r)
+        loo_m1, loo_s1 = _moments(f1, f2, nf - 1, shift_f)
+        loo_m2, loo_s2 = _moments(r1, r2, nr - 1, shift_r)
+        errors["cgi"] = _jackknife_se((cgi_dg_moments(loo_m1, loo_s1, m2, s2)[0], cgi_dg_moments(m1, s1, loo_m2, loo_s2)[0]))
+    if "bar" in methods:
+        errors["bar"] = _jackknife_se(_bar_loo(wf, wr, temperature, bar_dg(wf, wr, temperature)))
+    if "jarz" in methods:
+        ref_f, ref_r = np.min(wf), np.min(-wr)
+        exp_f = _loo_sums(np.exp(-beta * (wf - ref_f)))
+        exp_r = _loo_sums(np.exp(-beta * (-wr - ref_r)))
+        errors["jarz_for"] = _jackknife_se((_jarz_from_sums(exp_f, nf - 1, ref_f, temperature, 1.0),))
+        errors["jarz_rev"] = _jackknife_se((_jarz_from_sums(exp_r, nr - 1, ref_r, temperature, -1.0),))
+        errors["jarz_gauss_for"] = _jackknife_se((_gauss_from_sums(f1, f2, nf - 1, shift_f, temperature, 1.0),))
+        errors["jarz_gauss_rev"] = _jackknife_se((_gauss_from_sums(-r1, r2, nr - 1, -shift_r, temperature, -1.0),))
+    return errors
+
+
+def write_errors(errors_path: str, blocks: dict[str, np.ndarray], jackknife: dict[str, float], n_forward: int, n_reverse: int, fact: float = 1.0) -> str:
+    """Write the block errors for each block count and the jackknife errors to a CSV table."""
+    keys = [key for key in ERROR_KEYS if key in jackknife or key in blocks]
+    with open(errors_path, "w") as errors_file:
+        errors_file.write(",".join(["nblocks", "block_size_forward", "block_size_reverse", *keys]) + "\n")
+        for row, count in enumerate(blocks["nblocks"]):
+            values = [f"{blocks[key][row] * fact:.6g}" for key in keys]
+            errors_file.write(",".join([str(count), str(n_forward // count), str(n_reverse // count), *values]) + "\n")
+        values = [f"{jackknife[key] * fact:.6g}" if key in jackknife else "" for key in keys]
+        errors_file.write(",".join(["jackknife", "1", "1", *values]) + "\n")
+    return errors_path
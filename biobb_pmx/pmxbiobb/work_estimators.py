@@ -0,0 +1,258 @@
+"""Free energy estimators of non-equilibrium work values.
+
+NumPy ports of the CGI, BAR and Jarzynski estimators of the PMX analyse
+module, so the analysis can run in-process without importing matplotlib.
+Forward (wf) and reverse (wr) work values follow the PMX sign conventions.
+
+The estimators work on stacked arrays: the work values of many edges (or
+bootstrap samples, or blocks) are NaN padded into (n_rows, max_n) arrays and
+all the rows are estimated in one call. The single edge functions are thin
+wrappers of the stacked ones.
+"""
+
+from collections.abc import Sequence
+from functools import lru_cache
+
+import numpy as np
+from scipy.special import erf, expit, logsumexp
+
+# Boltzmann constant in kJ/(K*mol), as used by PMX
+KB = 0.00831447215
+
+
+def stack_works(works: Sequence[Sequence[float]]) -> np.ndarray:
+    """Stack the work values of many edges in a NaN padded (n_edges, max_n) array."""
+    width = max((len(w) for w in works), default=0)
+    stacked = np.full((len(works), width), np.nan)
+    for row, w in enumerate(works):
+        stacked[row, : len(w)] = w
+    return stacked
+
+
+def _counts(w: np.ndarray) -> np.ndarray:
+    return np.sum(~np.isnan(w), axis=1)
+
+
+def jarz_dg_stacked(w: np.ndarray, temperature: float, reverse: bool = False) -> np.ndarray:
+    """Jarzynski free energy estimates of the rows of a NaN padded work array.
+
+    The exponential average is taken with a log-sum-exp, so it neither
+    overflows nor underflows whatever the spread of the work values.
+    """
+    c = -1.0 if reverse else 1.0
+    beta = 1.0 / (KB * temperature)
+    w = np.atleast_2d(w)
+    exponent = np.where(np.isnan(w), -np.inf, -beta * c * w)
+    with np.errstate(divide="ignore"):
+        dg = -KB * temperature * (logsumexp(exponent, axis=1) - np.log(_counts(w)))
+    return c * dg
+
+
+def jarz_gauss_dg_stacked(w: np.ndarray, temperature: float, reverse: bool = False) -> np.ndarray:
+    """Jarzynski estimates with a Gaussian approximation of the work distributions of the rows of a NaN padded work array."""
+    c = -1.0 if reverse else 1.0
+    beta = 1.0 / (KB * temperature)
+    w = np.atleast_2d(w)
+    return c * (np.nanmean(c * w, axis=1) - beta * np.nanvar(w, axis=1, ddof=1) * 0.5)
+
+
+def jarz_gauss_err_stacked(w: np.ndarray, temperature: float) -> np.ndarray:
+    """Analytical standard errors of the Gaussian Jarzynski estimates (Hummer, 2001) of the rows of a NaN padded work array."""
+    beta = 1.0 / (KB * temperature)
+    w = np.atleast_2d(w)
+    w_var = np.nanvar(w, axis=1, ddof=1)
+    n = _counts(w).astype(np.float64)
+    return np.sqrt(w_var / n + np.power(beta * w_var, 2) / (2.0 * (n - 1.0)))
+
+
+def cgi_dg_stacked(wf: np.ndarray, wr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Closed-form Crooks Gaussian Intersection estimates of the rows of NaN padded forward and reverse work arrays.
+
+    Returns:
+        tuple: The free energy estimates and whether each intersection could be taken.
+    """
+    wf, wr = np.atleast_2d(wf), np.atleast_2d(wr)
+    return cgi_dg_moments(np.nanmean(wf, axis=1), np.nanstd(wf, axis=1), np.nanmean(wr, axis=1), np.nanstd(wr, axis=1))
+
+
+def bar_dg_stacked(wf: np.ndarray, wr: np.ndarray, temperature: float, tol: float = 1e-10, iterations: int = 100) -> np.ndarray:
+    """Bennett Acceptance Ratio estimates of the rows of NaN padded forward and reverse work arrays.
+
+    The BAR equation of every row is solved at once with a safeguarded
+    Newton iteration: Newton steps falling outside the bracket of the root
+    are replaced by bisection steps, and only the rows that have not
+    converged are updated.
+    """
+    beta = 1.0 / (KB * temperature)
+    wf, wr = np.atleast_2d(wf), np.atleast_2d(wr)
+    m = KB * temperature * np.log(_counts(wf) / _counts(wr))
+    with np.errstate(invalid="ignore"):
+        x0 = (np.nanmean(wf, axis=1) + np.nanmean(wr, axis=1)) / 2.0
+    # Padding values give zero terms in the Fermi sums and their derivatives
+    wf = np.where(np.isnan(wf), np.inf, wf)
+    wr = np.where(np.isnan(wr), -np.inf, wr)
+    finite = np.concatenate((np.where(np.isinf(wf), 0.0, wf), np.where(np.isinf(wr), 0.0, wr)), axis=1)
+    spread = np.max(np.abs(finite), axis=1)
+    low = -spread - np.abs(m) - 100.0 / beta
+    high = spread + np.abs(m) + 100.0 / beta
+    x = np.clip(x0, low, high)
+
+    active = np.flatnonzero(np.isfinite(m))
+    for _ in range(iterations):
+        if not len(active):
+            break
+        xa, ma = x[active, None], m[active, None]
+        sf = expit(-beta * (ma + wf[active] - xa))
+        sr = expit(beta * (ma + wr[active] - xa))
+        f = np.sum(sf, axis=1) - np.sum(sr, axis=1)
+        df = beta * (np.sum(sf * (1.0 - sf), axis=1) + np.sum(sr * (1.0 - sr), axis=1))
+        # The Fermi sum difference increases with x
+        high[active] = np.where(f > 0, x[active], high[active])
+        low[active] = np.where(f > 0, low[active], x[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = x[active] - f / df
+        converged = (f == 0) | (np.abs(newton - x[active]) <= tol * (1.0 + np.abs(x[active])))
+        inside = (df > 0) & (newton > low[active]) & (newton < high[active])
+        x[active] = np.where(converged & np.isfinite(newton), newton, np.where(inside, newton, (low[active] + high[active]) * 0.5))
+        active = active[~converged]
+    x[~np.isfinite(m)] = np.nan
+    return x
+
+
+def bar_err_stacked(dg: np.ndarray, wf: np.ndarray, wr: np.ndarray, temperature: float) -> np.ndarray:
+    """Analytical standard errors of the BAR estimates of the rows of NaN padded work arrays."""
+    wf, wr = np.atleast_2d(wf), np.atleast_2d(wr)
+    nf, nr = _counts(wf).astype(np.float64), _counts(wr).astype(np.float64)
+    beta = 1.0 / (KB * temperature)
+    m = KB * temperature * np.log(nf / nr)
+    n = nf + nr
+    dg = np.asarray(dg, dtype=np.float64)[:, None]
+    with np.errstate(over="ignore"):
+        terms_f = 1.0 / (2 + 2 * np.cosh(beta * (m[:, None] + np.where(np.isnan(wf), np.inf, wf) - dg)))
+        terms_r = 1.0 / (2 + 2 * np.cosh(beta * (m[:, None] + np.where(np.isnan(wr), np.inf, wr) - dg)))
+    err = (np.sum(terms_f, axis=1) + np.sum(terms_r, axis=1)) / n
+    return np.sqrt(1 / (beta**2 * n) * (1.0 / err - (n / nf + n / nr)))
+
+
+def bar_conv_stacked(dg: np.ndarray, wf: np.ndarray, wr: np.ndarray, temperature: float) -> np.ndarray:
+    """BAR convergence measures (Hahn & Then) of the rows of NaN padded work arrays, the closer to zero the better."""
+    wf, wr = np.atleast_2d(wf), np.atleast_2d(wr)
+    beta = 1.0 / (KB * temperature)
+    nf, nr = _counts(wf), _counts(wr)
+    n = (nf + nr).astype(np.float64)
+    ratio_alpha, ratio_beta = (nf / n)[:, None], (nr / n)[:, None]
+    dg = np.asarray(dg, dtype=np.float64)[:, None]
+    with np.errstate(over="ignore"):
+        bf = 1.0 / (ratio_beta + ratio_alpha * np.exp(beta * (wf - dg)))
+        tf = 1.0 / (ratio_alpha + ratio_beta * np.exp(beta * (-wr + dg)))
+    ua = (np.nanmean(tf, axis=1) + np.nanmean(bf, axis=1)) / 2.0
+    ua2 = ratio_alpha[:, 0] * np.nanmean(np.power(tf, 2), axis=1) + ratio_beta[:, 0] * np.nanmean(np.power(bf, 2), axis=1)
+    return (ua - ua2) / ua
+
+
+def jarz_dg(w: np.ndarray, temperature: float, reverse: bool = False) -> float:
+    """Jarzynski free energy estimate of the forward or reverse work values."""
+    return float(jarz_dg_stacked(np.asarray(w, dtype=np.float64), temperature, reverse)[0])
+
+
+def jarz_gauss_dg(w: np.ndarray, temperature: float, reverse: bool = False) -> float:
+    """Jarzynski free energy estimate with a Gaussian approximation of the work distribution."""
+    return float(jarz_gauss_dg_stacked(np.asarray(w, dtype=np.float64), temperature, reverse)[0])
+
+
+def jarz_gauss_err(w: np.ndarray, temperature: float) -> float:
+    """Analytical standard error of the Gaussian Jarzynski estimate (Hummer, 2001)."""
+    return float(jarz_gauss_err_stacked(np.asarray(w, dtype=np.float64), temperature)[0])
+
+
+def cgi_dg(wf: np.ndarray, wr: np.ndarray) -> tuple[float, bool]:
+    """Crooks Gaussian Intersection estimate.
+
+    Returns:
+        tuple: The free energy estimate and whether the intersection could be
+        taken; if not, the estimate is the average of the Gaussian means.
+    """
+    dg, intersection = cgi_dg_moments(np.mean(wf), np.std(wf), np.mean(wr), np.std(wr))
+    return float(dg), bool(intersection)
+
+
+def cgi_dg_moments(m1: np.ndarray, s1: np.ndarray, m2: np.ndarray, s2: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Crooks Gaussian Intersection estimates from the means and standard deviations of many work distributions at once.
+
+    Returns:
+        tuple: The free energy estimates and whether each intersection could be taken.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p1 = m1 / s1**2 - m2 / s2**2
+        p2 = np.sqrt(1 / (s1**2 * s2**2) * (m1 - m2) ** 2 + 2 * (1 / s1**2 - 1 / s2**2) * np.log(s2 / s1))
+        p3 = 1 / s1**2 - 1 / s2**2
+        x1, x2 = (p1 + p2) / p3, (p1 - p2) / p3
+    in1 = ((m1 < x1) & (x1 < m2)) | ((m2 < x1) & (x1 < m1))
+    in2 = ((m1 < x2) & (x2 < m2)) | ((m2 < x2) & (x2 < m1))
+    dg = np.where(in1, x1, np.where(in2, x2, (m1 + m2) * 0.5))
+    return dg, in1 | in2
+
+
+def bar_dg(wf: np.ndarray, wr: np.ndarray, temperature: float) -> float:
+    """Bennett Acceptance Ratio estimate, the root of the BAR equation."""
+    return float(bar_dg_stacked(np.asarray(wf, dtype=np.float64), np.asarray(wr, dtype=np.float64), temperature)[0])
+
+
+def bar_err(dg: float, wf: np.ndarray, wr: np.ndarray, temperature: float) -> float:
+    """Analytical standard error of the BAR estimate."""
+    return float(bar_err_stacked(np.array([dg]), np.asarray(wf, dtype=np.float64), np.asarray(wr, dtype=np.float64), temperature)[0])
+
+
+def bar_conv(dg: float, wf: np.ndarray, wr: np.ndarray, temperature: float) -> float:
+    """BAR convergence measure (Hahn & Then), the closer to zero the better."""
+    return float(bar_conv_stacked(np.array([dg]), np.asarray(wf, dtype=np.float64), np.asarray(wr, dtype=np.float64), temperature)[0])
+
+
+def _kolmogorov_q(lam: np.ndarray) -> np.ndarray:
+    """Kolmogorov distribution evaluated with the same series PMX uses."""
+    k = np.arange(-10000, 10000, dtype=np.float64)
+    sign = np.where(k % 2 == 0, 1.0, -1.0)
+    lam = np.atleast_1d(lam)
+    q = np.empty(len(lam))
+    for start in range(0, len(lam), 100):
+        chunk = lam[start: start + 100, None]
+        q[start: start + 100] = np.sum(sign * np.exp(-2.0 * k**2 * chunk**2), axis=1)
+    return q
+
+
+@lru_cache(maxsize=None)
+def _ks_lambda0(alpha: float) -> float:
+    lambdas = np.arange(0.25, 2.5, 0.001)
+    return float(lambdas[np.argmax(_kolmogorov_q(lambdas) > 1 - alpha)])
+
+
+def ks_norm_test_stacked(w: np.ndarray, alpha: float = 0.05) -> tuple[np.ndarray, float, np.ndarray, np.ndarray]:
+    """Kolmogorov-Smirnov tests of normality of the rows of a NaN padded work array.
+
+    Returns:
+        tuple: The gaussian quality of each row, the reference lambda0, the
+        sqrt(N)*Dmax statistic of each row and whether each test was passed.
+    """
+    data = np.sort(np.atleast_2d(w), axis=1)
+    n = _counts(data)[:, None]
+    position = np.arange(1, data.shape[1] + 1)
+    edf = position / n
+    mean, std = np.nanmean(data, axis=1)[:, None], np.nanstd(data, axis=1)[:, None]
+    cdf = 0.5 * (1 + erf((data - mean) / (std * np.sqrt(2))))
+    # NaN padding is sorted last: only the first n positions of each row are compared
+    d1 = np.max(np.where(position <= n, np.abs(edf - cdf), 0.0), axis=1, initial=0.0)
+    d2 = np.max(np.where(position[1:] <= n, np.abs(edf[:, :-1] - cdf[:, 1:]), 0.0), axis=1, initial=0.0)
+    check = np.sqrt(n[:, 0]) * np.maximum(d1, d2)
+    lam0 = _ks_lambda0(alpha)
+    return 1 - _kolmogorov_q(check), lam0, check, check < lam0
+
+
+def ks_norm_test(w: np.ndarray, alpha: float = 0.05) -> tuple[float, float, float, bool]:
+    """Kolmogorov-Smirnov test of normality of a work distribution.
+
+    Returns:
+        tuple: The gaussian quality, the reference lambda0, the sqrt(N)*Dmax
+        statistic and whether the test was passed.
+    """
+    q, lam0, check, passed = ks_norm_test_stacked(np.asarray(w, dtype=np.float64), alpha)
+    return float(q[0]), lam0, float(check[0]), bool(passed[0])
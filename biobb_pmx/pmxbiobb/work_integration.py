@@ -0,0 +1,227 @@
+"""Batched integration of dgdl curves into non-equilibrium work values."""
+
+from collections.abc import Callable, Sequence
+from typing import Optional
+
+import numpy as np
+from scipy.integrate import simpson
+
+from biobb_pmx.pmxbiobb.xvg_io import iter_xvg_zip, parse_xvg
+
+
+def stack_dgdl(curves: Sequence[np.ndarray], dtype=np.float64) -> tuple[np.ndarray, np.ndarray]:
+    """Stack the dgdl columns of several xvg curves in a NaN padded 2-D array.
+
+    Args:
+        curves (list): Arrays of shape (n_frames, 2) with the time and dgdl values of each trajectory.
+        dtype (numpy.dtype): Data type of the stacked array.
+
+    Returns:
+        tuple: The (n_curves, max_frames) dgdl array and the number of frames of each curve.
+    """
+    lengths = np.array([len(curve) for curve in curves], dtype=np.int64)
+    dgdl = np.full((len(curves), lengths.max(initial=0)), np.nan, dtype=dtype)
+    for row, curve in enumerate(curves):
+        dgdl[row, : lengths[row]] = curve[:, 1]
+    return dgdl, lengths
+
+
+def reference_mask(last_times: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Select the trajectories PMX analyse would integrate.
+
+    The first full-length (longest in time) trajectory sets the reference
+    number of frames: trajectories before it and trajectories with a
+    different number of frames are discarded.
+    """
+    ref_idx = int(np.argmax(last_times))
+    mask = lengths == lengths[ref_idx]
+    mask[:ref_idx] = False
+    return mask
+
+
+def integrate_works(dgdl: np.ndarray, lengths: np.ndarray, lambda0: int = 0, invert_values: bool = False) -> np.ndarray:
+    """Integrate each row of a padded dgdl array with the Simpson's rule over the lambda path.
+
+    Time-aligned rows are integrated together in a single vectorized call,
+    ragged inputs are integrated in one call per distinct number of frames.
+
+    Args:
+        dgdl (numpy.ndarray): Padded (n_curves, max_frames) dgdl array.
+        lengths (numpy.ndarray): Number of valid frames of each row.
+        lambda0 (int): Lambda value at the start of the transitions (0 or 1).
+        invert_values (bool): Whether to invert the sign of the work values.
+
+    Returns:
+        numpy.ndarray: The work value of each row.
+    """
+    works = np.empty(len(lengths), dtype=np.float64)
+    for n_frames in np.unique(lengths):
+        rows = lengths == n_frames
+        block = dgdl[rows, :n_frames]
+        lambdas = np.arange(n_frames) / n_frames
+        if lambda0 == 1:
+            # lambda goes from 1 to 0: reverse both arrays to integrate on an ascending path
+            lambdas = (1.0 - lambdas)[::-1]
+            block = block[:, ::-1]
+        # Reduced precision blocks are integrated in their own precision, without a float64 copy
+        works[rows] = simpson(block, x=lambdas.astype(block.dtype, copy=False), axis=1)
+    return -works if invert_values else works
+
+
+def integrate_curves(
+    curves: Sequence[np.ndarray], lambda0: int = 0, invert_values: bool = False, ragged: bool = False
+) -> tuple[np.ndarray, np.ndarray]:
+    """Compute the work values of a list of xvg curves in one batched pass.
+
+    Args:
+        curves (list): Arrays of shape (n_frames, 2) with the time and dgdl values of each trajectory.
+        lambda0 (int): Lambda value at the start of the transitions (0 or 1).
+        invert_values (bool): Whether to invert the sign of the work values.
+        ragged (bool): Integrate every curve over its own length instead of discarding the curves that do not match the reference length.
+
+    Returns:
+        tuple: The work values of the kept curves and the boolean mask of the kept curves.
+    """
+    dgdl, lengths = stack_dgdl(curves, curves[0].dtype if len(curves) else np.float64)
+    if ragged:
+        mask = np.ones(len(curves), dtype=bool)
+    else:
+        last_times = np.array([curve[-1, 0] for curve in curves])
+        mask = reference_mask(last_times, lengths)
+    return integrate_works(dgdl[mask], lengths[mask], lambda0, invert_values), mask
+
+
+def decimation_error(curves: Sequence[np.ndarray], lambda0: int = 0, invert_values: bool = False) -> np.ndarray:
+    """Estimate the integration error of decimated curves from the work values of the curves decimated twice as much.
+
+    The difference between the works integrated with every frame and with
+    every other frame of the decimated curves bounds the error added by the
+    decimation, as long as the curves are resolved at the coarser spacing.
+
+    Returns:
+        numpy.ndarray: The absolute error estimate of the work value of each curve.
+    """
+    works, _ = integrate_curves(curves, lambda0, invert_values, ragged=True)
+    coarse, _ = integrate_curves([curve[::2] for curve in curves], lambda0, invert_values, ragged=True)
+    return np.abs(works - coarse)
+
+
+def log_decimation_error(
+    curves: Sequence[np.ndarray], lambda0: int, invert_values: bool, decimate: int, log: Optional[Callable[[str], None]] = None
+) -> Optional[np.ndarray]:
+    """Log the integration error estimate of curves decimated by a factor larger than one."""
+    if decimate <= 1 or not log or not len(curves):
+        return None
+    errors = decimation_error(curves, lambda0, invert_values)
+    log(f"Decimation by {decimate}: estimated integration error of the work values: mean {np.mean(errors):.4g}, max {np.max(errors):.4g} kJ/mol")
+    return errors
+
+
+def read_zip_curves(
+    zip_path: str, names: Sequence[str], log: Optional[Callable[[str], None]] = None, decimate: int = 1, dtype=np.float64
+) -> list[tuple[str, np.ndarray]]:
+    """Parse the selected dgdl.xvg members of a zip file, a tar archive, a directory or a glob pattern, skipping the unreadable ones and the ones with NaN or infinite values.
+
+    Args:
+        zip_path (str): Path to the zip file, tar archive, directory or glob pattern of the dgdl.xvg files.
+        names (list): Selected members of the source.
+        log (callable): Function logging the skipped trajectories.
+        decimate (int): Keep one frame every decimate frames, dropping the other lines before parsing them.
+        dtype (numpy.dtype): Data type of the parsed curves, float32 halves their memory use.
+
+    Returns:
+        list: The name and the (n_frames, 2) time and dgdl array of each readable member.
+    """
+    curves = []
+    for name, member in iter_xvg_zip(zip_path, names):
+        try:
+            curves.append((name, parse_xvg(member, decimate, dtype)))
+        except ValueError as error:
+            if log:
+                log(f"Skipping {name}: unable to read the dgdl values ({error})")
+    # Tar members are read in the order of the archive
+    order = {name: position for position, name in enumerate(names)}
+    curves.sort(key=lambda curve: order[curve[0]])
+    return curves
+
+
+def zip_works(
+    zip_path: str,
+    names: Sequence[str],
+    lambda0: int = 0,
+    invert_values: bool = False,
+    log: Optional[Callable[[str], None]] = None,
+    decimate: int = 1,
+    dtype=np.float64,
+) -> tuple[list[str], list[float], list[int]]:
+    """Read the selected dgdl.xvg members of a zip file and integrate them as PMX analyse does.
+
+    Args:
+        zip_path (str): Path to the zip file with the dgdl.xvg files.
+        names (list): Selected members of the zip file.
+        lambda0 (int): Lambda value at the start of the transitions (0 or 1).
+        invert_values (bool): Whether to invert the sign of the work values.
+        log (callable): Function logging the skipped trajectories.
+        decimate (int): Keep one frame every decimate frames.
+        dtype (numpy.dtype): Data type of the parsed curves.
+
+    Returns:
+        tuple: The names, the work values and the number of frames of the integrated trajectories.
+    """
+    curves = read_zip_curves(zip_path, names, log, decimate, dtype)
+    if not curves:
+        raise ValueError(f"No valid dgdl.xvg files found in {zip_path}")
+    log_decimation_error([data for _, data in curves], lambda0, invert_values, decimate, log)
+
+    # Trajectories not matching the reference length are discarded as in PMX analyse
+    works, mask = integrate_curves([data for _, data in curves], lambda0, invert_values)
+    if log:
+        for (name, data), kept in zip(curves, mask):
+            if not kept:
+                log(f"Skipping {name}: {len(data)} data points do not match the reference trajectory")
+    kept_curves = [(name, data) for (name, data), kept in zip(curves, mask) if kept]
+    return [name for name, _ in kept_curves], works.tolist(), [len(data) for _, data in kept_curves]
+
+
+def zip_work_table(
+    zip_path: str,
+    names: Sequence[str],
+    lambda0: int = 0,
+    invert_values: bool = False,
+    log: Optional[Callable[[str], None]] = None,
+    decimate: int = 1,
+    dtype=np.float64,
+) -> dict[str, np.ndarray]:
+    """Read and integrate every selected dgdl.xvg member of a zip file once, each over its own length.
+
+    The reference length rule of PMX analyse is not applied, so any subset
+    of the trajectories can later be taken with :func:`table_works`.
+
+    Returns:
+        dict: The names, work values, number of frames and last time of the readable trajectories.
+    """
+    curves = read_zip_curves(zip_path, names, log, decimate, dtype)
+    if not curves:
+        raise ValueError(f"No valid dgdl.xvg files found in {zip_path}")
+    log_decimation_error([data for _, data in curves], lambda0, invert_values, decimate, log)
+    works, _ = integrate_curves([data for _, data in curves], lambda0, invert_values, ragged=True)
+    return {
+        "names": np.array([name for name, _ in curves]),
+        "works": works,
+        "frames": np.array([len(data) for _, data in curves], dtype=np.int64),
+        "last_times": np.array([data[-1, 0] for _, data in curves]),
+    }
+
+
+def table_works(table: dict[str, np.ndarray], names: Sequence[str]) -> tuple[list[str], np.ndarray, list[int]]:
+    """Take the work values of a subset of the trajectories of a work table, applying the PMX reference length rule to the subset.
+
+    Returns:
+        tuple: The names, the work values and the number of frames of the kept trajectories.
+    """
+    position = {name: row for row, name in enumerate(table["names"])}
+    rows = np.array([position[name] for name in names if name in position], dtype=np.int64)
+    if not len(rows):
+        raise ValueError("No valid dgdl.xvg files found in the trajectory subset")
+    rows = rows[reference_mask(table["last_times"][rows], table["frames"][rows])]
+    return table["names"][rows].tolist(), table["works"][rows], table["frames"][rows].tolist()
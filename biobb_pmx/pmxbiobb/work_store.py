@@ -0,0 +1,74 @@
+"""Compact binary store of integrated work values, readable with memory mapping."""
+
+from collections.abc import Sequence
+
+import numpy as np
+
+from biobb_pmx.pmxbiobb.xvg_io import xvg_member_infos
+
+# State of the transitions: forward (0->1) from the A zip, reverse (1->0) from the B zip
+FORWARD, REVERSE = 0, 1
+
+
+def store_dtype(name_length: int) -> np.dtype:
+    """Record type of the work store: one fixed-size record per trajectory."""
+    return np.dtype(
+        [
+            ("state", np.uint8),
+            ("name", f"U{max(name_length, 1)}"),
+            ("work", np.float64),
+            ("frames", np.int64),
+            ("crc32", np.uint32),
+        ]
+    )
+
+
+def write_work_store(
+    store_path: str,
+    zip_paths: Sequence[str],
+    names: Sequence[Sequence[str]],
+    works: Sequence[Sequence[float]],
+    frames: Sequence[Sequence[int]],
+) -> str:
+    """Write the work values of the forward and reverse trajectories to a NumPy .npy store.
+
+    Each record holds the state, the trajectory name, its work value in
+    kJ/mol, its number of frames and the CRC-32 of the source xvg file, as
+    recorded in its zip file.
+
+    Args:
+        store_path (str): Path to the .npy store.
+        zip_paths (list): Zip files of the forward and reverse trajectories.
+        names (list): Names of the forward and reverse trajectories.
+        works (list): Work values of the forward and reverse trajectories.
+        frames (list): Number of frames of the forward and reverse trajectories.
+
+    Returns:
+        str: The path to the store.
+    """
+    length = max((len(name) for state_names in names for name in state_names), default=1)
+    n_records = sum(len(state_names) for state_names in names)
+    store = np.lib.format.open_memmap(store_path, mode="w+", dtype=store_dtype(length), shape=(n_records,))
+    start = 0
+    for state, (zip_path, state_names, state_works, state_frames) in enumerate(zip(zip_paths, names, works, frames)):
+        infos = xvg_member_infos(zip_path)
+        end = start + len(state_names)
+        store["state"][start:end] = state
+        store["name"][start:end] = state_names
+        store["work"][start:end] = state_works
+        store["frames"][start:end] = state_frames
+        store["crc32"][start:end] = [infos[name].CRC for name in state_names]
+        start = end
+    store.flush()
+    del store
+    return store_path
+
+
+def load_work_store(store_path: str, mmap: bool = True) -> np.ndarray:
+    """Open a work store, memory mapped by default so only the accessed records are read."""
+    return np.load(store_path, mmap_mode="r" if mmap else None)
+
+
+def store_works(store: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the forward and reverse work values of a work store."""
+    return store["work"][store["state"] == FORWARD], store["work"][store["state"] == REVERSE]
@@ -0,0 +1,274 @@
+"""Streaming readers of the GROMACS dgdl.xvg files used by the PMX analyse building block.
+
+The dgdl.xvg files can be read from a zip file, a tar archive (optionally
+compressed), a directory or a glob pattern, and each file may itself be
+gzip, xz or bzip2 compressed: members are decompressed on the fly, in
+memory, while they are read.
+"""
+
+import bz2
+import glob
+import gzip
+import io
+import itertools
+import lzma
+import re
+import tarfile
+import zipfile
+import zlib
+from collections.abc import Iterable, Iterator
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, NamedTuple, Optional, Union
+
+import numpy as np
+
+from biobb_pmx.pmxbiobb.common import cache_key, file_digest
+
+# Files of this size or smaller are considered empty, as in the original unzip based filter
+MIN_XVG_SIZE = 10
+
+# Compressed members are decompressed with the module matching their suffix
+COMPRESSIONS = {".gz": gzip, ".xz": lzma, ".bz2": bz2}
+# Files of a directory read as dgdl.xvg files
+XVG_SUFFIXES = (".xvg",) + tuple(f".xvg{suffix}" for suffix in COMPRESSIONS)
+
+
+class MemberInfo(NamedTuple):
+    """Entry of a dgdl.xvg file of a tar archive, a directory or a glob pattern.
+
+    The CRC field is a CRC-32 stamp of the size and modification time of the
+    file, so modified files can be detected without reading them.
+    """
+
+    filename: str
+    file_size: int
+    CRC: int
+
+
+def _stamp(size: int, mtime: float) -> int:
+    return zlib.crc32(f"{size}:{mtime}".encode())
+
+
+def _decompressed(name: str, stream: IO[bytes]) -> IO[bytes]:
+    """Wrap the stream of a compressed member in a decompressing reader."""
+    module = COMPRESSIONS.get(PurePosixPath(name).suffix)
+    return module.open(stream) if module else stream  # type: ignore[attr-defined]
+
+
+def is_compressed(name: str) -> bool:
+    """Whether a member is gzip, xz or bzip2 compressed, according to its suffix."""
+    return PurePosixPath(name).suffix in COMPRESSIONS
+
+
+class XvgSource:
+    """Read-only access to the dgdl.xvg files of a zip file, a tar archive, a directory or a glob pattern.
+
+    Members are identified by their name in the archive, or by their path
+    relative to the directory or to the fixed part of the glob pattern.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = str(path)
+        self._handle: Optional[Union[zipfile.ZipFile, tarfile.TarFile]] = None
+        self._infos: Optional[dict[str, Any]] = None
+        source = Path(self.path)
+        if source.is_dir():
+            self.kind, self.root = "dir", source
+        elif source.is_file() and zipfile.is_zipfile(source):
+            self.kind, self.root = "zip", source
+        elif source.is_file() and tarfile.is_tarfile(source):
+            self.kind, self.root = "tar", source
+        elif glob.has_magic(self.path):
+            # The members are named relative to the directory before the first wildcard
+            fixed = []
+            for part in source.parts:
+                if glob.has_magic(part):
+                    break
+                fixed.append(part)
+            self.kind, self.root = "glob", Path(*fixed) if fixed else Path(".")
+        else:
+            raise ValueError(f"{self.path} is not a zip file, a tar archive, a directory or a glob pattern")
+
+    def __enter__(self) -> "XvgSource":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _archive(self) -> Any:
+        if self._handle is None:
+            self._handle = zipfile.ZipFile(self.path) if self.kind == "zip" else tarfile.open(self.path)
+        return self._handle
+
+    def infos(self) -> dict[str, Any]:
+        """Return the entries of the non-empty files of the source, indexed by name."""
+        if self._infos is None:
+            if self.kind == "zip":
+                entries = ((info.filename, info) for info in self._archive().infolist() if not info.is_dir())
+            elif self.kind == "tar":
+                entries = ((info.name, MemberInfo(info.name, info.size, _stamp(info.size, info.mtime))) for info in self._archive().getmembers() if info.isfile())
+            else:
+                if self.kind == "dir":
+                    paths = (path for path in self.root.rglob("*") if path.name.endswith(XVG_SUFFIXES))
+                else:
+                    paths = (Path(path) for path in glob.glob(self.path, recursive=True))
+                entries = (
+                    (name, MemberInfo(name, stat.st_size, _stamp(stat.st_size, stat.st_mtime_ns)))
+                    for path in paths
+                    if path.is_file()
+                    for name, stat in ((path.relative_to(self.root).as_posix(), path.stat()),)
+                )
+            self._infos = {name: info for name, info in entries if info.file_size > MIN_XVG_SIZE}
+        return self._infos
+
+    def open(self, name: str) -> IO[bytes]:
+        """Open a member for reading, decompressing it on the fly if it is compressed."""
+        if self.kind == "zip":
+            stream: IO[bytes] = self._archive().open(name)
+        elif self.kind == "tar":
+            stream = self._archive().extractfile(name)
+        else:
+            stream = open(self.root.joinpath(name), "rb")
+        return _decompressed(name, stream)
+
+    def iter_members(self, names: Iterable[str]) -> Iterator[tuple[str, IO[bytes]]]:
+        """Open the selected members one at a time, yielding their name and decompressing stream.
+
+        Each stream is closed before the next member is opened. Tar members
+        are yielded in the order of the archive, so compressed tar archives
+        are decompressed in a single pass; other members are yielded in the
+        order of the names.
+        """
+        if self.kind == "tar":
+            wanted = set(names)
+            names = [info.name for info in self._archive().getmembers() if info.name in wanted]
+        for name in names:
+            with self.open(name) as member:
+                yield name, member
+
+
+def source_digest(path: str) -> str:
+    """Return a digest of a source of dgdl.xvg files: the content digest of an archive or a digest of the file entries of a directory or a glob."""
+    if Path(path).is_file():
+        return file_digest(path)
+    with XvgSource(path) as source:
+        return cache_key("xvg_source", sorted((name, info.file_size, info.CRC) for name, info in source.infos().items()))
+
+
+def natural_sort(names: Iterable[str]) -> list[str]:
+    """Sort the names the same way PMX analyse does (numbers are compared by value)."""
+
+    def alphanum_key(key: str) -> list:
+        return [int(c) if c.isdigit() else c.lower() for c in re.split("([0-9]+)", key)]
+
+    return sorted(names, key=alphanum_key)
+
+
+def xvg_member_infos(zip_path: str) -> dict[str, Any]:
+    """Return the entries of the non-empty dgdl.xvg files of a zip file, a tar archive, a directory or a glob pattern, indexed by name."""
+    with XvgSource(zip_path) as source:
+        return source.infos()
+
+
+def list_xvg_members(zip_path: str) -> list[str]:
+    """Return the naturally sorted names of the non-empty dgdl.xvg files of a zip file, a tar archive, a directory or a glob pattern."""
+    return natural_sort(xvg_member_infos(zip_path))
+
+
+def select_members(
+    names: list[str],
+    skip: int = 1,
+    slice: Optional[str] = None,
+    rand: Optional[int] = None,
+    index: Optional[str] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> list[str]:
+    """Select the trajectories to analyze following the PMX analyse rules.
+
+    The random subset is taken first, then the slice, the index and finally
+    the skip counting from the end, so the last trajectory is always kept.
+
+    Raises:
+        ValueError: If rand is larger than the number of trajectories.
+    """
+    if rand and rand > len(names):
+        raise ValueError(f"The rand property ({rand}) is larger than the number of dgdl.xvg files ({len(names)})")
+    if rand:
+        rng = rng if rng is not None else np.random.default_rng()
+        names = list(rng.choice(names, size=rand, replace=False))
+    if slice:
+        first, last = (int(value) for value in slice.split())
+        names = names[first:last]
+    if index:
+        names = [names[int(i)] for i in index.split() if int(i) < len(names)]
+    if skip:
+        names = list(reversed(names[::-skip]))
+    return names
+
+
+def parse_subsets(subsets: str) -> list[dict[str, Any]]:
+    """Parse a list of trajectory subset specs separated by semicolons.
+
+    Each spec holds comma separated skip, slice, rand and index selections
+    with the values of the PMX analyse options, e.g.
+    "slice: 0 20; rand: 30; skip: 2, slice: 0 40".
+
+    Returns:
+        list: The selection of each subset, with its spec as label.
+    """
+    parsed = []
+    for spec in subsets.split(";"):
+        if not spec.strip():
+            continue
+        selection: dict[str, Any] = {"subset": " ".join(spec.split()), "skip": 1, "slice": None, "rand": None, "index": None}
+        for item in spec.split(","):
+            key, _, value = item.partition(":")
+            key = key.strip().lower()
+            if key not in ("skip", "slice", "rand", "index") or not value.strip():
+                raise ValueError(f"Invalid trajectory subset '{item.strip()}': expected skip, slice, rand or index followed by ':' and its value")
+            selection[key] = int(value) if key in ("skip", "rand") else " ".join(value.split())
+        parsed.append(selection)
+    return parsed
+
+
+def parse_xvg(stream: IO[bytes], decimate: int = 1, dtype=np.float64) -> np.ndarray:
+    """Parse the time and dgdl columns of a dgdl.xvg file while it is read.
+
+    The file is read one line at a time: the header lines are skipped and
+    only one data line every decimate lines is parsed, so neither the whole
+    text nor the list of its lines is ever held in memory.
+
+    Args:
+        stream (IO[bytes]): Binary stream of the dgdl.xvg file.
+        decimate (int): Keep one frame every decimate frames.
+        dtype (numpy.dtype): Data type of the parsed values.
+
+    Returns:
+        numpy.ndarray: Array of shape (n_frames, 2) with the time and dgdl values.
+
+    Raises:
+        ValueError: If a parsed row is malformed or holds NaN or infinite values.
+    """
+    lines = io.TextIOWrapper(stream, encoding="ISO-8859-1")
+    data_lines = (line for line in lines if line.strip() and not line.lstrip().startswith(("#", "@", "&")))
+    data = np.loadtxt(itertools.islice(data_lines, 0, None, decimate), comments=("#", "@", "&"), usecols=(0, 1), ndmin=2, dtype=dtype)
+    if not np.isfinite(data).all():
+        raise ValueError("NaN or infinite dgdl values")
+    return data
+
+
+def iter_xvg_zip(zip_path: str, names: Iterable[str]) -> Iterator[tuple[str, IO[bytes]]]:
+    """Yield the name and the decompressing stream of the selected members of a zip file, a tar archive, a directory or a glob pattern.
+
+    Members are opened one at a time and decompressed while they are read,
+    no extracted copy is ever written to disk. Each stream must be consumed
+    before the next member is requested. Tar members are yielded in the
+    order of the archive.
+    """
+    with XvgSource(zip_path) as source:
+        yield from source.iter_members(names)
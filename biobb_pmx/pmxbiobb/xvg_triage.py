@@ -0,0 +1,209 @@
+"""Validation of the dgdl.xvg files of a source from their head and tail.
+
+Only the header, the first data rows and a window at the end of each
+member are parsed: empty, unreadable or truncated trajectories, NaN values
+at their ends, transitions starting at the wrong lambda and trajectories
+shorter than the rest are found without reading the whole files. Plain
+members are seeked to their tail, compressed ones are decompressed without
+being parsed. NaN values and malformed rows in the middle of a trajectory
+are found when its curve is parsed, and the trajectory is skipped then.
+Members are checked in parallel threads, each with its own handle on the
+zip file, tar archive, directory or glob pattern of the files.
+"""
+
+import csv
+import lzma
+import math
+import re
+import threading
+import zipfile
+import zlib
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Optional
+
+import numpy as np
+
+from biobb_pmx.pmxbiobb.xvg_io import XvgSource, is_compressed
+
+# Issues that make PMX analyse fail or bias its results: the files are excluded
+BAD_ISSUES = ("empty", "unreadable", "nan", "truncated", "lambda")
+# Issues worth reporting: PMX analyse discards these files or they may be suspicious
+WARNING_ISSUES = ("short", "time_step")
+
+TRIAGE_COLUMNS = ["state", "name", "status", "issues", "lambda", "first_time", "last_time", "time_step"]
+
+LAMBDA_PATTERNS = (re.compile(r"fep-lambdas\s*=\s*([-+0-9.eE]+)"), re.compile(r"\\xl\\f\{\}\s*=\s*([-+0-9.eE]+)"))
+
+# Bytes read at the end of every member
+TAIL_SIZE = 1024
+CHUNK_SIZE = 1 << 16
+
+
+def _numeric(row: Sequence[str]) -> Optional[list[float]]:
+    try:
+        return [float(value) for value in row]
+    except ValueError:
+        return None
+
+
+def _read_tail(name: str, member: IO[bytes], file_size: int, position: int, tail_size: int) -> tuple[bytes, bool]:
+    """Read the last tail_size bytes of a member, from position at the earliest.
+
+    Returns:
+        tuple: The bytes read and whether bytes were skipped before them, in which case their first line may be partial.
+    """
+    if not is_compressed(name):
+        start = max(file_size - tail_size, position)
+        member.seek(start)
+        return member.read(), start > position
+    tail, skipped = b"", False
+    while chunk := member.read(CHUNK_SIZE):
+        tail += chunk
+        if len(tail) > tail_size:
+            tail, skipped = tail[-tail_size:], True
+    return tail, skipped
+
+
+def triage_member(
+    source: XvgSource, name: str, lambda0: Optional[int] = None, tail_size: int = TAIL_SIZE, file_size: Optional[int] = None
+) -> dict[str, Any]:
+    """Check the header, the first two data rows and the last tail_size bytes of a dgdl.xvg member.
+
+    A malformed data row is reported as truncated if it is the last one,
+    and as unreadable otherwise. Rows between the head and the tail are
+    not read. The file_size of the member is taken from the source if it
+    is not given.
+
+    Returns:
+        dict: The name, the issues found, the lambda value of the header and the first time, last time and time step of the trajectory.
+    """
+    report: dict[str, Any] = {"name": name, "issues": [], "lambda": None, "first_time": None, "last_time": None, "time_step": None}
+    lines: list[str] = []
+    try:
+        with source.open(name) as member:
+            position, n_rows = 0, 0
+            while n_rows < 2 and (raw := member.readline()):
+                position += len(raw)
+                line = raw.decode("ISO-8859-1")
+                stripped = line.strip()
+                if stripped.startswith(("#", "@", "&")) and report["lambda"] is None:
+                    for pattern in LAMBDA_PATTERNS:
+                        match = pattern.search(stripped)
+                        if match:
+                            report["lambda"] = float(match.group(1))
+                            break
+                n_rows += bool(stripped) and not stripped.startswith(("#", "@", "&"))
+                lines.append(line)
+            if file_size is None:
+                file_size = source.infos()[name].file_size
+            tail, skipped = _read_tail(name, member, file_size, position, tail_size)
+    except (OSError, EOFError, lzma.LZMAError, zlib.error, zipfile.BadZipFile):
+        # Corrupted compressed members
+        report["issues"].append("unreadable")
+        return report
+    tail_lines = tail.decode("ISO-8859-1").splitlines(keepends=True)
+    # The first line of the tail may start in the middle of a row
+    lines.extend(tail_lines[1:] if skipped else tail_lines)
+
+    first_values: list[list[float]] = []
+    last_values: Optional[list[float]] = None
+    n_columns, malformed, finite = 0, None, True
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith(("#", "@", "&")):
+            continue
+        if malformed is not None:
+            # A malformed row followed by more data is not a truncation
+            report["issues"].append("unreadable")
+            return report
+        values = _numeric(stripped.split())
+        if values is None or len(values) < 2 or (n_columns and len(values) != n_columns):
+            if not first_values:
+                report["issues"].append("unreadable")
+                return report
+            malformed = stripped
+            continue
+        n_columns = n_columns or len(values)
+        finite = finite and all(math.isfinite(value) for value in values)
+        if len(first_values) < 2:
+            first_values.append(values)
+        last_values = values
+    # The line ends are kept, so a missing final one can be detected
+    ends_line = not lines or lines[-1].endswith(("\n", "\r"))
+
+    if lambda0 is not None and report["lambda"] is not None and abs(report["lambda"] - lambda0) > 1e-6:
+        report["issues"].append("lambda")
+    if not first_values:
+        report["issues"].append("empty")
+        return report
+    if malformed is not None or not ends_line:
+        report["issues"].append("truncated")
+    if not finite:
+        report["issues"].append("nan")
+    report["first_time"] = first_values[0][0]
+    if len(first_values) > 1:
+        report["time_step"] = first_values[1][0] - first_values[0][0]
+    if last_values is not None:
+        report["last_time"] = last_values[0]
+    return report
+
+
+def triage_zip(
+    zip_path: str, names: Sequence[str], lambda0: Optional[int] = None, nthreads: Optional[int] = None, tail_size: int = TAIL_SIZE
+) -> list[dict[str, Any]]:
+    """Check the selected dgdl.xvg members of a zip file, a tar archive, a directory or a glob pattern in parallel threads.
+
+    Besides the issues of each member, trajectories ending before the
+    longest ones are flagged as short and trajectories with a time step
+    different from the most common one are flagged with time_step.
+
+    Returns:
+        list: The report of each member, in the order of the names, with its status: ok, warning or bad.
+    """
+    with XvgSource(zip_path) as source:
+        sizes = {name: info.file_size for name, info in source.infos().items()}
+    local = threading.local()
+    handles: list[XvgSource] = []
+    lock = threading.Lock()
+
+    def check(name: str) -> dict[str, Any]:
+        if not hasattr(local, "source"):
+            local.source = XvgSource(zip_path)
+            with lock:
+                handles.append(local.source)
+        return triage_member(local.source, name, lambda0, tail_size, sizes[name])
+
+    try:
+        with ThreadPoolExecutor(max_workers=nthreads) as pool:
+            reports = list(pool.map(check, names))
+    finally:
+        for handle in handles:
+            handle.close()
+
+    last_times = np.array([report["last_time"] for report in reports if report["last_time"] is not None and not report["issues"]])
+    steps = np.array([round(report["time_step"], 6) for report in reports if report["time_step"] is not None and not report["issues"]])
+    max_time = last_times.max() if len(last_times) else None
+    if len(steps):
+        values, counts = np.unique(steps, return_counts=True)
+        common_step = values[np.argmax(counts)]
+    for report in reports:
+        if max_time is not None and report["last_time"] is not None and report["last_time"] < max_time and "truncated" not in report["issues"]:
+            report["issues"].append("short")
+        if len(steps) and report["time_step"] is not None and abs(report["time_step"] - common_step) > 1e-6 * max(abs(common_step), 1.0):
+            report["issues"].append("time_step")
+        if any(issue in BAD_ISSUES for issue in report["issues"]):
+            report["status"] = "bad"
+        else:
+            report["status"] = "warning" if report["issues"] else "ok"
+    return reports
+
+
+def write_triage(triage_path: str, reports: dict[str, list[dict[str, Any]]]) -> str:
+    """Write the triage reports of the states to a CSV file, one row per dgdl.xvg file."""
+    with open(triage_path, "w", newline="") as triage_file:
+        writer = csv.DictWriter(triage_file, fieldnames=TRIAGE_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for state, state_reports in reports.items():
+            writer.writerows({**report, "state": state, "issues": " ".join(report["issues"])} for report in state_reports)
+    return triage_path
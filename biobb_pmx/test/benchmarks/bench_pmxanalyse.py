@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+"""Scaling benchmark of Pmxanalyse on synthetic dgdl.xvg archives.
+
+Runs Pmxanalyse on synthetic edges of growing size (10 to 10,000
+trajectories of 100 to 100,000 frames each) and records, for every phase
+of Pmxanalyse.launch, its wall time, its peak resident set size and the
+bytes read and written by the process. Every size is run in a fresh
+process, so the measures of a size do not depend on the sizes run before
+it. The synthetic archives are written once to the work directory and
+reused by later runs.
+
+Example::
+
+    python -m biobb_pmx.test.benchmarks.bench_pmxanalyse --trajectories 10 100 1000 --frames 100 1000 --output bench.csv
+
+The peak RSS of a phase is the high-water mark of the process (VmHWM of
+/proc/self/status) reached during the phase: it is reset to the current
+resident set size through /proc/self/clear_refs when the phase starts, and
+a phase holding other phases keeps the highest peak of all of them. It
+does not include the worker processes and the PMX subprocess, whose
+largest peak is reported in the children_max_rss_mb column: that one is
+cumulative over the phases of a size (resource.getrusage). Byte counts are
+the rchar/wchar counters of /proc/self/io. Both measures are only reported
+on Linux and do not include the I/O of worker processes.
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Optional
+from unittest import mock
+
+from biobb_pmx.pmxbiobb import pmxanalyse as pmxanalyse_module
+from biobb_pmx.pmxbiobb.pmxanalyse import Pmxanalyse
+from biobb_pmx.test.benchmarks.synthetic_xvg import write_synthetic_pair
+
+BENCH_COLUMNS = [
+    "mode",
+    "n_trajectories",
+    "n_frames",
+    "phase",
+    "calls",
+    "wall_s",
+    "peak_rss_mb",
+    "children_max_rss_mb",
+    "read_bytes",
+    "written_bytes",
+    "dg",
+    "dg_error",
+]
+
+# Module level functions of pmxanalyse timed as phases of the in-process analysis
+MODULE_PHASES = {
+    "zip_works": "read_integrate",
+    "analyse_works": "estimate",
+    "write_results": "write_results",
+    "write_works": "write_results",
+    "write_work_store": "write_work_store",
+}
+# Methods of the block timed as phases of launch
+METHOD_PHASES = {
+    "stage_files": "stage_files",
+    "run_biobb": "run_pmx",
+    "copy_to_host": "copy_to_host",
+    "remove_tmp_files": "remove_tmp_files",
+}
+
+
+def _io_counters() -> tuple[Optional[int], Optional[int]]:
+    """Bytes read and written by the process so far, None if /proc/self/io is not available."""
+    try:
+        counters = dict(line.split(": ") for line in Path("/proc/self/io").read_text().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _vm_hwm_mb() -> Optional[float]:
+    """High-water mark of the resident set size of the process since its last reset, in MB, None if /proc/self/status is not available."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_vm_hwm() -> bool:
+    """Reset the high-water mark of the resident set size of the process to its current size, False if it is not supported."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _children_max_rss_mb() -> float:
+    """Largest peak resident set size of the finished child processes, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class PhaseRecorder:
+    """Accumulate the wall time, peak memory and I/O of the phases of a run."""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, dict[str, Any]] = {}
+        self.outputs: dict[str, Any] = {}
+        # Peak of every open phase so far, the innermost last
+        self._open_peaks: list[Optional[float]] = []
+
+    def _fold_peak(self) -> None:
+        """Fold the high-water mark reached so far into the peaks of the open phases."""
+        hwm = _vm_hwm_mb()
+        self._open_peaks = [None if peak is None or hwm is None else max(peak, hwm) for peak in self._open_peaks]
+
+    @contextmanager
+    def phase(self, name: str):
+        # The peaks of the outer phases are kept before the high-water mark is reset for this one
+        self._fold_peak()
+        self._open_peaks.append(0.0 if _reset_vm_hwm() else None)
+        read_start, written_start = _io_counters()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            read_end, written_end = _io_counters()
+            self._fold_peak()
+            peak = self._open_peaks.pop()
+            record = self.phases.setdefault(name, {"calls": 0, "wall_s": 0.0, "peak_rss_mb": 0.0, "read_bytes": 0, "written_bytes": 0})
+            record["calls"] += 1
+            record["wall_s"] += wall
+            record["peak_rss_mb"] = None if peak is None or record["peak_rss_mb"] is None else max(record["peak_rss_mb"], peak)
+            record["children_max_rss_mb"] = _children_max_rss_mb()
+            if read_start is None or read_end is None or written_start is None or written_end is None:
+                record["read_bytes"] = record["written_bytes"] = None
+            elif record["read_bytes"] is not None:
+                record["read_bytes"] += read_end - read_start
+                record["written_bytes"] += written_end - written_start
+
+    def wrap(self, name: str, func):
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                result = func(*args, **kwargs)
+            self.outputs[name] = result
+            return result
+
+        return timed
+
+
+def run_pmxanalyse(zip_a: str, zip_b: str, workdir: str, properties: dict[str, Any], plot: bool = False) -> PhaseRecorder:
+    """Run Pmxanalyse on an edge and record the phases of its launch."""
+    recorder = PhaseRecorder()
+    block = Pmxanalyse(
+        input_a_xvg_zip_path=zip_a,
+        input_b_xvg_zip_path=zip_b,
+        output_result_path=str(Path(workdir).joinpath("result.txt")),
+        output_work_plot_path=str(Path(workdir).joinpath("plot.png")) if plot else None,
+        properties={"sandbox_path": workdir, **properties},
+    )
+    with ExitStack() as stack:
+        for name, phase in MODULE_PHASES.items():
+            stack.enter_context(mock.patch.object(pmxanalyse_module, name, recorder.wrap(phase, getattr(pmxanalyse_module, name))))
+        for name, phase in METHOD_PHASES.items():
+            stack.enter_context(mock.patch.object(block, name, recorder.wrap(phase, getattr(block, name))))
+        with recorder.phase("launch"):
+            block.launch()
+    return recorder
+
+
+def _run_size(zip_a: str, zip_b: str, workdir: str, properties: dict[str, Any], plot: bool) -> tuple[dict[str, dict[str, Any]], Optional[float]]:
+    """Run Pmxanalyse on an edge and return the records of its phases and its BAR estimate."""
+    recorder = run_pmxanalyse(zip_a, zip_b, workdir, properties, plot)
+    results = recorder.outputs.get("estimate") or {}
+    return recorder.phases, results.get("bar", {}).get("dg")
+
+
+def benchmark(
+    trajectories: list[int], frames: list[int], workdir: str, properties: dict[str, Any], dg: float = 10.0, plot: bool = False, seed: int = 1
+) -> list[dict[str, Any]]:
+    """Benchmark Pmxanalyse on synthetic edges of every size of the trajectories x frames grid.
+
+    Every size is run in a fresh spawned process.
+
+    Returns:
+        list: One row per size and phase, with the columns of BENCH_COLUMNS.
+    """
+    mode = "stream" if properties.get("stream_xvg") else "cli"
+    rows = []
+    for n_frames in frames:
+        for n_trajectories in trajectories:
+            data_dir = Path(workdir).joinpath("data")
+            zip_a, zip_b = (str(data_dir.joinpath(f"xvg_{state}_{n_trajectories}x{n_frames}.zip")) for state in "AB")
+            if not (Path(zip_a).exists() and Path(zip_b).exists()):
+                write_synthetic_pair(str(data_dir), n_trajectories, n_frames, dg=dg, seed=seed)
+            run_dir = Path(workdir).joinpath(f"{mode}_{n_trajectories}x{n_frames}")
+            run_dir.mkdir(parents=True, exist_ok=True)
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                phases, estimate = pool.submit(_run_size, zip_a, zip_b, str(run_dir), properties, plot).result()
+
+            for phase, record in phases.items():
+                row = {"mode": mode, "n_trajectories": n_trajectories, "n_frames": n_frames, "phase": phase, **record}
+                if phase == "launch" and estimate is not None:
+                    row.update({"dg": estimate, "dg_error": estimate - dg})
+                rows.append(row)
+    return rows
+
+
+def write_benchmark(output_path: str, rows: list[dict[str, Any]]) -> str:
+    """Write the benchmark rows to a CSV file."""
+    with open(output_path, "w", newline="") as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=BENCH_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return output_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scaling benchmark of Pmxanalyse on synthetic dgdl.xvg archives.")
+    parser.add_argument("--trajectories", type=int, nargs="+", default=[10, 100, 1000], help="Numbers of trajectories of each state (10 to 10000).")
+    parser.add_argument("--frames", type=int, nargs="+", default=[100, 1000], help="Numbers of frames of each trajectory (100 to 100000).")
+    parser.add_argument("--workdir", default="pmxanalyse_bench", help="Directory of the synthetic archives and the runs.")
+    parser.add_argument("--output", default="pmxanalyse_bench.csv", help="CSV file with the measures of each phase.")
+    parser.add_argument("--cli", action="store_true", help="Run the PMX command line interface instead of the in-process analysis (stream_xvg).")
+    parser.add_argument("--plot", action="store_true", help="Render the work plot.")
+    parser.add_argument("--nboots", type=int, default=0)
+    parser.add_argument("--nblocks", type=int, default=1)
+    parser.add_argument("--nworkers", type=int, default=1)
+    parser.add_argument("--dg", type=float, default=10.0, help="Free energy difference of the synthetic edges in kJ/mol.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    properties = {"nboots": args.nboots, "nblocks": args.nblocks, "nworkers": args.nworkers, "seed": args.seed, "stream_xvg": not args.cli}
+    os.makedirs(args.workdir, exist_ok=True)
+    rows = benchmark(args.trajectories, args.frames, args.workdir, properties, args.dg, args.plot, args.seed)
+    write_benchmark(args.output, rows)
+    for row in rows:
+        peak = "n/a" if row["peak_rss_mb"] is None else f"{row['peak_rss_mb']:.0f} MB"
+        print(f"{row['mode']} {row['n_trajectories']}x{row['n_frames']} {row['phase']}: {row['wall_s']:.3f} s, {peak}")
+
+
+if __name__ == "__main__":
+    main()
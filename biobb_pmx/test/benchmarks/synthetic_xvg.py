@@ -0,0 +1,100 @@
+"""Generator of synthetic dgdl.xvg archives with a known free energy difference.
+
+The work values of the forward and reverse transitions are drawn from the
+Gaussian distributions that satisfy the Crooks fluctuation theorem for the
+requested free energy difference dg and work standard deviation sigma:
+N(dg + beta*sigma^2/2, sigma) for the A state (forward) and
+N(dg - beta*sigma^2/2, sigma) for the B state, in the PMX analyse sign
+convention. Each dgdl curve is a constant plus zero-integral noise, so the
+Simpson integration of PMX analyse recovers the drawn work values.
+"""
+
+import io
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from scipy.integrate import simpson
+
+from biobb_pmx.pmxbiobb.work_estimators import KB
+
+
+def synthetic_works(n_trajectories: int, dg: float, sigma: float, temperature: float, state: int, rng: np.random.Generator) -> np.ndarray:
+    """Draw the Crooks-consistent Gaussian work values of the A (state 0) or B (state 1) transitions."""
+    beta = 1.0 / (KB * temperature)
+    mean = dg + beta * sigma**2 * 0.5 if state == 0 else dg - beta * sigma**2 * 0.5
+    return rng.normal(mean, sigma, n_trajectories)
+
+
+def dgdl_curves(works: np.ndarray, n_frames: int, noise: float, state: int, rng: np.random.Generator) -> np.ndarray:
+    """Build (len(works), n_frames) dgdl curves whose Simpson integral over the PMX lambda path is the given work."""
+    # PMX integrates both states over an ascending lambda path with the same spacing
+    lambdas = np.arange(n_frames) / n_frames
+    fluctuations = rng.normal(0.0, noise, (len(works), n_frames))
+    ones = np.ones(n_frames)
+    # Remove the integral of the fluctuations and scale the constant so the curve integrates to the work value
+    fluctuations -= (simpson(fluctuations, x=lambdas, axis=1) / simpson(ones, x=lambdas))[:, None]
+    curves = works[:, None] / simpson(ones, x=lambdas) + fluctuations
+    # The B state curves are integrated backwards in time, from lambda 1 to 0
+    return curves[:, ::-1] if state == 1 else curves
+
+
+def write_synthetic_zip(
+    zip_path: str,
+    n_trajectories: int,
+    n_frames: int,
+    state: int = 0,
+    dg: float = 10.0,
+    sigma: float = 2.0,
+    temperature: float = 298.15,
+    noise: float = 0.5,
+    time_step: float = 0.2,
+    seed: Optional[int] = None,
+    batch_size: int = 100,
+) -> np.ndarray:
+    """Write a zip file with n_trajectories frameN/dgdl.xvg files of n_frames frames.
+
+    Args:
+        zip_path (str): Path to the zip file.
+        n_trajectories (int): Number of dgdl.xvg files.
+        n_frames (int): Number of frames of each dgdl.xvg file.
+        state (int): 0 for the A state (forward transitions), 1 for the B state (reverse transitions).
+        dg (float): Free energy difference in kJ/mol.
+        sigma (float): Standard deviation of the work values in kJ/mol.
+        temperature (float): Temperature in Kelvin.
+        noise (float): Standard deviation of the frame to frame dgdl fluctuations.
+        time_step (float): Time between frames in ps.
+        seed (int): Seed of the work values and the fluctuations.
+        batch_size (int): Number of curves generated at once, bounding the memory used.
+
+    Returns:
+        numpy.ndarray: The work value of each trajectory, in the order of the frame numbers.
+    """
+    rng = np.random.default_rng(seed)
+    works = synthetic_works(n_trajectories, dg, sigma, temperature, state, rng)
+    times = np.arange(n_frames) * time_step
+    header = f'# synthetic\n@    title "dH/d\\xl\\f{{}}, \\xD\\f{{}}H"\n@ subtitle "T = {temperature:g} (K) \\xl\\f{{}} state {state}: fep-lambdas = {state:.4f}"\n'
+    Path(zip_path).parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for start in range(0, n_trajectories, batch_size):
+            curves = dgdl_curves(works[start: start + batch_size], n_frames, noise, state, rng)
+            for offset, curve in enumerate(curves):
+                buffer = io.StringIO()
+                buffer.write(header)
+                np.savetxt(buffer, np.column_stack((times, curve)), fmt=("%.4f", "%.6f"))
+                zip_file.writestr(f"frame{start + offset}/dgdl.xvg", buffer.getvalue())
+    return works
+
+
+def write_synthetic_pair(
+    directory: str, n_trajectories: int, n_frames: int, dg: float = 10.0, sigma: float = 2.0, temperature: float = 298.15, seed: Optional[int] = None
+) -> tuple[str, str]:
+    """Write the xvg_A.zip and xvg_B.zip archives of an edge with a known free energy difference."""
+    seeds = np.random.SeedSequence(seed).spawn(2)
+    paths = []
+    for state, state_seed in enumerate(seeds):
+        zip_path = str(Path(directory).joinpath(f"xvg_{'AB'[state]}_{n_trajectories}x{n_frames}.zip"))
+        write_synthetic_zip(zip_path, n_trajectories, n_frames, state, dg, sigma, temperature, seed=int(state_seed.generate_state(1)[0]))
+        paths.append(zip_path)
+    return paths[0], paths[1]
@@ -0,0 +1,3 @@
+def pytest_configure(config):
+    # Select the benchmarks with -m benchmark, or leave them out with -m "not benchmark"
+    config.addinivalue_line("markers", "benchmark: scaling benchmarks of the building blocks on synthetic data")
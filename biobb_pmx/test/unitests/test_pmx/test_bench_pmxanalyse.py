@@ -0,0 +1,24 @@
+# type: ignore
+import pytest
+from biobb_common.tools import test_fixtures as fx
+from biobb_pmx.test.benchmarks.bench_pmxanalyse import benchmark
+
+
+@pytest.mark.benchmark
+class TestBenchPmxanalyse:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_bench')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_bench_pmxanalyse(self):
+        rows = benchmark([200], [101], self.properties['path'], self.properties)
+        phases = {row["phase"]: row for row in rows}
+        assert {"stage_files", "read_integrate", "estimate", "write_results", "copy_to_host", "launch"} <= set(phases)
+        assert phases["launch"]["wall_s"] >= phases["read_integrate"]["wall_s"] > 0
+        # The peak of launch holds the peaks of the phases it runs
+        if phases["launch"]["peak_rss_mb"] is not None:
+            assert phases["launch"]["peak_rss_mb"] >= max(phases[phase]["peak_rss_mb"] for phase in ("read_integrate", "estimate", "write_results"))
+        # The synthetic edge has a known free energy difference of 10 kJ/mol
+        assert abs(phases["launch"]["dg_error"]) < 1.0
@@ -1,6 +1,24 @@
 # type: ignore
+import csv
+import gzip
+import json
+import os
+import re
+import subprocess
+import tarfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
 from biobb_common.tools import test_fixtures as fx
 from biobb_pmx.pmxbiobb.pmxanalyse import pmxanalyse
+from biobb_pmx.pmxbiobb.result_store import read_results
+from biobb_pmx.pmxbiobb.work_integration import zip_works
+from biobb_pmx.pmxbiobb.work_store import load_work_store
+from biobb_pmx.pmxbiobb.xvg_io import list_xvg_members
+from pmx.analysis import read_dgdl_files
+from pmx.utils import natural_sort
 
 
 class TestPmxanalyse:
@@ -17,3 +35,304 @@ class TestPmxanalyse:
         assert fx.not_empty(self.paths['output_result_path'])
         assert fx.not_empty(self.paths['output_work_plot_path'])
         assert fx.equal(self.paths['output_work_plot_path'], self.paths['ref_output_work_plot_path'])
+
+
+class TestPmxanalyseStream:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_stream')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_stream(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_result_path'])
+        assert fx.not_empty(self.paths['output_work_plot_path'])
+        store = load_work_store(self.paths['output_work_store_path'])
+        assert len(store) and set(store['state']) == {0, 1}
+        errors = Path(self.paths['output_errors_path']).read_text().splitlines()
+        assert [line.split(',')[0] for line in errors] == ['nblocks', '2', '4', '5', 'jackknife']
+
+    def test_pmxanalyse_stream_cache(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        first = [line for line in Path(self.paths['output_result_path']).read_text().splitlines() if not line.startswith('#')]
+        # The second run reads the work values of both states from the cache
+        pmxanalyse(properties=self.properties, **self.paths)
+        second = [line for line in Path(self.paths['output_result_path']).read_text().splitlines() if not line.startswith('#')]
+        assert len(list(Path(self.properties['cache_dir']).glob('*.npz'))) == 2
+        assert first == second
+
+
+class TestPmxanalyseParity:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_parity')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_parity(self):
+        files = {}
+        for state, key, lambda0 in (('A', 'input_a_xvg_zip_path', 0), ('B', 'input_b_xvg_zip_path', 1)):
+            xvg_dir = Path(self.properties['path']).joinpath(f'xvg_{state}')
+            with zipfile.ZipFile(self.paths[key]) as source:
+                source.extractall(xvg_dir)
+            files[state] = natural_sort(str(path) for path in xvg_dir.rglob('*.xvg') if path.stat().st_size > 10)
+            # Same work values as the PMX integration of the extracted files
+            names, works, _ = zip_works(self.paths[key], list_xvg_members(self.paths[key]), lambda0)
+            assert names == [Path(path).relative_to(xvg_dir).as_posix() for path in files[state]]
+            assert np.allclose(works, read_dgdl_files(files[state], lambda0=lambda0, verbose=False), rtol=0, atol=1e-12)
+
+        # Same estimates as PMX analyse run on the extracted files
+        pmx_result_path = str(Path(self.properties['path']).joinpath('pmx_result.txt'))
+        subprocess.run(['pmx', 'analyse', '-fA', *files['A'], '-fB', *files['B'], '-o', pmx_result_path, '-w', 'none', '-b', '0',
+                        '-m', *self.properties['method'].split(), '-t', str(self.properties['temperature']), '--prec', str(self.properties['prec'])],
+                       check=True, capture_output=True)
+        pmxanalyse(properties=self.properties, **self.paths)
+
+        def result_lines(result_path):
+            lines = [line for line in Path(result_path).read_text().splitlines() if not line.startswith('#')]
+            return [re.sub(r'-?\d+\.\d+', '#', line) for line in lines], [float(value) for line in lines for value in re.findall(r'-?\d+\.\d+', line)]
+
+        pmx_labels, pmx_values = result_lines(pmx_result_path)
+        labels, values = result_lines(self.paths['output_result_path'])
+        assert labels == pmx_labels
+        # PMX stops its BAR iterations at a looser tolerance: the last printed digit may differ
+        assert np.allclose(values, pmx_values, rtol=0, atol=1e-4)
+
+
+class TestPmxanalyseWorkers:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_workers')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_workers(self):
+        results = []
+        for nworkers in (1, 3):
+            pmxanalyse(properties={**self.properties, 'nworkers': nworkers}, **self.paths)
+            results.append([line for line in Path(self.paths['output_result_path']).read_text().splitlines() if not line.startswith('#')])
+        # The bootstrap samples of a seed do not depend on the number of workers
+        assert any('(bootstrap)' in line for line in results[0])
+        assert results[0] == results[1]
+
+
+class TestPmxanalyseIncremental:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_incremental')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_incremental(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.properties['state_path'])
+        state = json.loads(Path(self.properties['state_path']).read_text())
+        assert state['states']['A']['trajectories'] and state['states']['B']['trajectories']
+        # Nothing new to ingest: the estimates are computed from the state only
+        pmxanalyse(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_result_path'])
+
+
+class TestPmxanalyseSubsets:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_subsets')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_subsets(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_result_path'])
+        with open(self.paths['output_subsets_path'], newline='') as subsets_file:
+            rows = list(csv.DictReader(subsets_file))
+        assert [row['subset'] for row in rows] == ['slice: 0 30', 'rand: 25', 'skip: 2, slice: 10 50']
+        assert [row['n_forward'] for row in rows] == ['30', '25', '20']
+
+
+class TestPmxanalyseSweep:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_sweep')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_sweep(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        with open(self.paths['output_sweep_path'], newline='') as sweep_file:
+            rows = list(csv.DictReader(sweep_file))
+        assert [(row['temperature'], row['units']) for row in rows] == [(t, u) for t in ('280.0', '298.15', '310.0') for u in ('kJ', 'kcal', 'kT')]
+        kj, kcal = float(rows[3]['dg']), float(rows[4]['dg'])
+        assert abs(kj / 4.184 - kcal) < 1e-9
+
+
+class TestPmxanalyseOutputs:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_outputs')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_outputs(self):
+        # Without stream_xvg, PMX writes the results and the other outputs come from the works handed to it
+        pmxanalyse(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_result_path'])
+        store = load_work_store(self.paths['output_work_store_path'])
+        assert len(store) and set(store['state']) == {0, 1}
+        errors = Path(self.paths['output_errors_path']).read_text().splitlines()
+        assert [line.split(',')[0] for line in errors] == ['nblocks', '2', '4', '5', 'jackknife']
+        with open(self.paths['output_subsets_path'], newline='') as subsets_file:
+            assert [row['subset'] for row in csv.DictReader(subsets_file)] == ['slice: 0 30', 'skip: 2']
+        with open(self.paths['output_sweep_path'], newline='') as sweep_file:
+            assert [row['temperature'] for row in csv.DictReader(sweep_file)] == ['280.0', '298.15']
+
+    def test_pmxanalyse_stream_only_property(self):
+        with pytest.raises(ValueError, match='state_path'):
+            pmxanalyse(properties={**self.properties, 'state_path': 'state.json'}, **self.paths)
+
+
+class TestPmxanalyseTriage:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_triage')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_triage(self):
+        # Add a truncated file and a file starting at the wrong lambda to the A state
+        bad_zip_path = str(Path(self.properties['path']).joinpath('bad_A.zip'))
+        with zipfile.ZipFile(self.paths['input_a_xvg_zip_path']) as source, zipfile.ZipFile(bad_zip_path, 'w') as bad_zip:
+            for info in source.infolist():
+                bad_zip.writestr(info, source.read(info))
+            good = source.read(source.namelist()[-1])
+            bad_zip.writestr('frame1000/dgdl.xvg', good[: len(good) // 2])
+            bad_zip.writestr('frame1001/dgdl.xvg', good.replace(b'fep-lambdas = 0.0000', b'fep-lambdas = 1.0000'))
+            # NaN values and malformed rows in the middle of the trajectory, outside its head and tail, and near its end
+            lines = good.splitlines(keepends=True)
+            for name, row in (('frame1002', len(lines) // 2), ('frame1004', -1)):
+                bad_zip.writestr(f'{name}/dgdl.xvg', b''.join(lines[:row] + [lines[row].split()[0] + b' nan 0.0\n'] + lines[row:][1:]))
+            for name, row in (('frame1003', len(lines) // 2), ('frame1005', -3)):
+                bad_zip.writestr(f'{name}/dgdl.xvg', b''.join(lines[:row] + [lines[row][:8] + b'\n'] + lines[row:][1:]))
+        self.paths['input_a_xvg_zip_path'] = bad_zip_path
+        pmxanalyse(properties=self.properties, **self.paths)
+        with open(self.paths['output_triage_path'], newline='') as triage_file:
+            bad = {row['name']: row['issues'] for row in csv.DictReader(triage_file) if row['status'] == 'bad'}
+        assert bad == {'frame1000/dgdl.xvg': 'truncated', 'frame1001/dgdl.xvg': 'lambda', 'frame1004/dgdl.xvg': 'nan', 'frame1005/dgdl.xvg': 'unreadable'}
+        # The trajectories damaged in the middle are skipped when they are parsed
+        assert 'Number of forward (0->1) trajectories: 60' in Path(self.paths['output_result_path']).read_text()
+
+
+class TestPmxanalyseDecimate:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_decimate')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_decimate(self):
+        store_path = str(Path(self.properties['path']).joinpath('results.sqlite'))
+        pmxanalyse(properties={**self.properties, 'result_store_path': store_path, 'edge_nodes': 'lig1 lig2', 'leg': 'water'}, **self.paths)
+        assert fx.not_empty(self.paths['output_result_path'])
+        records = read_results(store_path, 'best')
+        assert [(record['edge'], record['estimator'], record['node_a'], record['node_b'], record['leg']) for record in records] == [('result', 'BAR', 'lig1', 'lig2', 'water')]
+        # One frame out of two is kept
+        store = load_work_store(self.paths['output_work_store_path'])
+        assert set(store['frames']) == {101}
+
+
+class TestPmxanalyseSources:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_sources')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_sources(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        zip_works = list(load_work_store(self.paths['output_work_store_path'], mmap=False)['work'])
+        # A state as a directory of gzip compressed files, B state as a xz compressed tar archive
+        xvg_dir = Path(self.properties['path']).joinpath('xvg_A')
+        with zipfile.ZipFile(self.paths['input_a_xvg_zip_path']) as source:
+            for name in source.namelist():
+                if not name.endswith('/'):
+                    xvg_dir.joinpath(name + '.gz').parent.mkdir(parents=True, exist_ok=True)
+                    xvg_dir.joinpath(name + '.gz').write_bytes(gzip.compress(source.read(name)))
+        tar_path = str(Path(self.properties['path']).joinpath('xvg_B.tar.xz'))
+        with zipfile.ZipFile(self.paths['input_b_xvg_zip_path']) as source, tarfile.open(tar_path, 'w:xz') as tar:
+            source.extractall(Path(self.properties['path']).joinpath('xvg_B'))
+            tar.add(Path(self.properties['path']).joinpath('xvg_B'), arcname='.')
+        self.paths['input_a_xvg_zip_path'] = str(xvg_dir)
+        self.paths['input_b_xvg_zip_path'] = tar_path
+        pmxanalyse(properties=self.properties, **self.paths)
+        store = load_work_store(self.paths['output_work_store_path'])
+        assert list(store['work']) == zip_works
+
+
+class TestPmxanalyseCheckpoint:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_checkpoint')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_checkpoint(self):
+        checkpoint_path = Path(self.properties['path']).joinpath('bootstrap.json')
+        properties = {**self.properties, 'bootstrap_checkpoint_path': str(checkpoint_path)}
+        pmxanalyse(properties=properties, **self.paths)
+        uninterrupted = Path(self.paths['output_result_path']).read_text().split('\n', 3)[3]
+        checkpoint = json.loads(checkpoint_path.read_text())
+        assert sorted(checkpoint['index']) == list(range(120))
+        # Keep the first samples only, as if the run had been preempted, and resume it without a seed
+        kept = [position for position, index in enumerate(checkpoint['index']) if index < 50]
+        checkpoint['index'] = [checkpoint['index'][position] for position in kept]
+        checkpoint['samples'] = {name: [values[position] for position in kept] for name, values in checkpoint['samples'].items()}
+        checkpoint_path.write_text(json.dumps(checkpoint))
+        pmxanalyse(properties=properties, **self.paths)
+        assert Path(self.paths['output_result_path']).read_text().split('\n', 3)[3] == uninterrupted
+        assert len(json.loads(checkpoint_path.read_text())['index']) == 120
+
+
+class TestPmxanalyseConvergence:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_convergence')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_convergence(self):
+        pmxanalyse(properties=self.properties, **self.paths)
+        assert fx.not_empty(self.paths['output_result_path'])
+        result = Path(self.paths['output_result_path']).read_text()
+        assert 'Target error reached' in result
+        assert 'Number of forward (0->1) trajectories: 40' in result
+
+
+class TestPmxanalyseManyFiles:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_many_files')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_many_files(self):
+        # Member names adding up to more than ARG_MAX bytes (2 MB on Linux), which no command line can hold
+        n_copies = 180
+        for key in ('input_a_xvg_zip_path', 'input_b_xvg_zip_path'):
+            many_path = str(Path(self.properties['path']).joinpath(Path(self.paths[key]).name))
+            with zipfile.ZipFile(self.paths[key]) as source, zipfile.ZipFile(many_path, 'w') as many:
+                members = [(name, b'\n'.join(source.read(name).splitlines()[:13]) + b'\n') for name in source.namelist() if name.endswith('.xvg')]
+                for copy in range(n_copies):
+                    for name, content in members:
+                        many.writestr(f"{'long trajectory name ' * 10}{copy}/{name}", content)
+            self.paths[key] = many_path
+        assert n_copies * len(members) * len('long trajectory name ' * 10) > os.sysconf('SC_ARG_MAX')
+        pmxanalyse(properties=self.properties, **self.paths)
+        result = Path(self.paths['output_result_path']).read_text()
+        assert f'Number of forward (0->1) trajectories: {n_copies * len(members)}' in result
+        assert 'CGI: dG' in result
+
+    def test_pmxanalyse_rand_too_large(self):
+        with pytest.raises(ValueError, match=r'The rand property \(100000\) is larger than the number of dgdl.xvg files'):
+            pmxanalyse(properties={**self.properties, 'rand': 100000}, **self.paths)
+        with pytest.raises(ValueError, match=r'The rand property \(100000\) is larger than the number of dgdl.xvg files'):
+            pmxanalyse(properties={**self.properties, 'rand': 100000, 'stream_xvg': True}, **self.paths)
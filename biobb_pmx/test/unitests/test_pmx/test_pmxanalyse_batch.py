@@ -0,0 +1,46 @@
+# type: ignore
+import csv
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from biobb_common.tools import test_fixtures as fx
+from biobb_pmx.pmxbiobb.pmxanalyse_batch import pmxanalyse_batch
+from biobb_pmx.pmxbiobb.result_store import read_results
+
+
+class TestPmxanalyseBatch:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxanalyse_batch')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxanalyse_batch(self):
+        store_path = str(Path(self.properties['path']).joinpath('results.sqlite'))
+        pmxanalyse_batch(properties={**self.properties, 'result_store_path': store_path}, **self.paths)
+        assert fx.not_empty(self.paths['output_results_zip_path'])
+        assert fx.not_empty(self.paths['output_summary_path'])
+        with zipfile.ZipFile(self.paths['output_results_zip_path']) as results_zip:
+            assert sorted(results_zip.namelist()) == ['edge1_result.txt', 'edge2_result.txt']
+        with open(self.paths['output_summary_path']) as summary_file:
+            rows = list(csv.DictReader(summary_file))
+        assert [row['edge'] for row in rows] == ['edge1', 'edge2']
+        assert all(row['method'] == 'BAR' and not row['error'] for row in rows)
+        records = read_results(store_path)
+        assert [(record['edge'], record['estimator']) for record in records] == [(edge, estimator) for edge in ('edge1', 'edge2') for estimator in ('CGI', 'BAR', 'JARZ')]
+        assert [record['edge'] for record in read_results(store_path, 'best')] == ['edge1', 'edge2']
+
+    def test_pmxanalyse_batch_invalid_edges(self):
+        edges_path = Path(self.properties['path']).joinpath('invalid_edges.csv')
+        data_dir = Path(self.paths['input_edges_path']).parent
+        edges_path.write_text(
+            'edge,input_a_xvg_zip_path,input_b_xvg_zip_path,output_result_path\n'
+            f'edge1,{data_dir}/xvg_A.zip,{data_dir}/xvg_B.zip,../edge1.txt\n'
+            f'edge1,{data_dir}/xvg_A.zip,{data_dir}/xvg_B.zip,edge2.txt\n'
+            f'edge3,{data_dir}/xvg_A.zip,{data_dir}/xvg_B.zip,edge2.txt\n'
+        )
+        with pytest.raises(ValueError) as error:
+            pmxanalyse_batch(**{**self.paths, 'input_edges_path': str(edges_path)}, properties=self.properties)
+        assert all(issue in str(error.value) for issue in ('../edge1.txt is not a file name', 'edge1 is repeated', 'edge2.txt is used by another edge'))
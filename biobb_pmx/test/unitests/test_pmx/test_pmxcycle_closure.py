@@ -0,0 +1,33 @@
+# type: ignore
+import csv
+
+import pytest
+from biobb_common.tools import test_fixtures as fx
+from biobb_pmx.pmxbiobb.pmxcycle_closure import pmxcycle_closure
+from biobb_pmx.pmxbiobb.result_store import append_results
+
+
+class TestPmxcycleClosure:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxcycle_closure')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxcycle_closure(self):
+        # Triangle lig1 -> lig2 -> lig3 -> lig1 with a closure error of 0.3 kJ/mol, stored as complex and water legs
+        edges = [('e12', 'lig1', 'lig2', 2.0), ('e23', 'lig2', 'lig3', 1.0), ('e31', 'lig3', 'lig1', -2.7)]
+        records = []
+        for edge, node_a, node_b, ddg in edges:
+            for leg, dg in (('complex', ddg + 10.0), ('water', 10.0)):
+                records.append({'edge': edge, 'node_a': node_a, 'node_b': node_b, 'leg': leg, 'estimator': 'BAR', 'best': 1, 'dg': dg, 'err': 0.1})
+        append_results(self.paths['input_result_store_path'], records)
+        pmxcycle_closure(properties=self.properties, **self.paths)
+        with open(self.paths['output_nodes_path']) as nodes_file:
+            nodes = {row['node']: row for row in csv.DictReader(nodes_file)}
+        assert float(nodes['lig1']['dg']) == 0.0
+        assert float(nodes['lig2']['dg']) == pytest.approx(1.9)
+        assert float(nodes['lig3']['dg']) == pytest.approx(2.8)
+        with open(self.paths['output_edges_path']) as edges_file:
+            residuals = [float(row['residual']) for row in csv.DictReader(edges_file)]
+        assert residuals == pytest.approx([-0.1, -0.1, -0.1])
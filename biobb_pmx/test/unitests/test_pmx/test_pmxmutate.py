@@ -1,6 +1,10 @@
 # type: ignore
+import shutil
+from pathlib import Path
+
+import pytest
 from biobb_common.tools import test_fixtures as fx
-from biobb_pmx.pmxbiobb.pmxmutate import pmxmutate
+from biobb_pmx.pmxbiobb.pmxmutate import Pmxmutate, pmxmutate
 
 
 class TestPmxmutate:
@@ -14,3 +18,43 @@ class TestPmxmutate:
         pmxmutate(properties=self.properties, **self.paths)
         assert fx.not_empty(self.paths['output_structure_path'])
         assert fx.equal(self.paths['output_structure_path'], self.paths['ref_output_structure_path'])
+
+    def test_pmxmutate_chain(self):
+        properties = {**self.properties, 'mutation_list': 'A:10Ala'}
+        pmxmutate(properties=properties, **self.paths)
+        assert fx.equal(self.paths['output_structure_path'], self.paths['ref_output_structure_path'])
+
+    def test_pmxmutate_invalid(self):
+        properties = {**self.properties, 'mutation_list': '10Ile, 99999Ala, 11Xyz'}
+        with pytest.raises(ValueError) as error:
+            pmxmutate(properties=properties, **self.paths)
+        assert all(mutation in str(error.value) for mutation in ('10Ile', '99999Ala', '11Xyz'))
+
+    def test_pmxmutate_not_mutable(self):
+        # Residues 999 and 5001 of frame99.pdb are water molecules
+        paths = {**self.paths, 'input_structure_path': str(Path(self.paths['input_structure_path']).with_name('frame99.pdb'))}
+        with pytest.raises(ValueError) as error:
+            pmxmutate(properties={**self.properties, 'mutation_list': '999Ala, 5001Ala'}, **paths)
+        assert str(error.value).count('is SOL, not an amino acid or a nucleotide') == 2
+
+    def test_pmxmutate_repeated(self):
+        with pytest.raises(ValueError) as error:
+            pmxmutate(properties={**self.properties, 'mutation_list': '10Ala, 10Ala, 10Gly'}, **self.paths)
+        assert str(error.value).count('residue 10 is already mutated by 10Ala') == 2
+
+    def test_pmxmutate_cache(self, monkeypatch):
+        cache_dir = Path(self.paths['output_structure_path']).with_name('mutant_cache')
+        pmxmutate(properties={**self.properties, 'cache_dir': str(cache_dir)}, **self.paths)
+        Path(self.paths['output_structure_path']).unlink()
+        # Same normalized mutation list: the cached mutant is used and pmx is not run
+        with monkeypatch.context() as patch:
+            patch.setattr(Pmxmutate, 'run_biobb', lambda block: pytest.fail('pmx was run'))
+            pmxmutate(properties={**self.properties, 'mutation_list': '10ALA', 'cache_dir': str(cache_dir)}, **self.paths)
+        assert len(list(cache_dir.glob('*.pdb'))) == 1
+        assert fx.equal(self.paths['output_structure_path'], self.paths['ref_output_structure_path'])
+        # Another pmx binary builds its own mutant
+        binary_path = cache_dir.with_name('pmx_wrapper')
+        binary_path.write_text(f'#!/bin/sh\nexec {shutil.which("pmx")} "$@"\n')
+        binary_path.chmod(0o755)
+        pmxmutate(properties={**self.properties, 'cache_dir': str(cache_dir), 'binary_path': str(binary_path)}, **self.paths)
+        assert len(list(cache_dir.glob('*.pdb'))) == 2
@@ -0,0 +1,88 @@
+# type: ignore
+import csv
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from biobb_common.tools import test_fixtures as fx
+from biobb_pmx.pmxbiobb.mutagenesis import force_field_path
+from biobb_pmx.pmxbiobb.mutff_cache import load_library
+from biobb_pmx.pmxbiobb.pmxmutate import pmxmutate
+from biobb_pmx.pmxbiobb.pmxmutate_scan import pmxmutate_scan
+
+
+class TestPmxmutateScan:
+    def setup_class(self):
+        fx.test_setup(self, 'pmxmutate_scan')
+
+    def teardown_class(self):
+        fx.test_teardown(self)
+
+    def test_pmxmutate_scan(self):
+        cache_dir = Path(self.paths['output_mutants_zip_path']).with_name('mutff_cache')
+        pmxmutate_scan(properties={**self.properties, 'mutff_cache_dir': str(cache_dir)}, **self.paths)
+        assert fx.not_empty(self.paths['output_mutants_zip_path'])
+        with zipfile.ZipFile(self.paths['output_mutants_zip_path']) as zip_file:
+            manifest = list(csv.DictReader(io.StringIO(zip_file.read('manifest.csv').decode())))
+            # 11Lys targets the wild type of residue 11 and is skipped
+            assert [row['label'] for row in manifest] == ['A_I10A', 'A_K11A', 'A_I10G']
+            assert all(row['structure'] and not row['error'] for row in manifest)
+            mutant_path = str(Path(self.paths['output_mutants_zip_path']).with_name('A_I10A.pdb'))
+            Path(mutant_path).write_bytes(zip_file.read('A_I10A.pdb'))
+        # Same structure as a Pmxmutate run of the 10Ala mutation
+        assert fx.equal(mutant_path, self.paths['ref_output_structure_path'])
+        # The parsed mutation library is reused until the force field files change
+        library = load_library(force_field_path(self.properties['force_field']), str(cache_dir))
+        assert library['hit']
+        assert [entry.name for entry in cache_dir.iterdir()] == [library['key'] + '.pkl']
+
+    def test_pmxmutate_scan_without_private_pmx(self, monkeypatch):
+        # pmx versions without the private functions fall back to the plain pmx path, without the library cache
+        monkeypatch.setattr('biobb_pmx.pmxbiobb.pmxmutate_scan.library_supported', lambda: False)
+        monkeypatch.setattr('biobb_pmx.pmxbiobb.mutagenesis.pmx_private', lambda module_name, attribute: None)
+        cache_dir = Path(self.paths['output_mutants_zip_path']).with_name('unused_mutff_cache')
+        pmxmutate_scan(properties={**self.properties, 'scan_list': '10Ala', 'nworkers': 1, 'mutff_cache_dir': str(cache_dir)}, **self.paths)
+        with zipfile.ZipFile(self.paths['output_mutants_zip_path']) as zip_file:
+            manifest = list(csv.DictReader(io.StringIO(zip_file.read('manifest.csv').decode())))
+        assert [(row['label'], row['structure'], row['error']) for row in manifest] == [('A_I10A', 'A_I10A.pdb', '')]
+        assert not cache_dir.exists()
+
+    def test_pmxmutate_scan_mutations_file(self):
+        mutations_path = Path(self.paths['output_mutants_zip_path']).with_name('mutations.csv')
+        # Repeated mutations are built once, the label of the file replaces the generated one of the scan list
+        mutations_path.write_text('chain,resnum,target,label\nA,10,ALA,I10A_file\nA,10,ALA,I10A_file\n,11,Gly,\n')
+        properties = {**self.properties, 'scan_list': '10Ala', 'nworkers': 1}
+        pmxmutate_scan(input_mutations_path=str(mutations_path), properties=properties, **self.paths)
+        with zipfile.ZipFile(self.paths['output_mutants_zip_path']) as zip_file:
+            manifest = list(csv.DictReader(io.StringIO(zip_file.read('manifest.csv').decode())))
+        assert [(row['label'], row['structure']) for row in manifest] == [('I10A_file', 'I10A_file.pdb'), ('A_K11G', 'A_K11G.pdb')]
+        # Two labels for the same mutant
+        with mutations_path.open('a') as mutations_file:
+            mutations_file.write('A,10,ALA,repeated\n')
+        with pytest.raises(ValueError, match='mutant I10A_file is also labelled repeated'):
+            pmxmutate_scan(input_mutations_path=str(mutations_path), properties=properties, **self.paths)
+
+    def test_pmxmutate_scan_chains(self):
+        # Two copies of the protein: chain A numbered from 1 and chain B from 274
+        protein = [line for line in Path(self.paths['input_structure_path']).read_text().splitlines(keepends=True)
+                   if line.startswith('ATOM') and line[17:21].strip() not in ('SOL', 'NaJ', 'ClJ')]
+        structure_path = Path(self.paths['output_mutants_zip_path']).with_name('two_chains.pdb')
+        with structure_path.open('w') as structure_file:
+            for chain, offset in (('A', 0), ('B', 273)):
+                structure_file.writelines(f"{line[:21]}{chain}{int(line[22:26]) + offset:4d}{line[26:]}" for line in protein)
+                structure_file.write('TER\n')
+        paths = {**self.paths, 'input_structure_path': str(structure_path)}
+        # B:283 is the residue number of the file, the same residue as the position 146 (10 of chain B)
+        pmxmutate_scan(properties={**self.properties, 'scan_list': 'B:283Ala, 146Ala, A:10Ala', 'nworkers': 1}, **paths)
+        with zipfile.ZipFile(self.paths['output_mutants_zip_path']) as zip_file:
+            manifest = list(csv.DictReader(io.StringIO(zip_file.read('manifest.csv').decode())))
+            mutant = zip_file.read('B_I283A.pdb').decode().splitlines()
+        assert [(row['label'], row['chain'], row['resnum']) for row in manifest] == [('B_I283A', 'B', '283'), ('A_I10A', 'A', '10')]
+        # Same structure as a Pmxmutate run of the B:283Ala mutation, which keeps the residue numbers of the file
+        reference_path = str(structure_path.with_name('B_I283A_pmxmutate.pdb'))
+        pmxmutate(input_structure_path=str(structure_path), output_structure_path=reference_path,
+                  properties={'mutation_list': 'B:283Ala', 'force_field': self.properties['force_field']})
+        reference = Path(reference_path).read_text().splitlines()
+        assert len(mutant) == len(reference)
+        assert all(line[:22] + line[26:] == ref_line[:22] + ref_line[26:] for line, ref_line in zip(mutant, reference))
@@ -24,8 +24,11 @@ setuptools.setup(
     entry_points={
         "console_scripts": [
             "pmxanalyse = biobb_pmx.pmxbiobb.pmxanalyse:main",
+            "pmxanalyse_batch = biobb_pmx.pmxbiobb.pmxanalyse_batch:main",
+            "pmxcycle_closure = biobb_pmx.pmxbiobb.pmxcycle_closure:main",
             "pmxgentop = biobb_pmx.pmxbiobb.pmxgentop:main",
             "pmxmutate = biobb_pmx.pmxbiobb.pmxmutate:main",
+            "pmxmutate_scan = biobb_pmx.pmxbiobb.pmxmutate_scan:main",
             "pmxatom_mapping = biobb_pmx.pmxbiobb.pmxatom_mapping:main",
             "pmxcreate_top = biobb_pmx.pmxbiobb.pmxcreate_top:main",
             "pmxligand_hybrid = biobb_pmx.pmxbiobb.pmxligand_hybrid:main",